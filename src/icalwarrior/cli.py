@@ -2,29 +2,27 @@
 #
 # SPDX-License-Identifier: GPL-3.0-or-later
 
+from __future__ import annotations
+
 import os.path
 import os
-import subprocess
-from tempfile import NamedTemporaryFile, gettempdir
+import sys
+import shlex
 
-from typing import List, Optional
+from typing import Any, List, Optional, Dict, Tuple, TextIO, TYPE_CHECKING
 
-import json
 import click
-import colorama
-import tableformatter
-import datetime
-from termcolor import colored
 from icalwarrior.configuration import Configuration
-from icalwarrior.model.items import TodoModel
-from icalwarrior.model.lists import TodoDatabase
-from icalwarrior.input.date import expand_prefix, decode_date, DATE_SYNONYMS, DATE_FORMULA_UNITS
-from icalwarrior.input.cli import decode_property_list
-from icalwarrior.view.formatter import StringFormatter
-from icalwarrior.view.tagger import DueDateBasedTagger
-from icalwarrior.view.tabular import TabularToDoListView, TabularPrinter, TabularToDoView
-from icalwarrior.view.sorter import ToDoSorter
-from icalwarrior.filtering.constraints import ConstraintEvaluator
+from icalwarrior.model.counters import StatusCounters
+from icalwarrior.input.date import expand_prefix
+import icalwarrior.constants as constants
+
+# Modules needed by a single command only are imported by that command, so
+# that starting the command line interface, e.g., for "todo count", does
+# not require importing icalendar, humanize or the table renderers.
+if TYPE_CHECKING:
+    from icalwarrior.model.items import TodoModel
+    from icalwarrior.model.lists import TodoDatabase
 
 class InvalidArgumentException(Exception):
 
@@ -49,24 +47,54 @@ class CommandAliases(click.Group):
         return None
 
 def fail(ctx: click.Context, msg : str) -> None:
+    from termcolor import colored
     ctx.fail(colored(msg, 'red'))
 
 def success(msg : str) -> None:
+    from termcolor import colored
     click.echo(colored(msg, 'green'))
 
 def hint(msg : str) -> None:
+    from termcolor import colored
     click.echo(colored(msg, 'yellow'))
 
 def display_change_warning() -> None:
+
+    # IDs do not change during a shell session
+    ctx = click.get_current_context(silent=True)
+    if ctx is not None and isinstance(ctx.obj, dict) and 'database' in ctx.obj and ctx.obj['database'].stable_ids:
+        return
+
     hint("The ID assigned to one or more other tasks may have changed.")
     hint("Consider requesting another report before performing further actions.")
 
+def confirm(ctx: click.Context, msg : str) -> bool:
+    """Asks the user for confirmation, unless running a batch of commands."""
+
+    if ctx.obj.get('assume_yes', False):
+        return True
+
+    return click.confirm(msg)
+
+def get_database(ctx: click.Context) -> TodoDatabase:
+    """Returns the database kept for a shell session, or reads the todo lists anew."""
+
+    if 'database' in ctx.obj:
+        cal_db : TodoDatabase = ctx.obj['database']
+        return cal_db
+
+    from icalwarrior.model.lists import TodoDatabase
+    return TodoDatabase(ctx.obj['config'])
+
 @click.group(cls=CommandAliases)
 @click.option('-c', '--config', default=Configuration.get_default_config_path(), help='Path to the configuration file')
 @click.pass_context
 def run_cli(ctx: click.Context, config: str) -> None:
 
-    colorama.init()
+    # Only needed for colored output on Windows
+    if sys.platform == "win32":
+        import colorama
+        colorama.init()
 
     try:
         configuration = Configuration(config)
@@ -81,28 +109,75 @@ def run_cli(ctx: click.Context, config: str) -> None:
 @run_cli.command(short_help="Show summary statistics about the lists icalwarrior is aware of.")
 @click.pass_context
 def lists(ctx: click.Context) -> None:
+    from icalwarrior.view.tabular import TabularPrinter
+    from icalwarrior.view.renderer import WrapMode
     config = ctx.obj['config']
 
     try:
-        cal = TodoDatabase(config)
+        cal_db = get_database(ctx)
 
         cols = ["Name", "Path", "Total number of todos", "Number of completed todos"]
         rows : List[List[str]] = []
 
-        cal_db = TodoDatabase(config)
-        for name in cal.get_list_names():
+        counts = cal_db.get_aggregator().aggregate(['status'])
+        for name in cal_db.get_list_names():
             path = os.path.join(config.get_lists_dir(), name)
-            todos = cal_db.get_todos(ConstraintEvaluator.from_string_list(config, ["list:" + name]))
-            completed_todos = cal_db.get_todos(
-                ConstraintEvaluator.from_string_list(
-                    config, ["list:" + name, "and", "status:completed"]))
-            rows.append([name, path, str(len(todos)), str(len(completed_todos))])
+            total = sum(count for key, count in counts.items() if key[0] == name)
+            completed = counts.get((name, 'completed'), 0)
+            rows.append([name, path, str(total), str(completed)])
+
+        printer = TabularPrinter(rows, cols, 0, WrapMode.WRAP, None, config.get_table_renderer())
+        printer.print()
+    except Exception as err:
+        fail(ctx, str(err))
+
+@run_cli.command(short_help="Show the number of todos per list, grouped by status, priority, category or due date.")
+@click.pass_context
+@click.option('--group-by', 'group_by', multiple=True, type=click.Choice(constants.AGGREGATION_GROUPS), default=['status'], help='Property to group the todos by, can be given multiple times')
+def stats(ctx: click.Context, group_by: List[str]) -> None:
+    from icalwarrior.view.tabular import TabularPrinter
+    from icalwarrior.view.renderer import WrapMode
+    config = ctx.obj['config']
+
+    try:
+        cal_db = get_database(ctx)
+
+        counts = cal_db.get_aggregator().aggregate(list(group_by))
 
-        printer = TabularPrinter(rows, cols, 0, tableformatter.WrapMode.WRAP, None)
+        cols = ["List"] + [group.capitalize() for group in group_by] + ["Count"]
+        rows = [list(key) + [str(count)] for key, count in sorted(counts.items())]
+
+        printer = TabularPrinter(rows, cols, 0, WrapMode.WRAP, None, config.get_table_renderer())
         printer.print()
     except Exception as err:
         fail(ctx, str(err))
 
+@run_cli.command(short_help="Print the number of total, open, overdue or today's todos, e.g., for a status bar.")
+@click.pass_context
+@click.option('--list', 'list_name', default=None, help='Only count the todos of the given list')
+@click.argument('counter', nargs=1, required=False, type=click.Choice(StatusCounters.COUNTERS))
+def count(ctx: click.Context, list_name: Optional[str], counter: Optional[str]) -> None:
+    config = ctx.obj['config']
+
+    try:
+        counters = StatusCounters(config)
+
+        # The counters are only recomputed from the todo lists
+        # if these have been changed by another application.
+        if not counters.is_valid():
+            cal_db = get_database(ctx)
+            if list_name is not None:
+                cal_db.get_list(list_name)
+            cal_db.rebuild_counters()
+
+        counts = counters.get_counts(list_name)
+        if counter is not None:
+            click.echo(str(counts[counter]))
+        else:
+            click.echo(", ".join(str(counts[name]) + " " + name for name in StatusCounters.COUNTERS))
+    except Exception as err:
+        fail(ctx, str(err))
+
 @run_cli.command(short_help="Create a new empty todo list")
 @click.pass_context
 @click.argument('list_name', nargs=1, required=True)
@@ -110,7 +185,7 @@ def newlist(ctx: click.Context, list_name : str) -> None:
     config = ctx.obj['config']
 
     try:
-        cal_db = TodoDatabase(config)
+        cal_db = get_database(ctx)
         cal_db.add_list(list_name)
 
         success("Successfully created list " + list_name + ".")
@@ -124,47 +199,81 @@ def droplist(ctx: click.Context, list_name : str) -> None:
     config = ctx.obj['config']
 
     try:
-        cal_db = TodoDatabase(config)
+        cal_db = get_database(ctx)
         cal_db.delete_list(list_name)
         success("Successfully removed list " + list_name +".")
         display_change_warning()
     except Exception as err:
         fail(ctx, str(err))
 
+def create_todo(ctx: click.Context, cal_db: TodoDatabase, list_name: str, summary: str, properties: List[str]) -> Tuple[str, TodoModel]:
+    from icalwarrior.model.items import TodoModel
+    from icalwarrior.input.cli import decode_property_list
+    config = ctx.obj['config']
+
+    full_list_name = expand_prefix(list_name, cal_db.get_list_names())
+    if full_list_name == "":
+        fail(ctx, "Unknown list name or prefix \"" + list_name + ". Known lists are " + ", ".join(cal_db.get_list_names()) + ".")
+
+    if len(summary) == 0:
+        fail(ctx, "Summary text must be non-empty.")
+
+    todo = TodoModel(config, cal_db.create_todo())
+    property_dict = decode_property_list(config, ['summary:' + summary, 'status:needs-action'] + [p for p in properties])
+    todo.set_properties(property_dict)
+
+    return (full_list_name, todo)
+
 @run_cli.command(short_help="Add a new todo item to a list.")
 @click.pass_context
-@click.argument('list_name', nargs=1, required=True)
-@click.argument('summary', nargs=1, required=True)
+@click.option('--from', 'from_file', type=click.File('r'), default=None,
+              help='Read one todo per line, given as LIST SUMMARY [PROPERTIES...], from a file ("-" for stdin)')
+@click.argument('list_name', nargs=1, required=False)
+@click.argument('summary', nargs=1, required=False)
 @click.argument('properties', nargs=-1)
-def add(ctx: click.Context, list_name: str, summary: str, properties: List[str]) -> None:
+def add(ctx: click.Context, from_file: Optional[TextIO], list_name: Optional[str], summary: Optional[str], properties: List[str]) -> None:
     config = ctx.obj['config']
 
     try:
-        cal_db = TodoDatabase(config)
+        cal_db = get_database(ctx)
 
         if len(cal_db.get_list_names()) == 0:
             fail(ctx, "No lists found. Please check your configuration.")
 
-        full_list_name = expand_prefix(list_name, cal_db.get_list_names())
-        if full_list_name == "":
-            fail(ctx, "Unknown list name or prefix \"" + list_name + ". Known lists are " + ", ".join(cal_db.get_list_names()) + ".")
+        new_todos : List[Tuple[str, TodoModel]] = []
 
-        if len(summary) == 0:
-            fail(ctx, "Summary text must be non-empty.")
+        if from_file is not None:
+            if list_name is not None:
+                fail(ctx, "Todos cannot be given as arguments when using --from.")
 
-        todo = TodoModel(config, cal_db.create_todo())
-        property_dict = decode_property_list(config, ['summary:' + summary, 'status:needs-action'] + [p for p in properties])
-        todo.set_properties(property_dict)
-        cal_db.get_list(full_list_name).add(todo.get_ical_todo())
+            for line_number, line in enumerate(from_file, start=1):
+                args = shlex.split(line, comments=True)
+                if len(args) == 0:
+                    continue
+                if len(args) < 2:
+                    fail(ctx, "Line " + str(line_number) + ": expected a list name and a summary text.")
+                new_todos.append(create_todo(ctx, cal_db, args[0], args[1], args[2:]))
 
-        assert todo is not None
-        # Re-read lists to trigger id generation of todo
-        uid = todo.get_string('uid')
-        cal_db = TodoDatabase(config)
-        todo = cal_db.get_todos(ConstraintEvaluator.from_string_list(config, ["uid:" + uid]))[0]
+        else:
+            if list_name is None or summary is None:
+                fail(ctx, "A list name and a summary text are required.")
+            assert list_name is not None and summary is not None
+            new_todos.append(create_todo(ctx, cal_db, list_name, summary, properties))
 
-        success("Successfully created new todo \"" + todo.get_string('summary') + "\" with ID " + str(todo.get_context("id")) + ".")
-        display_change_warning()
+        # Write all todos of a list at once, so that
+        # IDs only need to be assigned once per list.
+        todos_by_list : Dict[str, List[TodoModel]] = {}
+        for full_list_name, todo in new_todos:
+            todos_by_list.setdefault(full_list_name, []).append(todo)
+
+        for full_list_name, todos in todos_by_list.items():
+            cal_db.add_todos(full_list_name, todos)
+
+        for _, todo in new_todos:
+            success("Successfully created new todo \"" + todo.get_string('summary') + "\" with ID " + str(todo.get_context("id")) + ".")
+
+        if len(new_todos) > 0:
+            display_change_warning()
     except Exception as err:
         fail(ctx, str(err))
 
@@ -173,11 +282,13 @@ def add(ctx: click.Context, list_name: str, summary: str, properties: List[str])
 @click.argument('identifier', nargs=1, type=int)
 @click.argument('properties',nargs=-1)
 def modify(ctx: click.Context, identifier: int, properties: List[str]) ->  None:
+    from icalwarrior.input.cli import decode_property_list
+    from icalwarrior.filtering.constraints import ConstraintEvaluator
     config = ctx.obj['config']
 
     try:
 
-        cal_db = TodoDatabase(config)
+        cal_db = get_database(ctx)
         if len(cal_db.get_list_names()) == 0:
             fail(ctx,"No lists found. Please check your configuration.")
 
@@ -199,49 +310,234 @@ def modify(ctx: click.Context, identifier: int, properties: List[str]) ->  None:
     except Exception as err:
         fail(ctx, str(err))
 
+def get_report_constraints(config: Configuration, report_name: str, constraints: List[str]) -> List[str]:
+    """Returns the given constraints combined with the ones of a report."""
+
+    report_spec = config.get_report(report_name)
+
+    if len(report_spec.constraints) > 0:
+        if len(constraints) > 0:
+            constraints = [c for c in constraints] + ['and'] + report_spec.constraints
+        else:
+            constraints = report_spec.constraints
+
+    return constraints
+
+def select_report_todos_parallel(config: Configuration,
+                                 report_name: str,
+                                 constraints: List[str],
+                                 row_limit: Optional[int],
+                                 offset: int,
+                                 after: Optional[str],
+                                 jobs: int) -> Tuple[List[TodoModel], int, int, str]:
+    """Like select_report_todos, but reads and filters the todo lists in jobs worker processes."""
+    from icalwarrior.view.sorter import ToDoSorter
+    from icalwarrior.model.parallel import ParallelQuery
+
+    report_spec = config.get_report(report_name)
+    constraints = get_report_constraints(config, report_name, constraints)
+    sort_keys = report_spec.sort or ToDoSorter.DEFAULT_SORT_KEYS
+    ParallelQuery.check_supported(config, constraints, sort_keys)
+
+    query = ParallelQuery(config, jobs)
+    todos = query.select_todos(constraints, sort_keys, report_spec.sort_missing, row_limit, offset, after)
+    return (todos, query.total, query.remaining, query.cursor)
+
+def select_report_todos(config: Configuration,
+                        cal_db: TodoDatabase,
+                        report_name: str,
+                        constraints: List[str],
+                        row_limit: Optional[int],
+                        offset: int,
+                        after: Optional[str]) -> Tuple[List[TodoModel], int, int, str]:
+    """Returns the todos of a report to be shown, the number of todos
+    satisfying the constraints, the number of todos following the offset
+    or cursor and the cursor of the last todo shown."""
+    from icalwarrior.view.sorter import ToDoSorter
+    from icalwarrior.filtering.constraints import ConstraintEvaluator
+
+    report_spec = config.get_report(report_name)
+    constraints = get_report_constraints(config, report_name, constraints)
+
+    constraint_evaluator = None
+    if len(constraints) > 0:
+        constraint_evaluator = ConstraintEvaluator.from_string_list(config, constraints)
+    matching_todos = cal_db.get_todos(constraint_evaluator)
+
+    sort_keys = report_spec.sort or ToDoSorter.DEFAULT_SORT_KEYS
+
+    # Only the todos that are actually shown need to be sorted
+    sorter = ToDoSorter(matching_todos, sort_keys, row_limit, report_spec.sort_missing, offset, after)
+    todos = sorter.get_sorted()
+    if row_limit is not None:
+        todos = todos[0:row_limit]
+
+    cursor = ""
+    if len(todos) > 0:
+        cursor = sorter.get_cursor(todos[-1])
+
+    return (todos, len(matching_todos), sorter.remaining, cursor)
+
+def show_report(config: Configuration, report_name: str, todos: List[TodoModel]) -> None:
+    import datetime
+    from icalwarrior.view.formatter import StringFormatter
+    from icalwarrior.view.tagger import DueDateBasedTagger
+    from icalwarrior.view.tabular import TabularToDoListView
+
+    report_spec = config.get_report(report_name)
+
+    formatter = StringFormatter(config)
+    past_threshold_days = DueDateBasedTagger.DEFAULT_PAST_THRESHOLD_DAYS
+    if report_spec.past_threshold_days is not None:
+        past_threshold_days = report_spec.past_threshold_days
+    future_threshold_days = DueDateBasedTagger.DEFAULT_FUTURE_THRESHOLD_DAYS
+    if report_spec.future_threshold_days is not None:
+        future_threshold_days = report_spec.future_threshold_days
+    tagger = DueDateBasedTagger(
+        datetime.timedelta(days=past_threshold_days),
+        datetime.timedelta(days=future_threshold_days))
+    view = TabularToDoListView(config, report_name, todos, formatter, tagger)
+    view.show()
+
+def watch_report(ctx: click.Context, report_name: str, constraints: List[str], row_limit: Optional[int], offset: int, interval: float) -> None:
+    """Shows a report until interrupted, updating it whenever a todo list
+    changes and every minute, as it may contain dates relative to now."""
+    import time
+    import datetime
+    import contextlib
+    from icalwarrior.daemon import ListsWatcher
+    from icalwarrior.view.screen import OutputBuffer, ScreenUpdater
+    config = ctx.obj['config']
+
+    cal_db = get_database(ctx)
+    watcher = ListsWatcher(config.get_lists_dir())
+    screen = ScreenUpdater(sys.stdout)
+    minute = ""
+
+    try:
+        changed = True
+        while True:
+            if changed:
+                changed = cal_db.refresh()
+
+            now = datetime.datetime.now()
+            if changed or now.strftime("%Y-%m-%dT%H:%M") != minute:
+                minute = now.strftime("%Y-%m-%dT%H:%M")
+                frame = OutputBuffer(sys.stdout.isatty())
+                with contextlib.redirect_stdout(frame):
+                    todos, total, _, _ = select_report_todos(config, cal_db, report_name, constraints, row_limit, offset, None)
+                    show_report(config, report_name, todos)
+                    hint("Showing " + str(len(todos)) + " out of " + str(total) + " todos, updated at " + now.strftime("%H:%M") + ".")
+                screen.update(frame.getvalue())
+
+            # Without inotify, the lists are checked for changes every interval
+            timeout = 60 - now.second - now.microsecond / 1000000
+            if watcher.inotify is None:
+                timeout = min(timeout, interval)
+            changed = watcher.wait(timeout)
+
+    except KeyboardInterrupt:
+        click.echo()
+    finally:
+        watcher.close()
+
 @run_cli.command(short_help="Print a given report defined in the configuration file.")
 @click.pass_context
+@click.option('--offset', type=click.IntRange(min=0), default=0, help='Number of todos to skip')
+@click.option('--limit', type=click.IntRange(min=1), default=None, help='Maximum number of todos to show (default: max_list_length of the report)')
+@click.option('--after', default=None, help='Continue after the cursor printed for a previous page')
+@click.option('--page', is_flag=True, default=False, help='Show all todos, or up to --limit, in the pager given by $PAGER')
+@click.option('--watch', is_flag=True, default=False, help='Keep showing the report and update it whenever the todo lists change')
+@click.option('--interval', type=click.FloatRange(min=0.1), default=2.0, help='Seconds between checks for changes with --watch if inotify is unavailable')
+@click.option('--jobs', type=click.IntRange(min=1), default=1, help='Number of processes reading and filtering the todo lists in parallel')
 @click.argument('name',nargs=1,default="default")
 @click.argument('constraints',nargs=-1)
-def report(ctx: click.Context, name: str, constraints: List[str]) -> None:
+def report(ctx: click.Context, offset: int, limit: Optional[int], after: Optional[str], page: bool, watch: bool, interval: float, jobs: int, name: str, constraints: List[str]) -> None:
+    import io
+    import contextlib
+    from icalwarrior.model.lists import read_todo_file
+    from icalwarrior.model.views import MaterializedReports
+    from icalwarrior.view.sorter import ToDoSorter
     config = ctx.obj['config']
 
     try:
 
-        cal_db = TodoDatabase(config)
-        if len(cal_db.get_list_names()) == 0:
-            fail(ctx,"No lists found. Please check your configuration.")
-
         # Check if the report exists
         # and if it exists, extract columns
         # and constraints
-        reports = config.get_config(['reports'])
-
-        report_expanded = expand_prefix(name, reports.keys())
+        report_expanded = expand_prefix(name, config.get_report_names())
 
         if report_expanded == "":
-            ctx.fail("Unknown or ambiguous report name \"" + name + "\". Known reports are " + ", ".join(reports.keys()) + ".")
+            ctx.fail("Unknown or ambiguous report name \"" + name + "\". Known reports are " + ", ".join(config.get_report_names()) + ".")
+
+        report_spec = config.get_report(report_expanded)
+
+        row_limit = limit
+        if row_limit is None and not page:
+            row_limit = report_spec.max_list_length
+
+        if watch:
+            if page or after is not None:
+                fail(ctx, "The options --page and --after cannot be used with --watch.")
+            watch_report(ctx, report_expanded, list(constraints), row_limit, offset, interval)
+            return
+
+        # Materialized reports are shown without reading all todo lists,
+        # unless further constraints are given or the requested todos
+        # are not among the stored first todos of the report.
+        materialized = MaterializedReports(config)
+        head = None
+        outdated = False
+        if len(constraints) == 0 and after is None and 'database' not in ctx.obj:
+            head = materialized.get_head(report_expanded)
+            outdated = head is None
+            if head is not None and len(head['head']) < head['size'] and (row_limit is None or offset + row_limit > len(head['head'])):
+                head = None
+
+        if head is not None:
+            members = head['head'][offset:]
+            if row_limit is not None:
+                members = members[0:row_limit]
+
+            todos = []
+            for member in members:
+                todo = read_todo_file(config, member[MaterializedReports.LIST], member[MaterializedReports.UID] + ".ics")[0]
+                todo.set_context('id', materialized.get_id(head, member))
+                todos.append(todo)
+
+            total = head['size']
+            remaining = max(total - offset, 0)
+            cursor = ""
+            if len(members) > 0:
+                cursor = ToDoSorter.make_cursor(members[-1][0], members[-1][MaterializedReports.UID])
+
+        elif jobs > 1 and 'database' not in ctx.obj:
+            todos, total, remaining, cursor = select_report_todos_parallel(config, report_expanded, list(constraints), row_limit, offset, after, jobs)
 
-        if 'constraint' in reports[report_expanded]:
-            if len(constraints) > 0:
-                constraints = [c for c in constraints] + ['and'] + reports[report_expanded]['constraint'].split(" ")
-            else:
-                constraints = reports[report_expanded]['constraint'].split(" ")
-
-        constraint_evaluator = ConstraintEvaluator.from_string_list(config, constraints)
-        todos = cal_db.get_todos(constraint_evaluator)
-        todos = ToDoSorter(todos, "due").get_sorted()
-
-        row_limit = len(todos)
+        else:
+            cal_db = get_database(ctx)
+            if len(cal_db.get_list_names()) == 0:
+                fail(ctx,"No lists found. Please check your configuration.")
+
+            # Stored reports are only rewritten if they are outdated, not
+            # if the requested todos are merely beyond the stored ones.
+            if outdated and materialized.get_definition(report_expanded) is not None:
+                cal_db.rebuild_report(report_expanded)
+
+            todos, total, remaining, cursor = select_report_todos(config, cal_db, report_expanded, list(constraints), row_limit, offset, after)
+
+        if page:
+            output = io.StringIO()
+            with contextlib.redirect_stdout(output):
+                show_report(config, report_expanded, todos)
+            click.echo_via_pager(output.getvalue())
+        else:
+            show_report(config, report_expanded, todos)
 
-        if 'max_list_length' in reports[report_expanded]:
-            row_limit = min(reports[report_expanded]['max_list_length'], row_limit)
+        hint("Showing " + str(len(todos)) + " out of " + str(total) + " todos.")
 
-        formatter = StringFormatter(config)
-        tagger = DueDateBasedTagger(todos, datetime.timedelta(days=7), datetime.timedelta(days=1))
-        view = TabularToDoListView(config, report_expanded, todos, formatter, tagger)
-        view.show()
-        hint("Showing " + str(row_limit) + " out of " + str(len(todos)) + " todos.")
+        if remaining > len(todos) and len(todos) > 0:
+            hint("To show the next todos, add --after " + cursor + " to the report command.")
 
     except Exception as err:
         fail(ctx,str(err))
@@ -250,11 +546,13 @@ def report(ctx: click.Context, name: str, constraints: List[str]) -> None:
 @click.pass_context
 @click.argument('ids',nargs=-1,required=True)
 def done(ctx: click.Context, ids: List[str]) -> None:
+    import datetime
+    from icalwarrior.filtering.constraints import ConstraintEvaluator
     config = ctx.obj['config']
 
     try:
 
-        cal_db = TodoDatabase(config)
+        cal_db = get_database(ctx)
         if len(cal_db.get_list_names()) == 0:
             fail(ctx,"No lists found. Please check your configuration.")
 
@@ -285,11 +583,12 @@ def done(ctx: click.Context, ids: List[str]) -> None:
 @click.pass_context
 @click.argument('ids',nargs=-1,required=True)
 def delete(ctx: click.Context, ids: List[str]) -> None:
+    from icalwarrior.filtering.constraints import ConstraintEvaluator
     config = ctx.obj['config']
 
     try:
 
-        cal_db = TodoDatabase(config)
+        cal_db = get_database(ctx)
         if len(cal_db.get_list_names()) == 0:
             fail(ctx,"No lists found. Please check your configuration.")
 
@@ -306,7 +605,7 @@ def delete(ctx: click.Context, ids: List[str]) -> None:
             fail(ctx,"At least one identifier is unknown.")
 
         for todo in todos:
-            if click.confirm('Delete todo ' + str(todo.get_context('id')) + ' "' + todo.get_string('summary') + '"?'):
+            if confirm(ctx, 'Delete todo ' + str(todo.get_context('id')) + ' "' + todo.get_string('summary') + '"?'):
                 cal_db.get_list(str(todo.get_context('list'))).delete(todo.get_ical_todo())
                 success("Successfully deleted todo " + str(todo.get_context('id')))
 
@@ -320,11 +619,12 @@ def delete(ctx: click.Context, ids: List[str]) -> None:
 @click.argument('identifier',type=int,required=True)
 @click.argument('destination',required=True)
 def move(ctx: click.Context, identifier: int, destination: str) -> None:
+    from icalwarrior.filtering.constraints import ConstraintEvaluator
     config = ctx.obj['config']
 
     try:
 
-        cal_db = TodoDatabase(ctx.obj['config'])
+        cal_db = get_database(ctx)
 
         if destination not in cal_db.get_list_names():
             fail(ctx,"Unknown list \"" + destination +"\".")
@@ -349,11 +649,14 @@ def move(ctx: click.Context, identifier: int, destination: str) -> None:
 @click.pass_context
 @click.argument('identifier',nargs=1,required=True, type=int)
 def show(ctx: click.Context, identifier: int) -> None:
+    from icalwarrior.view.formatter import StringFormatter
+    from icalwarrior.view.tabular import TabularToDoView
+    from icalwarrior.filtering.constraints import ConstraintEvaluator
     config = ctx.obj['config']
 
     try:
 
-        cal_db = TodoDatabase(config)
+        cal_db = get_database(ctx)
         if len(cal_db.get_list_names()) == 0:
             fail(ctx,"No lists found. Please check your configuration.")
 
@@ -373,11 +676,14 @@ def show(ctx: click.Context, identifier: int) -> None:
 @click.pass_context
 @click.argument('identifier',nargs=1,required=True, type=int)
 def description(ctx: click.Context, identifier: int) -> None:
+    import subprocess
+    from tempfile import NamedTemporaryFile, gettempdir
+    from icalwarrior.filtering.constraints import ConstraintEvaluator
     config = ctx.obj['config']
 
     try:
 
-        cal_db = TodoDatabase(config)
+        cal_db = get_database(ctx)
         if len(cal_db.get_list_names()) == 0:
             fail(ctx,"No lists found. Please check your configuration.")
 
@@ -427,6 +733,7 @@ def description(ctx: click.Context, identifier: int) -> None:
 @click.pass_context
 @click.argument('expr',nargs=1,required=True)
 def calculate(ctx: click.Context, expr: str) -> None:
+    from icalwarrior.input.date import decode_date
     config = ctx.obj['config']
     try:
         result = decode_date(expr, config)
@@ -439,12 +746,13 @@ def calculate(ctx: click.Context, expr: str) -> None:
 @click.pass_context
 @click.argument('list_name',required=True)
 def cleanup(ctx: click.Context, list_name: str) -> None:
+    from icalwarrior.filtering.constraints import ConstraintEvaluator
     config = ctx.obj['config']
 
     try:
 
         any_change_performed = False
-        cal_db = TodoDatabase(config)
+        cal_db = get_database(ctx)
         if list_name not in cal_db.get_list_names():
             fail(ctx,"List + " + list_name + " not found. Please check your configuration.")
 
@@ -452,7 +760,7 @@ def cleanup(ctx: click.Context, list_name: str) -> None:
         if len(todos) == 0:
             hint("No completed todos found in list " + list_name + ".")
         else:
-            if click.confirm('Delete ' + str(len(todos)) + ' completed todos from list ' + list_name + '?'):
+            if confirm(ctx, 'Delete ' + str(len(todos)) + ' completed todos from list ' + list_name + '?'):
                 for todo in todos:
                     cal_db.get_list(str(todo.get_context('list'))).delete(todo.get_ical_todo())
                     success("Successfully deleted todo " + str(todo.get_context('id')))
@@ -466,32 +774,289 @@ def cleanup(ctx: click.Context, list_name: str) -> None:
     except Exception as err:
         fail(ctx, str(err))
 
-@run_cli.command(short_help="Print a JSON representation of all todos satisfying a given filter expression.")
+def invoke_session_command(ctx: click.Context, session: Dict[str, Any], args: List[str]) -> bool:
+    """Runs a command with the database of a session and returns whether it
+    succeeded. Errors are raised as click exceptions."""
+
+    config_path = ctx.find_root().params['config']
+    exit_code = run_cli.main(args=['-c', config_path] + args, prog_name="todo", obj=session, standalone_mode=False)
+
+    return exit_code is None or exit_code == 0
+
+def run_session_command(ctx: click.Context, session: Dict[str, Any], args: List[str]) -> bool:
+    """Runs a command with the database of a session, which is refreshed
+    beforehand to include changes made by other applications. Returns
+    whether the command succeeded."""
+
+    session['database'].refresh()
+
+    try:
+        return invoke_session_command(ctx, session, args)
+    except click.ClickException as err:
+        err.show()
+        return False
+    except click.exceptions.Abort:
+        click.echo("Aborted!", err=True)
+        return False
+
+@run_cli.command(short_help="Run commands in an interactive session that reads the todo lists only once.")
+@click.pass_context
+def shell(ctx: click.Context) -> None:
+    from icalwarrior.model.lists import TodoDatabase
+
+    try:
+        session = {'database' : TodoDatabase(ctx.obj['config'], stable_ids=True)}
+    except Exception as err:
+        fail(ctx, str(err))
+
+    # Enables editing and history of the input, if available
+    try:
+        import readline # pylint: disable=unused-import
+    except ImportError:
+        pass
+
+    hint("IDs do not change during the session. Enter \"exit\" or press Ctrl-D to quit.")
+
+    while True:
+        try:
+            line = input("todo> ")
+        except EOFError:
+            click.echo()
+            break
+        except KeyboardInterrupt:
+            click.echo()
+            continue
+
+        try:
+            args = shlex.split(line)
+        except ValueError as err:
+            hint(str(err))
+            continue
+
+        if len(args) == 0:
+            continue
+
+        if args[0] in ("exit", "quit"):
+            break
+
+        command = expand_prefix(args[0], run_cli.list_commands(ctx))
+        if command == "shell":
+            hint("Already running a shell session.")
+            continue
+        if command == "daemon":
+            hint("The daemon cannot be started from a shell session.")
+            continue
+
+        run_session_command(ctx, session, args)
+
+def parse_batch(text : str) -> List[List[str]]:
+    """Splits the input of a batch into the arguments of each command. The
+    input is either a JSON array, whose elements are command lines or lists
+    of arguments, or one command line per line, where empty lines and lines
+    starting with '#' are skipped."""
+
+    import json
+
+    commands : List[List[str]] = []
+    if text.lstrip().startswith("["):
+        for entry in json.loads(text):
+            if isinstance(entry, str):
+                commands.append(shlex.split(entry))
+            elif isinstance(entry, list) and all(isinstance(arg, str) for arg in entry):
+                commands.append(entry)
+            else:
+                raise ValueError("Commands need to be given as strings or lists of strings.")
+    else:
+        for line in text.splitlines():
+            if line.strip() == "" or line.lstrip().startswith("#"):
+                continue
+            commands.append(shlex.split(line))
+
+    return commands
+
+@run_cli.command(short_help="Run a batch of commands read from a file or stdin, writing all changes at the end.")
+@click.pass_context
+@click.option('--stop-on-error', 'stop_on_error', is_flag=True, help='Skip the remaining commands after the first failing one')
+@click.argument('source', type=click.File('r'), default='-')
+def batch(ctx: click.Context, stop_on_error: bool, source: TextIO) -> None:
+    import io
+    import json
+    import contextlib
+    from icalwarrior.model.lists import TodoDatabase
+
+    try:
+        commands = parse_batch(source.read())
+        cal_db = TodoDatabase(ctx.obj['config'], stable_ids=True)
+    except Exception as err:
+        fail(ctx, str(err))
+
+    # All commands refer to the IDs assigned when reading the lists and no
+    # confirmation is asked for. Changes are kept in memory until all
+    # commands have been run, so that each todo is written only once.
+    session = {'database' : cal_db, 'assume_yes' : True}
+    cal_db.begin()
+
+    any_failed = False
+    for index, args in enumerate(commands):
+
+        output = io.StringIO()
+        error = None
+        try:
+            if len(args) == 0:
+                raise click.UsageError("Empty command.")
+
+            if expand_prefix(args[0], run_cli.list_commands(ctx)) in ("shell", "batch", "daemon"):
+                raise click.UsageError("Command \"" + args[0] + "\" cannot be run within a batch.")
+
+            with contextlib.redirect_stdout(output), contextlib.redirect_stderr(output):
+                if not invoke_session_command(ctx, session, args):
+                    error = "Command exited with an error."
+        except click.ClickException as err:
+            error = err.format_message()
+        except click.exceptions.Abort:
+            error = "Aborted!"
+
+        click.echo(json.dumps({
+            'index' : index,
+            'command' : args,
+            'status' : 'ok' if error is None else 'error',
+            'output' : output.getvalue(),
+            'error' : error
+        }))
+
+        if error is not None:
+            any_failed = True
+            if stop_on_error:
+                break
+
+    try:
+        cal_db.commit()
+    except Exception as err:
+        fail(ctx, str(err))
+
+    if any_failed and stop_on_error:
+        ctx.exit(1)
+
+@run_cli.command(short_help="Keep the todo lists in memory and run the commands of other todo calls.")
+@click.pass_context
+@click.option('--stop', is_flag=True, help='Stop the running daemon')
+@click.option('--status', is_flag=True, help='Show whether a daemon is running')
+def daemon(ctx: click.Context, stop: bool, status: bool) -> None:
+    from icalwarrior.daemon import TodoDaemon, get_socket_path, send_request
+    config = ctx.obj['config']
+    socket_path = get_socket_path(config)
+
+    if stop or status:
+        response = send_request(socket_path, {'control' : 'stop' if stop else 'status'})
+        if response is None:
+            fail(ctx, "No daemon is running.")
+        else:
+            click.echo(response['stdout'], nl=False)
+        return
+
+    try:
+        todo_daemon = TodoDaemon(ctx.find_root().params['config'])
+        hint("Listening on " + socket_path + ". Press Ctrl-C to stop.")
+        todo_daemon.serve(socket_path)
+    except Exception as err:
+        fail(ctx, str(err))
+
+@run_cli.command(short_help="Answer read-only queries about the todos over HTTP with JSON responses.")
+@click.pass_context
+@click.option('--bind', default='127.0.0.1:8080', help='Address and port to listen on (default: 127.0.0.1:8080)')
+def serve(ctx: click.Context, bind: str) -> None:
+    from icalwarrior.server import QueryServer, parse_address
+    config = ctx.obj['config']
+
+    try:
+        server = QueryServer(config, parse_address(bind))
+    except Exception as err:
+        fail(ctx, str(err))
+
+    host, port = server.server_address[:2]
+    hint("Listening on http://" + str(host) + ":" + str(port) + "/. Press Ctrl-C to stop.")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+@run_cli.command(short_help="Print a JSON or CSV representation of all todos satisfying a given filter expression.")
 @click.pass_context
+@click.option('--format', 'export_format', type=click.Choice(constants.EXPORT_FORMATS), default=None, help='Output format (default: json, or ndjson for --since)')
+@click.option('--fields', default=None, help='Comma-separated list of properties to export')
+@click.option('--since', default=None, help='Only export changes since a date or a generation number as NDJSON change feed')
+@click.option('--jobs', type=click.IntRange(min=1), default=1, help='Number of processes reading and filtering the todo lists in parallel')
 @click.argument('constraints',nargs=-1)
-def export(ctx: click.Context, constraints: List[str]) -> None:
+def export(ctx: click.Context, export_format: Optional[str], fields: Optional[str], since: Optional[str], jobs: int, constraints: List[str]) -> None:
+    import datetime
+    from icalwarrior.model.items import TodoModel
+    from icalwarrior.model.journal import ChangeJournal
+    from icalwarrior.view.formatter import StringFormatter
+    from icalwarrior.view.exporter import NDJSONExporter, create_exporter
+    from icalwarrior.filtering.constraints import ConstraintEvaluator
     config = ctx.obj['config']
 
     try:
 
-        cal_db = TodoDatabase(config)
+        field_names = None
+        if fields is not None:
+            supported = ConstraintEvaluator.supported_filter_properties() + TodoModel.DATE_IMMUTABLE_PROPERTIES
+            field_names = []
+            for field in fields.split(","):
+                field_name = expand_prefix(field, supported)
+                if field_name == "":
+                    raise InvalidArgumentException(field, supported)
+                field_names.append(field_name)
+
+        # Only the exported fields of the matching todos are passed
+        # from the worker processes, instead of all todos.
+        if jobs > 1 and since is None and 'database' not in ctx.obj:
+            from icalwarrior.model.parallel import ParallelQuery
+            ParallelQuery.check_supported(config, list(constraints))
+            query = ParallelQuery(config, jobs)
+            if len(query.get_list_names()) == 0:
+                fail(ctx,"No lists found. Please check your configuration.")
+
+            exporter = create_exporter(export_format or 'json', StringFormatter(config), field_names, sys.stdout)
+            exporter.write_records(query.select_records(list(constraints), exporter.fields))
+            return
+
+        cal_db = get_database(ctx)
         if len(cal_db.get_list_names()) == 0:
             fail(ctx,"No lists found. Please check your configuration.")
 
-        todos = cal_db.get_todos(ConstraintEvaluator.from_string_list(config, constraints))
+        constraint_evaluator = None
+        if len(constraints) > 0:
+            constraint_evaluator = ConstraintEvaluator.from_string_list(config, constraints)
 
-        objects = []
+        formatter = StringFormatter(config)
 
-        formatter = StringFormatter(ctx.obj['config'])
+        if since is None:
+            exporter = create_exporter(export_format or 'json', formatter, field_names, sys.stdout)
+            exporter.write(cal_db.iter_todos(constraint_evaluator))
 
-        for todo in todos:
-            obj = {}
-            for prop_name in todo.get_property_names():
-                obj[prop_name] = formatter.format_property_value(prop_name, todo)
+        else:
+            if export_format not in (None, 'ndjson'):
+                fail(ctx, "Changes can only be exported in ndjson format.")
 
-            objects.append(obj)
+            journal = ChangeJournal(config)
+            generation = journal.get_generation()
+
+            if since.isdigit():
+                timestamp = journal.get_time_of_generation(int(since))
+                journal_entries = journal.get_entries_since_generation(int(since))
+            else:
+                from icalwarrior.input.date import decode_date
+                since_date = decode_date(since, config)
+                timestamp = datetime.datetime(since_date.year, since_date.month, since_date.day).timestamp()
+                if isinstance(since_date, datetime.datetime):
+                    timestamp = since_date.timestamp()
+                journal_entries = journal.get_entries_since_time(timestamp)
 
-        click.echo(json.dumps(objects))
+            changes = cal_db.get_changes(timestamp, journal_entries, constraint_evaluator)
+            NDJSONExporter(formatter, field_names, sys.stdout).write_changes(changes, generation)
 
     except Exception as err:
         fail(ctx,str(err))
@@ -502,6 +1067,9 @@ def info() -> None:
 
 @info.command(short_help="Shows properties that can be set using the 'add' or 'modify' command.")
 def properties() -> None:
+    from icalwarrior.model.items import TodoModel
+    from icalwarrior.view.tabular import TabularPrinter
+    from icalwarrior.view.renderer import WrapMode
     columns = ["Property", "Allowed values"]
     rows = []
     for prop in TodoModel.supported_properties():
@@ -514,11 +1082,15 @@ def properties() -> None:
         elif prop in TodoModel.ENUM_PROPERTIES:
             rows += [[prop, ", ".join(TodoModel.ENUM_VALUES[prop])]]
 
-    output = TabularPrinter(rows, columns, 0, tableformatter.WrapMode.WRAP, None)
+    output = TabularPrinter(rows, columns, 0, WrapMode.WRAP, None)
     output.print()
 
 @info.command(short_help="Shows properties together with the corresponding operators that can be used for filtering.")
 def filter() -> None:
+    from icalwarrior.model.items import TodoModel
+    from icalwarrior.filtering.constraints import ConstraintEvaluator
+    from icalwarrior.view.tabular import TabularPrinter
+    from icalwarrior.view.renderer import WrapMode
     columns = ["Property", "Supported filter operators"]
     rows = []
     for prop in ConstraintEvaluator.supported_filter_properties():
@@ -529,19 +1101,60 @@ def filter() -> None:
         elif prop in TodoModel.INT_PROPERTIES or prop in ConstraintEvaluator.INT_FILTER_PROPERTIES:
             rows += [[prop, ", ".join(ConstraintEvaluator.INT_OPERATORS.keys())]]
 
-    output = TabularPrinter(rows, columns, 0, tableformatter.WrapMode.WRAP, None)
+    output = TabularPrinter(rows, columns, 0, WrapMode.WRAP, None)
     output.print()
 
 @info.command(short_help="Shows relative date specifications and calculation units")
 def dates() -> None:
+    from icalwarrior.input.date import DATE_SYNONYMS, DATE_FORMULA_UNITS
+    from icalwarrior.view.tabular import TabularPrinter
+    from icalwarrior.view.renderer import WrapMode
 
     columns = ["Type", "Supported values"]
     rows = [["Relative date specificiations", ", ".join(DATE_SYNONYMS)],
             ["Date calculation units", ", ".join(DATE_FORMULA_UNITS)]]
 
-    output = TabularPrinter(rows, columns, 0, tableformatter.WrapMode.WRAP, None)
+    output = TabularPrinter(rows, columns, 0, WrapMode.WRAP, None)
     output.print()
 
 @info.command(short_help="Shows information related to defining reports")
 def reports() -> None:
-    pass
\ No newline at end of file
+    pass
+
+def runs_locally(command : str, args : List[str]) -> bool:
+    """Tells whether a command needs to be run by the client rather than by
+    a daemon. Todos read from a file or stdin are only accessible to this
+    process, watching a report keeps running until interrupted and the
+    pager needs the terminal of the client."""
+
+    if command == "add":
+        return any(arg == "--from" or arg.startswith("--from=") for arg in args)
+
+    if command == "report":
+        return "--watch" in args or "--page" in args
+
+    return False
+
+def main() -> None:
+    """Entry point of the todo command, which lets a running daemon run the
+    command if there is one, and runs it in this process otherwise."""
+
+    args = sys.argv[1:]
+    config_path = Configuration.get_default_config_path()
+
+    index = 0
+    while index < len(args) and args[index] in ("-c", "--config") and index + 1 < len(args):
+        config_path = args[index + 1]
+        index += 2
+
+    command = ""
+    if index < len(args):
+        command = expand_prefix(args[index], list(run_cli.commands.keys()))
+
+    if command not in ("", *constants.LOCAL_COMMANDS) and not runs_locally(command, args[index + 1:]):
+        from icalwarrior.daemon import forward_command
+        exit_code = forward_command(config_path, args[index:])
+        if exit_code is not None:
+            sys.exit(exit_code)
+
+    run_cli()
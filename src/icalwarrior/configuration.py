@@ -2,11 +2,13 @@
 #
 # SPDX-License-Identifier: GPL-3.0-or-later
 
-from typing import List, Any
+from typing import List, Dict, Any, Optional, Tuple, Union
 from pathlib import Path
-import yaml
-
-from yaml.scanner import ScannerError
+import contextlib
+import hashlib
+import json
+import os
+import os.path
 import icalwarrior.constants as constants
 
 class UnknownConfigurationOptionError(Exception):
@@ -25,16 +27,279 @@ class InvalidConfigurationFileError(Exception):
     def __str__(self) -> str:
         return "Config file " + self.path + " is not a valid YAML file."
 
+class InvalidConfigurationValueError(Exception):
+
+    def __init__(self, option : str, expected : str) -> None:
+        self.option = option
+        self.expected = expected
+
+    def __str__(self) -> str:
+        return "Invalid value for configuration option \"" + self.option + "\". Expected " + self.expected + "."
+
+OptionType = Union[type, Tuple[type, ...]]
+
+class ReportSpec:
+    """Options of a report, as compiled from the configuration file."""
+
+    OPTIONS : Dict[str, OptionType] = {
+        'columns' : str,
+        'constraint' : str,
+        'sort' : str,
+        'sort_missing' : str,
+        'max_list_length' : int,
+        'max_column_width' : int,
+        'past_threshold_days' : (int, float),
+        'future_threshold_days' : (int, float),
+        'materialize' : bool
+    }
+
+    def __init__(self, name : str, compiled : Dict[str, Any]) -> None:
+        self.name = name
+        self.columns : Optional[List[str]] = compiled.get('columns', None)
+        self.constraints : List[str] = compiled.get('constraints', [])
+        self.sort : Optional[str] = compiled.get('sort', None)
+        self.sort_missing : str = compiled.get('sort_missing', "last")
+        self.max_list_length : Optional[int] = compiled.get('max_list_length', None)
+        self.max_column_width : int = compiled.get('max_column_width', 0)
+        self.past_threshold_days : Optional[float] = compiled.get('past_threshold_days', None)
+        self.future_threshold_days : Optional[float] = compiled.get('future_threshold_days', None)
+        self.materialize : bool = compiled.get('materialize', False)
+
+    @staticmethod
+    def compile(name : str, options : Any) -> Dict[str, Any]:
+        """Validates the options of a report and splits its columns and
+        constraints, returning a JSON-serializable representation."""
+
+        if not isinstance(options, dict):
+            raise InvalidConfigurationValueError("reports." + name, "a mapping of report options")
+
+        result : Dict[str, Any] = {}
+        for option, value in options.items():
+            expected = ReportSpec.OPTIONS.get(option, None)
+            if expected is None:
+                raise UnknownConfigurationOptionError("reports." + name + "." + str(option))
+
+            if not isinstance(value, expected) or (expected is int and isinstance(value, bool)):
+                raise InvalidConfigurationValueError("reports." + name + "." + option,
+                                                     "a value of type " + ReportSpec.__type_name(expected))
+
+            if option == 'columns':
+                result['columns'] = [column.strip() for column in value.split(",")]
+            elif option == 'constraint':
+                result['constraints'] = [c for c in value.split(" ") if c != ""]
+            else:
+                result[option] = value
+
+        return result
+
+    @staticmethod
+    def __type_name(expected : OptionType) -> str:
+        if isinstance(expected, tuple):
+            return " or ".join(t.__name__ for t in expected)
+        return expected.__name__
+
 class Configuration:
 
+    # Top-level options whose values must be strings, if given
+    STRING_OPTIONS = [
+        'lists_dir',
+        'state_dir',
+        'datetime_format',
+        'date_format',
+        'table_renderer',
+        'show_columns',
+        'load_cache',
+        'storage'
+    ]
+
+    # Top-level options whose values must be one of the given strings, if given
+    CHOICE_OPTIONS = {
+        'load_cache' : constants.LOAD_CACHE_POLICIES,
+        'storage' : constants.STORAGE_BACKENDS
+    }
+
+    # Top-level options whose values must be positive integers, if given
+    POSITIVE_INTEGER_OPTIONS = [
+        'read_concurrency'
+    ]
+
+    # Incremented whenever the format of the cached configuration changes
+    CACHE_VERSION = 2
+
     def __init__(self, configFile : str) -> None:
+
+        # Reading the YAML file is only needed if it changed since it
+        # has been read the last time, as the compiled configuration is
+        # kept in the cache directory along with its modification time.
+        stat = os.stat(configFile)
+        cache_path = Configuration.__get_cache_path(configFile)
+        cached = Configuration.__read_cache(cache_path, stat)
+
+        if cached is not None:
+            self.config : Dict[str, Any] = cached['config']
+            self.reports : Dict[str, Dict[str, Any]] = cached['reports']
+        else:
+            self.config = Configuration.__parse(configFile)
+            self.reports = Configuration.__compile(self.config)
+            Configuration.__write_cache(cache_path, configFile, stat, self.config, self.reports)
+
+        self.digest : Optional[str] = None
+
+    @staticmethod
+    def __parse(configFile : str) -> Dict[str, Any]:
+
+        # Only imported when a configuration actually needs to be parsed
+        import yaml
+
         config_handle = open(configFile)
 
         try:
-            self.config = yaml.load(config_handle, Loader=yaml.Loader)
-        except ScannerError as err:
+            config = yaml.load(config_handle, Loader=getattr(yaml, 'CSafeLoader', yaml.SafeLoader))
+        except yaml.YAMLError as err:
             raise InvalidConfigurationFileError(configFile) from err
-        config_handle.close()
+        finally:
+            config_handle.close()
+
+        if config is None:
+            config = {}
+
+        if not isinstance(config, dict):
+            raise InvalidConfigurationFileError(configFile)
+
+        return config
+
+    @staticmethod
+    def __compile(config : Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+
+        for option in Configuration.STRING_OPTIONS:
+            if config.get(option, None) is not None and not isinstance(config[option], str):
+                raise InvalidConfigurationValueError(option, "a string")
+
+        for option in Configuration.POSITIVE_INTEGER_OPTIONS:
+            value = config.get(option, None)
+            if value is not None and (not isinstance(value, int) or isinstance(value, bool) or value < 1):
+                raise InvalidConfigurationValueError(option, "a positive integer")
+
+        for option, choices in Configuration.CHOICE_OPTIONS.items():
+            if config.get(option, None) is not None and config[option] not in choices:
+                raise InvalidConfigurationValueError(option, "one of " + ", ".join(choices))
+
+        reports = config.get('reports', None)
+        if reports is None:
+            return {}
+
+        if not isinstance(reports, dict):
+            raise InvalidConfigurationValueError('reports', "a mapping of report names to report options")
+
+        return {str(name) : ReportSpec.compile(str(name), options) for name, options in reports.items()}
+
+    @staticmethod
+    def get_cache_dir() -> str:
+        """Returns the path to a directory in which compiled configurations are kept."""
+
+        cache_home = os.environ.get('XDG_CACHE_HOME', "")
+        if cache_home == "":
+            cache_home = os.path.join(str(Path.home()), ".cache")
+
+        return os.path.join(cache_home, "ical")
+
+    @staticmethod
+    def __get_cache_path(configFile : str) -> str:
+        digest = hashlib.sha1(os.path.abspath(configFile).encode('utf-8')).hexdigest()
+        return os.path.join(Configuration.get_cache_dir(), "config-" + digest + ".json")
+
+    @staticmethod
+    def __read_cache(cache_path : str, stat : os.stat_result) -> Optional[Dict[str, Any]]:
+
+        try:
+            with open(cache_path, 'r') as cache_file:
+                cached : Dict[str, Any] = json.load(cache_file)
+        except (OSError, ValueError):
+            return None
+
+        if cached.get('version', None) != Configuration.CACHE_VERSION \
+            or cached.get('mtime', None) != stat.st_mtime_ns \
+            or cached.get('size', None) != stat.st_size:
+            return None
+
+        return cached
+
+    @staticmethod
+    def __remove_stale_caches(cache_path : str) -> None:
+        """Removes the cached configurations other than the given one whose
+        configuration file no longer exists or that have another format."""
+
+        cache_dir = os.path.dirname(cache_path)
+        for file_name in os.listdir(cache_dir):
+            path = os.path.join(cache_dir, file_name)
+            if not file_name.startswith("config-") or not file_name.endswith(".json") or path == cache_path:
+                continue
+
+            try:
+                with open(path, 'r') as cache_file:
+                    cached = json.load(cache_file)
+                if cached.get('version', None) == Configuration.CACHE_VERSION and os.path.exists(cached['path']):
+                    continue
+            except (OSError, ValueError, KeyError, AttributeError):
+                pass
+
+            with contextlib.suppress(OSError):
+                os.remove(path)
+
+    @staticmethod
+    def __write_cache(cache_path : str,
+                      configFile : str,
+                      stat : os.stat_result,
+                      config : Dict[str, Any],
+                      reports : Dict[str, Dict[str, Any]]) -> None:
+
+        cached = {
+            'version' : Configuration.CACHE_VERSION,
+            'path' : os.path.abspath(configFile),
+            'mtime' : stat.st_mtime_ns,
+            'size' : stat.st_size,
+            'config' : config,
+            'reports' : reports
+        }
+
+        # Caching is an optimization only, so that configurations
+        # that cannot be cached, e.g., due to values that have no JSON
+        # representation, are simply parsed each time.
+        tmp_path = cache_path + "." + str(os.getpid()) + ".tmp"
+        try:
+            os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+            with open(tmp_path, 'w') as cache_file:
+                json.dump(cached, cache_file)
+            os.replace(tmp_path, cache_path)
+        except (OSError, TypeError, ValueError):
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+
+        # The cache is only written after a configuration file changed, so
+        # that cleaning it up then keeps it from growing with every
+        # configuration file that has ever been used.
+        with contextlib.suppress(OSError):
+            Configuration.__remove_stale_caches(cache_path)
+
+    def get_digest(self) -> str:
+        """Returns a digest of all options, which changes whenever the
+        configuration is changed, e.g., to invalidate formatted output."""
+
+        if self.digest is None:
+            data = json.dumps([self.config, self.reports], sort_keys=True, default=str)
+            self.digest = hashlib.sha1(data.encode('utf-8')).hexdigest()
+        return self.digest
+
+    def get_report_names(self) -> List[str]:
+        return list(self.reports.keys())
+
+    def get_report(self, name : str) -> ReportSpec:
+
+        if name not in self.reports:
+            raise UnknownConfigurationOptionError("reports." + name)
+
+        return ReportSpec(name, self.reports[name])
 
     @staticmethod
     def get_default_config_path() -> str:
@@ -63,6 +328,24 @@ class Configuration:
 
         return result
 
+    def get_state_dir(self) -> str:
+        """Returns the path to a directory in which icalwarrior keeps its own bookkeeping data."""
+
+        result = str(Path.home()) + "/.local/state/ical"
+        if 'state_dir' in self.config:
+            result = self.config['state_dir']
+
+        if not isinstance(result, str):
+            raise Exception("Non-string type returned for 'state_dir' configuration value.")
+
+        return result
+
+    def get_table_renderer(self) -> str:
+        result = constants.DEFAULT_TABLE_RENDERER
+        if 'table_renderer' in self.config:
+            result = self.config['table_renderer']
+        return result
+
     def get_datetime_format(self) -> str:
         result = constants.DEFAULT_DATETIME_FORMAT
         if 'datetime_format' in self.config:
@@ -75,5 +358,29 @@ class Configuration:
             result = self.config['date_format']
         return result
 
+    def get_read_concurrency(self) -> int:
+        """Returns the number of todo files to be read at a time."""
+
+        result : int = constants.DEFAULT_READ_CONCURRENCY
+        if self.config.get('read_concurrency', None) is not None:
+            result = self.config['read_concurrency']
+        return result
+
+    def get_load_cache_policy(self) -> str:
+        """Returns whether and how the todo files kept in the state directory are used when loading the todo lists."""
+
+        result : str = constants.DEFAULT_LOAD_CACHE_POLICY
+        if self.config.get('load_cache', None) is not None:
+            result = self.config['load_cache']
+        return result
+
+    def get_storage_backend(self) -> str:
+        """Returns the name of the backend storing the todo lists."""
+
+        result : str = constants.DEFAULT_STORAGE_BACKEND
+        if self.config.get('storage', None) is not None:
+            result = self.config['storage']
+        return result
+
     def get_time_format_for_relative_dates(self) -> str:
         return constants.RELATIVE_DATE_TIME_FORMAT
@@ -9,3 +9,27 @@ DEFAULT_DATE_FORMAT = "%Y-%m-%d"
 DEFAULT_DATETIME_FORMAT = "%Y-%m-%dT%H:%M"
 RELATIVE_DATE_TIME_SEPARATOR = "@"
 RELATIVE_DATE_TIME_FORMAT = "%H:%M"
+DEFAULT_TABLE_RENDERER = "native"
+
+# Number of todo files read at a time when loading the todo lists
+DEFAULT_READ_CONCURRENCY = 1
+
+# Policies for reusing the todo files kept in the state directory
+LOAD_CACHE_POLICIES = ["off", "verify", "trust"]
+DEFAULT_LOAD_CACHE_POLICY = "off"
+
+# Backends storing the todo lists that can be selected
+# by the configuration, see icalwarrior.model.storage
+STORAGE_BACKENDS = ["vdir"]
+DEFAULT_STORAGE_BACKEND = "vdir"
+
+# Kept here rather than with the aggregation and export code, so that
+# the command line interface can offer them without importing that code.
+AGGREGATION_GROUPS = ['status', 'priority', 'category', 'due']
+EXPORT_FORMATS = ['json', 'ndjson', 'csv']
+
+# Commands that ask the user for input or keep running themselves,
+# so that they are never forwarded to a running daemon. Some options
+# keep further commands in the client, i.e., "add --from", as well as
+# "report --watch" and "report --page", see cli.runs_locally.
+LOCAL_COMMANDS = ['daemon', 'serve', 'shell', 'batch', 'description', 'delete', 'cleanup']
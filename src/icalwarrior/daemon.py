@@ -0,0 +1,336 @@
+# SPDX-FileCopyrightText: 2022 Martin Byrenheid <martin@byrenheid.net>
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+from typing import List, Dict, Optional, Any, Tuple
+import contextlib
+import json
+import os
+import os.path
+import signal
+import socket
+import sys
+import time
+
+from icalwarrior.configuration import Configuration
+from icalwarrior.view.screen import OutputBuffer
+
+class DaemonRunningError(Exception):
+
+    def __init__(self, path : str) -> None:
+        self.path = path
+
+    def __str__(self) -> str:
+        return "A daemon is already listening on " + self.path + "."
+
+class DaemonUnsupportedError(Exception):
+
+    def __str__(self) -> str:
+        return "Unix sockets are not supported on this platform."
+
+SOCKET_NAME = "daemon.sock"
+
+def get_socket_path(config : Configuration) -> str:
+    return os.path.join(config.get_state_dir(), SOCKET_NAME)
+
+def send_request(socket_path : str, request : Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Sends a request to the daemon listening on the given socket and
+    returns its response, or None if no daemon is running."""
+
+    if not hasattr(socket, 'AF_UNIX') or not os.path.exists(socket_path):
+        return None
+
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        client.connect(socket_path)
+    except OSError:
+        # Left over by a daemon that has been killed
+        client.close()
+        return None
+
+    # Once the request has been sent, the daemon may have run the command,
+    # so that a failure must not lead to running it a second time.
+    try:
+        client.sendall(json.dumps(request).encode('utf-8'))
+        client.shutdown(socket.SHUT_WR)
+        response : Dict[str, Any] = json.loads(read_all(client))
+    except (OSError, ValueError):
+        response = {'exit_code' : 1, 'stdout' : "", 'stderr' : "Lost connection to the daemon.\n"}
+    finally:
+        client.close()
+
+    return response
+
+def read_all(connection : socket.socket) -> bytes:
+
+    chunks = []
+    while True:
+        chunk = connection.recv(65536)
+        if len(chunk) == 0:
+            return b"".join(chunks)
+        chunks.append(chunk)
+
+def forward_command(config_path : str, args : List[str]) -> Optional[int]:
+    """Runs a command through the daemon serving the given configuration
+    and prints its output. Returns the exit code of the command, or None
+    if no such daemon is running."""
+
+    try:
+        config = Configuration(config_path)
+    except Exception:
+        # Reported when running the command without the daemon
+        return None
+
+    request = {
+        'config' : os.path.abspath(config_path),
+        'args' : args,
+        'tty' : sys.stdout.isatty()
+    }
+
+    response = send_request(get_socket_path(config), request)
+    if response is None or not response.get('accepted', True):
+        return None
+
+    sys.stdout.write(response['stdout'])
+    sys.stderr.write(response['stderr'])
+    exit_code : int = response['exit_code']
+    return exit_code
+
+class ListsWatcher:
+    """Tells whether the lists directory may have changed since the last
+    call, or waits for it to change. Uses inotify if the optional inotify_simple package is installed,
+    and otherwise always reports a possible change, so that the database
+    compares the modification times of all files."""
+
+    READ_DELAY_MS = 100
+
+    def __init__(self, lists_dir : str) -> None:
+        self.lists_dir = lists_dir
+        self.inotify : Any = None
+
+        try:
+            from inotify_simple import INotify, flags
+        except ImportError:
+            return
+
+        self.mask = (flags.CREATE | flags.DELETE | flags.MODIFY | flags.CLOSE_WRITE |
+                     flags.MOVED_FROM | flags.MOVED_TO | flags.ATTRIB | flags.DELETE_SELF)
+        self.inotify = INotify()
+        self.__watch()
+
+    def __watch(self) -> None:
+
+        # Watching a directory again only returns its existing watch
+        # descriptor, so all lists can simply be watched after each change.
+        self.inotify.add_watch(self.lists_dir, self.mask)
+        with os.scandir(self.lists_dir) as entries:
+            for entry in entries:
+                if entry.is_dir():
+                    self.inotify.add_watch(entry.path, self.mask)
+
+    def has_changes(self) -> bool:
+
+        if self.inotify is None:
+            return True
+
+        try:
+            if len(self.inotify.read(timeout=0)) == 0:
+                return False
+            self.__watch()
+        except OSError:
+            pass
+
+        return True
+
+    def wait(self, timeout : float) -> bool:
+        """Waits up to timeout seconds for a change and returns whether the
+        lists directory may have changed. Without inotify, it always waits
+        for the whole time."""
+
+        if self.inotify is None:
+            time.sleep(timeout)
+            return True
+
+        try:
+            # Changes written in quick succession, e.g., by
+            # vdirsyncer, are collected into a single update.
+            if len(self.inotify.read(timeout=int(timeout * 1000), read_delay=ListsWatcher.READ_DELAY_MS)) == 0:
+                return False
+            self.__watch()
+        except OSError:
+            pass
+
+        return True
+
+    def close(self) -> None:
+        if self.inotify is not None:
+            self.inotify.close()
+
+class TodoDaemon:
+    """Keeps the todo lists in memory and runs the commands that todo
+    clients forward over a Unix socket in the state directory.
+
+    Before each command, only the files that changed in the meantime are
+    read. The configuration file and all todo lists are read anew if the
+    configuration file changed or on SIGHUP. The daemon keeps listening on
+    the socket it has been started with, even if the state directory is
+    changed in the configuration. On SIGTERM or SIGINT, the daemon finishes
+    the current command, removes its socket and exits."""
+
+    POLL_INTERVAL = 0.5
+
+    def __init__(self, config_path : str) -> None:
+        self.config_path = os.path.abspath(config_path)
+        self.running = False
+        self.reload_requested = False
+        self.started = time.time()
+        self.handled_commands = 0
+        self.__load()
+
+    def __get_config_stat(self) -> Tuple[int, int]:
+        stat = os.stat(self.config_path)
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def __load(self) -> None:
+        from icalwarrior.model.lists import TodoDatabase
+
+        self.config_stat = self.__get_config_stat()
+        self.config = Configuration(self.config_path)
+        self.database = TodoDatabase(self.config)
+        self.watcher = ListsWatcher(self.config.get_lists_dir())
+
+    def reload(self) -> None:
+        """Reads the configuration file and all todo lists anew."""
+
+        watcher = self.watcher
+        self.__load()
+        watcher.close()
+
+    def stop(self) -> None:
+        self.running = False
+
+    def __refresh(self) -> None:
+
+        if self.reload_requested or self.__get_config_stat() != self.config_stat:
+            self.reload_requested = False
+            self.reload()
+        elif self.watcher.has_changes():
+            self.database.refresh()
+
+    def run_command(self, args : List[str], tty : bool) -> Dict[str, Any]:
+        """Runs a command against the todo lists in memory and returns its exit code and output."""
+
+        import click
+        from icalwarrior.cli import run_cli
+
+        stdout = OutputBuffer(tty)
+        stderr = OutputBuffer(tty)
+        exit_code : Any = 0
+
+        with contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(stderr):
+            try:
+                self.__refresh()
+                exit_code = run_cli.main(args=['-c', self.config_path] + args, prog_name="todo",
+                                         obj={'database' : self.database}, standalone_mode=False)
+            except click.ClickException as err:
+                err.show()
+                exit_code = err.exit_code
+            except click.exceptions.Abort:
+                click.echo("Aborted!", err=True)
+                exit_code = 1
+            except Exception as err:
+                # The todos in memory may be inconsistent after an
+                # unexpected error, so they are read anew next time.
+                click.echo("Error: " + str(err), err=True)
+                self.reload_requested = True
+                exit_code = 1
+
+        self.handled_commands += 1
+
+        return {
+            'exit_code' : exit_code if isinstance(exit_code, int) else 0,
+            'stdout' : stdout.getvalue(),
+            'stderr' : stderr.getvalue()
+        }
+
+    def get_status(self) -> str:
+
+        num_todos = sum(len(todo_list.todos) for todo_list in self.database.lists.values())
+        return ("Daemon running with PID " + str(os.getpid()) + " for " + str(int(time.time() - self.started)) + " seconds, "
+                + "keeping " + str(num_todos) + " todos from " + self.config.get_lists_dir() + " in memory "
+                + "and having run " + str(self.handled_commands) + " commands.\n")
+
+    def handle_request(self, request : Dict[str, Any]) -> Dict[str, Any]:
+
+        control = request.get('control', None)
+        if control == 'ping':
+            return {'exit_code' : 0, 'stdout' : "", 'stderr' : ""}
+        if control == 'status':
+            return {'exit_code' : 0, 'stdout' : self.get_status(), 'stderr' : ""}
+        if control == 'stop':
+            self.stop()
+            return {'exit_code' : 0, 'stdout' : "Daemon stopped.\n", 'stderr' : ""}
+
+        # Clients using another configuration file with the
+        # same state directory run their commands themselves.
+        if request.get('config', None) != self.config_path or not isinstance(request.get('args', None), list):
+            return {'accepted' : False}
+
+        return self.run_command(request['args'], bool(request.get('tty', False)))
+
+    def __serve_connection(self, connection : socket.socket) -> None:
+
+        connection.settimeout(None)
+        try:
+            request = json.loads(read_all(connection))
+            response = self.handle_request(request)
+            connection.sendall(json.dumps(response).encode('utf-8'))
+        except (OSError, ValueError):
+            pass
+
+    def serve(self, socket_path : str, handle_signals : bool = True) -> None:
+        """Runs commands sent to the given socket until stopped. Signal
+        handlers can only be installed from the main thread, so handle_signals
+        has to be disabled when serving from another thread."""
+
+        if not hasattr(socket, 'AF_UNIX'):
+            raise DaemonUnsupportedError()
+
+        if send_request(socket_path, {'control' : 'ping'}) is not None:
+            raise DaemonRunningError(socket_path)
+
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(socket_path)
+        os.makedirs(os.path.dirname(socket_path), exist_ok=True)
+
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        # Only the user may connect to the socket
+        old_umask = os.umask(0o077)
+        try:
+            server.bind(socket_path)
+        finally:
+            os.umask(old_umask)
+        server.listen()
+        server.settimeout(TodoDaemon.POLL_INTERVAL)
+
+        if handle_signals:
+            signal.signal(signal.SIGTERM, lambda signum, frame: self.stop())
+            signal.signal(signal.SIGINT, lambda signum, frame: self.stop())
+            if hasattr(signal, 'SIGHUP'):
+                signal.signal(signal.SIGHUP, lambda signum, frame: setattr(self, 'reload_requested', True))
+
+        self.running = True
+        try:
+            while self.running:
+                try:
+                    connection, _ = server.accept()
+                except socket.timeout:
+                    continue
+
+                with connection:
+                    self.__serve_connection(connection)
+        finally:
+            server.close()
+            with contextlib.suppress(FileNotFoundError):
+                os.unlink(socket_path)
+            self.watcher.close()
@@ -157,6 +157,17 @@ class ConstraintEvaluator:
 
         return ConstraintEvaluator(config, normalized_constraints)
 
+    def get_property_names(self) -> List[str]:
+        """Returns the properties referenced by the constraints."""
+
+        result : List[str] = []
+        for constraint in self.constraints:
+            if constraint[0] == ConstraintElementType.property_value:
+                assert isinstance(constraint[1], tuple)
+                result.append(constraint[1][0])
+
+        return result
+
     def satisfies_constraints(self, todo : TodoModel) -> bool:
 
         buf = ""
@@ -2,7 +2,7 @@
 #
 # SPDX-License-Identifier: GPL-3.0-or-later
 
-from typing import List, Iterable, Union, Dict
+from typing import List, Iterable, Iterator, Mapping, Optional, Union, Dict
 
 import calendar
 import datetime
@@ -232,15 +232,62 @@ DATE_FORMULA_UNITS = ["days",
          "months",
          "years"]
 
-DATE_SYNONYMS : Dict[str, Union[datetime.date, datetime.datetime]] = {
-    "now" : datetime.datetime.now(),
-    "today" : today_as_date(),
-    "tomorrow" : tomorrow_as_date(),
-    "monday" : (tomorrow_as_date() + relativedelta(weekday=calendar.MONDAY)),
-    "tuesday" : (tomorrow_as_date() + relativedelta(weekday=calendar.TUESDAY)),
-    "wednesday" : (tomorrow_as_date() + relativedelta(weekday=calendar.WEDNESDAY)),
-    "thursday" : (tomorrow_as_date() + relativedelta(weekday=calendar.THURSDAY)),
-    "friday" : (tomorrow_as_date() + relativedelta(weekday=calendar.FRIDAY)),
-    "saturday" : (tomorrow_as_date() + relativedelta(weekday=calendar.SATURDAY)),
-    "sunday" : (tomorrow_as_date() + relativedelta(weekday=calendar.SUNDAY))
+class DateSynonyms(Mapping[str, Union[datetime.date, datetime.datetime]]):
+    """Maps each relative date specification to the date it currently refers to.
+
+    The dates are only computed once they are looked up and are computed
+    anew once the current date changed, so that neither importing this
+    module nor long-running processes are affected by them."""
+
+    NAMES = [
+        "now",
+        "today",
+        "tomorrow",
+        "monday",
+        "tuesday",
+        "wednesday",
+        "thursday",
+        "friday",
+        "saturday",
+        "sunday"
+    ]
+
+    WEEKDAYS = {
+        "monday" : calendar.MONDAY,
+        "tuesday" : calendar.TUESDAY,
+        "wednesday" : calendar.WEDNESDAY,
+        "thursday" : calendar.THURSDAY,
+        "friday" : calendar.FRIDAY,
+        "saturday" : calendar.SATURDAY,
+        "sunday" : calendar.SUNDAY
     }
+
+    def __init__(self) -> None:
+        self.day : Optional[datetime.date] = None
+        self.dates : Dict[str, datetime.date] = {}
+
+    def __getitem__(self, name : str) -> Union[datetime.date, datetime.datetime]:
+
+        if name not in DateSynonyms.NAMES:
+            raise KeyError(name)
+
+        if name == "now":
+            return datetime.datetime.now()
+
+        today = today_as_date()
+        if self.day != today:
+            tomorrow = tomorrow_as_date()
+            self.dates = {"today" : today, "tomorrow" : tomorrow}
+            for day_name, weekday in DateSynonyms.WEEKDAYS.items():
+                self.dates[day_name] = tomorrow + relativedelta(weekday=weekday)
+            self.day = today
+
+        return self.dates[name]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(DateSynonyms.NAMES)
+
+    def __len__(self) -> int:
+        return len(DateSynonyms.NAMES)
+
+DATE_SYNONYMS = DateSynonyms()
@@ -0,0 +1,277 @@
+# SPDX-FileCopyrightText: 2022 Martin Byrenheid <martin@byrenheid.net>
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+from typing import List, Dict, Optional, Any, Tuple
+import datetime
+import json
+import os
+import os.path
+from shutil import rmtree
+
+from icalwarrior.configuration import Configuration
+
+# This module is used to answer "todo count" without reading any todo
+# lists, so it must not import icalendar or any module that does.
+
+TodoFacts = Tuple[bool, Optional[str]]
+
+class StatusCounters:
+    """Number of total, open, overdue and today's todos per list, kept in
+    the state directory to be read without parsing any todo lists.
+
+    For each list, the number of open todos per due date is stored, from
+    which the overdue and today's todos are derived for the current date.
+    The counters are updated with every write through TodoList. They are
+    only valid as long as the modification times of the lists directory and
+    of each list directory are the ones recorded with the counters, i.e.,
+    until another application adds or removes files.
+
+    Changes recorded between begin and flush are applied in memory and
+    written at once, so that storing many todos rewrites the counters of
+    each list only once."""
+
+    OPEN = "open"
+    TOTAL = "total"
+    OVERDUE = "overdue"
+    TODAY = "today"
+
+    COUNTERS = [TOTAL, OPEN, OVERDUE, TODAY]
+
+    CLOSED_STATUSES = ["completed", "cancelled"]
+
+    def __init__(self, config : Configuration) -> None:
+        self.lists_dir = config.get_lists_dir()
+        self.path = os.path.join(config.get_state_dir(), "counters")
+        self.summary_path = os.path.join(self.path, "summary.json")
+
+        # Items of the lists changed since begin, if updates are deferred
+        self.batch : Optional[Dict[str, Dict[str, List[Any]]]] = None
+
+    @staticmethod
+    def is_open(status : str) -> bool:
+        return status.lower() not in StatusCounters.CLOSED_STATUSES
+
+    @staticmethod
+    def __mtime(path : str) -> int:
+        return os.stat(path).st_mtime_ns
+
+    @staticmethod
+    def __write_json(path : str, data : Any) -> None:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'w') as handle:
+            json.dump(data, handle)
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def __read_json(path : str) -> Any:
+        with open(path, 'r') as handle:
+            return json.load(handle)
+
+    def __items_path(self, list_name : str) -> str:
+        return os.path.join(self.path, "items", list_name + ".json")
+
+    def __read_summary(self) -> Optional[Dict[str, Any]]:
+        try:
+            summary : Dict[str, Any] = self.__read_json(self.summary_path)
+            return summary
+        except (OSError, ValueError):
+            return None
+
+    @staticmethod
+    def __summarize(items : Dict[str, List[Any]]) -> Dict[str, Any]:
+
+        result : Dict[str, Any] = {StatusCounters.TOTAL : len(items), StatusCounters.OPEN : 0, 'due' : {}}
+        for is_open, due in items.values():
+            if is_open:
+                result[StatusCounters.OPEN] += 1
+                if due is not None:
+                    result['due'][due] = result['due'].get(due, 0) + 1
+
+        return result
+
+    def rebuild(self, lists : Dict[str, Dict[str, TodoFacts]]) -> None:
+        """Replaces the counters by the ones of the given lists, which map
+        the UID of each todo to whether it is open and its due date."""
+
+        summary : Dict[str, Any] = {'root_mtime' : self.__mtime(self.lists_dir), 'lists' : {}}
+        rmtree(os.path.join(self.path, "items"), ignore_errors=True)
+        for list_name, items in lists.items():
+            item_data = {uid : list(facts) for uid, facts in items.items()}
+            self.__write_json(self.__items_path(list_name), item_data)
+            summary['lists'][list_name] = self.__summarize(item_data)
+            summary['lists'][list_name]['mtime'] = self.__mtime(os.path.join(self.lists_dir, list_name))
+
+        self.__write_json(self.summary_path, summary)
+
+    def is_valid(self) -> bool:
+
+        summary = self.__read_summary()
+        if summary is None:
+            return False
+
+        try:
+            if summary['root_mtime'] != self.__mtime(self.lists_dir):
+                return False
+
+            for list_name, counters in summary['lists'].items():
+                if counters['mtime'] != self.__mtime(os.path.join(self.lists_dir, list_name)):
+                    return False
+        except OSError:
+            return False
+
+        return True
+
+    def is_list_valid(self, list_name : str) -> bool:
+
+        summary = self.__read_summary()
+        if summary is None or list_name not in summary['lists']:
+            return False
+
+        try:
+            return bool(summary['lists'][list_name]['mtime'] == self.__mtime(os.path.join(self.lists_dir, list_name)))
+        except OSError:
+            return False
+
+    def is_root_valid(self) -> bool:
+
+        summary = self.__read_summary()
+        if summary is None:
+            return False
+
+        try:
+            return bool(summary['root_mtime'] == self.__mtime(self.lists_dir))
+        except OSError:
+            return False
+
+    def begin(self) -> None:
+        """Defers writing the counters until flush is called."""
+
+        if self.batch is None:
+            self.batch = {}
+
+    def flush(self) -> None:
+        """Writes the counters of the lists changed since begin was called."""
+
+        if self.batch is None:
+            return
+
+        batch = self.batch
+        self.batch = None
+        if len(batch) > 0:
+            self.__write_items(batch)
+
+    def __read_items(self, list_name : str) -> Dict[str, List[Any]]:
+
+        if self.batch is not None and list_name in self.batch:
+            return self.batch[list_name]
+
+        items : Dict[str, List[Any]] = self.__read_json(self.__items_path(list_name))
+        return items
+
+    def __write_items(self, lists : Dict[str, Dict[str, List[Any]]]) -> None:
+
+        summary = self.__read_summary()
+        assert summary is not None
+
+        for list_name, items in lists.items():
+            self.__write_json(self.__items_path(list_name), items)
+            summary['lists'][list_name] = self.__summarize(items)
+            summary['lists'][list_name]['mtime'] = self.__mtime(os.path.join(self.lists_dir, list_name))
+
+        self.__write_json(self.summary_path, summary)
+
+    def __update(self, list_name : str, uid : str, facts : Optional[TodoFacts]) -> None:
+
+        items = self.__read_items(list_name)
+        if facts is None:
+            items.pop(uid, None)
+        else:
+            items[uid] = list(facts)
+
+        if self.batch is not None:
+            self.batch[list_name] = items
+        else:
+            self.__write_items({list_name : items})
+
+    def __get_facts(self, list_name : str, uid : str) -> Optional[TodoFacts]:
+
+        items = self.__read_items(list_name)
+        if uid not in items:
+            return None
+
+        return (bool(items[uid][0]), items[uid][1])
+
+    def record_write(self, list_name : str, uid : str, facts : TodoFacts, was_valid : bool) -> None:
+        """Updates the counters after a todo has been written. Whether the
+        counters of the list were valid needs to be determined before writing,
+        as writing a new file changes the modification time of the list."""
+
+        if was_valid:
+            self.__update(list_name, uid, facts)
+
+    def record_delete(self, list_name : str, uid : str, was_valid : bool) -> None:
+
+        if was_valid:
+            self.__update(list_name, uid, None)
+
+    def record_move(self, source : str, destination : str, uid : str, was_valid : bool) -> None:
+
+        if was_valid:
+            facts = self.__get_facts(source, uid)
+            if facts is not None:
+                self.__update(source, uid, None)
+                self.__update(destination, uid, facts)
+
+    def record_list_added(self, list_name : str, was_valid : bool) -> None:
+
+        if was_valid:
+            self.__write_json(self.__items_path(list_name), {})
+            summary = self.__read_summary()
+            assert summary is not None
+            summary['lists'][list_name] = self.__summarize({})
+            summary['lists'][list_name]['mtime'] = self.__mtime(os.path.join(self.lists_dir, list_name))
+            summary['root_mtime'] = self.__mtime(self.lists_dir)
+            self.__write_json(self.summary_path, summary)
+
+    def record_list_deleted(self, list_name : str, was_valid : bool) -> None:
+
+        if was_valid:
+            summary = self.__read_summary()
+            assert summary is not None
+            summary['lists'].pop(list_name, None)
+            summary['root_mtime'] = self.__mtime(self.lists_dir)
+            self.__write_json(self.summary_path, summary)
+            if os.path.exists(self.__items_path(list_name)):
+                os.remove(self.__items_path(list_name))
+
+    def get_counts(self, list_name : Optional[str] = None, today : Optional[datetime.date] = None) -> Dict[str, int]:
+        """Returns the counters summed up over all lists or for the given list only."""
+
+        if today is None:
+            today = datetime.date.today()
+        today_str = today.isoformat()
+
+        summary = self.__read_summary()
+        assert summary is not None
+
+        if list_name is not None and list_name not in summary['lists']:
+            # Only imported if needed, as it imports icalendar
+            from icalwarrior.model.lists import ListNotFoundError
+            raise ListNotFoundError(list_name)
+
+        result = {counter : 0 for counter in StatusCounters.COUNTERS}
+        for name, counters in summary['lists'].items():
+            if list_name is not None and name != list_name:
+                continue
+
+            result[StatusCounters.TOTAL] += counters[StatusCounters.TOTAL]
+            result[StatusCounters.OPEN] += counters[StatusCounters.OPEN]
+            for due, count in counters['due'].items():
+                if due < today_str:
+                    result[StatusCounters.OVERDUE] += count
+                elif due == today_str:
+                    result[StatusCounters.TODAY] += count
+
+        return result
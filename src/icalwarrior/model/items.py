@@ -2,7 +2,8 @@
 #
 # SPDX-License-Identifier: GPL-3.0-or-later
 
-from typing import List, Union, Dict, cast
+from typing import List, Union, Dict, Any, cast
+import copy
 import datetime
 import dateutil.tz as tz
 import icalendar
@@ -94,6 +95,10 @@ class TodoModel:
 
         self.context : Dict[str, Union[str, int]] = {}
 
+        # Values derived from the properties, such as sort keys,
+        # which are kept until one of the properties changes.
+        self.cache : Dict[str, Any] = {}
+
     def get_property_names(self) -> List[str]:
         result = [k for k in list(self.todo.keys()) if k.lower() != "context"]
         return result
@@ -159,6 +164,7 @@ class TodoModel:
             modified = True
 
         if modified:
+            self.cache.clear()
             self.__update_modification_timestamps()
 
     def __update_modification_timestamps(self) -> None:
@@ -172,6 +178,18 @@ class TodoModel:
     def get_ical_todo(self) -> icalendar.Todo:
         return self.todo
 
+    def copy(self) -> 'TodoModel':
+        """Returns a copy whose properties, context and cache can be changed
+        without affecting this todo. Property values are shared, as they are
+        replaced rather than modified when setting properties."""
+
+        result = copy.copy(self)
+        result.todo = copy.copy(self.todo)
+        result.todo.subcomponents = list(self.todo.subcomponents)
+        result.context = dict(self.context)
+        result.cache = dict(self.cache)
+        return result
+
     def get_context(self, key : str) -> Union[str, int]:
         return self.context[key]
 
@@ -195,12 +213,30 @@ class TodoModel:
 
     def get_date_or_datetime(self, prop_name : str) -> datetime.datetime | datetime.date:
 
+        # Dates are needed for sorting, formatting and tagging alike,
+        # so decode them only once.
+        cache_key = "date:" + prop_name
+        if cache_key in self.cache:
+            cached : datetime.datetime | datetime.date = self.cache[cache_key]
+            return cached
+
         result = icalendar.prop.vDDDTypes.from_ical(self.todo[prop_name])
         if isinstance(result, (datetime.datetime, datetime.date)):
+            self.cache[cache_key] = result
             return result
 
         raise Exception("Object of non-datetime  or date type " + type(result).__name__ + " given.")
 
+    def get_timestamp(self, prop_name : str) -> float:
+        """Returns the value of a date property as POSIX timestamp, where
+        dates without time are considered to start at midnight local time."""
+
+        date_val = self.get_date_or_datetime(prop_name)
+        if isinstance(date_val, datetime.datetime):
+            return date_val.timestamp()
+
+        return datetime.datetime(date_val.year, date_val.month, date_val.day).timestamp()
+
     def get_categories(self) -> List[str]:
 
         categories = self.todo['categories']
@@ -231,4 +267,5 @@ class TodoModel:
         return prop_name in self.todo
 
     def unset_property(self, prop_name : str) -> None:
+        self.cache.clear()
         del self.todo[prop_name]
@@ -0,0 +1,171 @@
+# SPDX-FileCopyrightText: 2022 Martin Byrenheid <martin@byrenheid.net>
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+from typing import List, Dict, Optional, Any, Iterator, BinaryIO
+import os
+import os.path
+import json
+import time
+
+from icalwarrior.model.items import TodoModel
+from icalwarrior.configuration import Configuration
+
+class Change:
+
+    CREATE = "create"
+    UPDATE = "update"
+    DELETE = "delete"
+
+    def __init__(self, operation : str, list_name : str, uid : str, todo : Optional[TodoModel]) -> None:
+        self.operation = operation
+        self.list_name = list_name
+        self.uid = uid
+        self.todo = todo
+
+class UnknownGenerationError(Exception):
+
+    def __init__(self, generation : int, latest : int) -> None:
+        self.generation = generation
+        self.latest = latest
+
+    def __str__(self) -> str:
+        return "Generation " + str(self.generation) + " is not recorded in the journal. The latest generation is " + str(self.latest) + "."
+
+class ChangeJournal:
+    """Append-only log of the writes and deletions performed by icalwarrior.
+
+    Each entry is numbered by a generation that increases with every change,
+    so that consumers can ask for all changes after a given generation.
+    Deleted todos no longer exist on disk, so the journal is the only
+    record of them.
+
+    Appending an entry holds an flock on the journal, so that processes
+    writing to different lists do not assign the same generation. Entries
+    are read from the end of the journal, so that asking for recent changes
+    does not take longer as the journal grows."""
+
+    WRITE = "write"
+    DELETE = "delete"
+
+    FILE_NAME = "journal.ndjson"
+
+    # Number of bytes read at a time when reading backwards
+    BLOCK_SIZE = 65536
+
+    def __init__(self, config : Configuration) -> None:
+        self.path = os.path.join(config.get_state_dir(), ChangeJournal.FILE_NAME)
+
+    @staticmethod
+    def __iter_lines_reversed(journal_file : BinaryIO) -> Iterator[bytes]:
+
+        journal_file.seek(0, os.SEEK_END)
+        position = journal_file.tell()
+        rest = b""
+        while position > 0:
+            size = min(ChangeJournal.BLOCK_SIZE, position)
+            position -= size
+            journal_file.seek(position)
+            lines = (journal_file.read(size) + rest).split(b"\n")
+            # The first line may continue in the preceding block
+            rest = lines.pop(0)
+            for line in reversed(lines):
+                if line.strip() != b"":
+                    yield line
+
+        if rest.strip() != b"":
+            yield rest
+
+    def __iter_entries_reversed(self) -> Iterator[Dict[str, Any]]:
+        """Yields the entries starting with the latest one."""
+
+        if not os.path.exists(self.path):
+            return
+
+        with open(self.path, 'rb') as journal_file:
+            for line in ChangeJournal.__iter_lines_reversed(journal_file):
+                entry : Dict[str, Any] = json.loads(line)
+                yield entry
+
+    def get_generation(self) -> int:
+        entry = next(self.__iter_entries_reversed(), None)
+        if entry is None:
+            return 0
+        return int(entry['generation'])
+
+    def record(self, operation : str, list_name : str, uid : str) -> int:
+
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, 'a+b') as journal_file:
+            try:
+                import fcntl
+                fcntl.flock(journal_file.fileno(), fcntl.LOCK_EX)
+            except ImportError:
+                pass
+
+            # The lock is released when the file is closed
+            last_entry = next((json.loads(line) for line in ChangeJournal.__iter_lines_reversed(journal_file)), None)
+            generation = 1 if last_entry is None else int(last_entry['generation']) + 1
+            entry = {
+                'generation' : generation,
+                'operation' : operation,
+                'list' : list_name,
+                'uid' : uid,
+                'time' : time.time()
+            }
+
+            journal_file.seek(0, os.SEEK_END)
+            journal_file.write((json.dumps(entry) + "\n").encode('utf-8'))
+
+        return generation
+
+    def get_entries(self) -> List[Dict[str, Any]]:
+
+        result : List[Dict[str, Any]] = []
+        if not os.path.exists(self.path):
+            return result
+
+        with open(self.path, 'r') as journal_file:
+            for line in journal_file:
+                if line.strip() != "":
+                    result.append(json.loads(line))
+
+        return result
+
+    def get_entries_since_generation(self, generation : int) -> List[Dict[str, Any]]:
+
+        result : List[Dict[str, Any]] = []
+        for entry in self.__iter_entries_reversed():
+            if entry['generation'] <= generation:
+                break
+            result.append(entry)
+
+        result.reverse()
+        return result
+
+    def get_entries_since_time(self, timestamp : float) -> List[Dict[str, Any]]:
+
+        result : List[Dict[str, Any]] = []
+        for entry in self.__iter_entries_reversed():
+            if entry['time'] < timestamp:
+                break
+            result.append(entry)
+
+        result.reverse()
+        return result
+
+    def get_time_of_generation(self, generation : int) -> float:
+        """Returns the time of the change with the given generation, or 0
+        for generation 0, which precedes all changes. Raises an
+        UnknownGenerationError for generations that have not been recorded."""
+
+        if generation == 0:
+            return 0.0
+
+        for entry in self.__iter_entries_reversed():
+            if entry['generation'] == generation:
+                return float(entry['time'])
+            if entry['generation'] < generation:
+                break
+
+        raise UnknownGenerationError(generation, self.get_generation())
@@ -2,10 +2,12 @@
 #
 # SPDX-License-Identifier: GPL-3.0-or-later
 
-from typing import List, Dict, Optional
-import os
+from typing import List, Dict, Optional, Set, Iterator, Tuple, Any, Mapping, TYPE_CHECKING
+import bisect
+import contextlib
 import os.path
-from shutil import rmtree
+from types import MappingProxyType
+import threading
 import uuid
 import datetime
 import dateutil.tz as tz
@@ -14,9 +16,17 @@ import icalendar
 
 from icalwarrior import __author__,__productname__,__version__
 from icalwarrior.model.items import TodoModel
+from icalwarrior.model.journal import ChangeJournal, Change
+from icalwarrior.model.counters import StatusCounters, TodoFacts
+from icalwarrior.model.views import MaterializedReports
+from icalwarrior.model.storage import StorageBackend, VdirStorage, FileState, ItemStat, get_digest, create_storage
 from icalwarrior.configuration import Configuration
 from icalwarrior.filtering.constraints import ConstraintEvaluator
 
+# The aggregator refers to the database, so it is only imported when used.
+if TYPE_CHECKING:
+    from icalwarrior.model.statistics import TodoAggregator
+
 
 class DuplicateCalendarNameError(Exception):
 
@@ -61,13 +71,109 @@ class TodoNotFoundError(Exception):
     def __str__(self) -> str:
         return "Todo item with UID " + self.uid + " not found in list " + self.list_name
 
+class WriteConflictError(Exception):
+
+    def __init__(self, conflicts : Dict[str, List[str]]) -> None:
+        # UIDs of the todos not written per list
+        self.conflicts = conflicts
+        self.uids = [uid for uids in conflicts.values() for uid in uids]
+
+    def __str__(self) -> str:
+        items = [", ".join(uids) + " in list " + list_name for list_name, uids in self.conflicts.items()]
+        return ("Todo items with UIDs " + "; ".join(items)
+                + " have been changed by another application since they were read and have not been written. Please run the command again.")
+
+def get_counter_facts(todo : TodoModel) -> TodoFacts:
+    """Returns whether a todo is open and its local due date, as needed for the status counters."""
+
+    due : Optional[str] = None
+    if todo.has_property('due'):
+        due_val = todo.get_date_or_datetime('due')
+        if isinstance(due_val, datetime.datetime):
+            if due_val.tzinfo is not None:
+                due_val = due_val.astimezone(tz.gettz())
+            due_val = due_val.date()
+        due = due_val.isoformat()
+
+    return (StatusCounters.is_open(todo.get_string('status')), due)
+
+def parse_todos(config : Configuration, list_name : str, data : bytes) -> List[TodoModel]:
+    """Parses the todos of a file of the given list."""
+
+    result : List[TodoModel] = []
+    calendar = icalendar.Calendar.from_ical(data)
+
+    for todo in calendar.walk('vtodo'):
+
+        wrapped_todo = TodoModel(config, todo)
+        # Add context information to be used for filtering etc.
+        wrapped_todo.set_context('list', list_name)
+        result.append(wrapped_todo)
+
+    return result
+
+def read_todo_file(config : Configuration, list_name : str, file_name : str) -> List[TodoModel]:
+    """Reads the todos stored in a file of the given list through the
+    storage backend selected by the configuration."""
+
+    return parse_todos(config, list_name, create_storage(config).read_item(list_name, file_name))
+
+class PendingChange:
+    """A todo written or deleted through a TodoList, along with its position
+    within the list at the time of the change."""
+
+    def __init__(self, operation : str, uid : str, todo : Optional[TodoModel], rank : int, is_new : bool) -> None:
+        self.operation = operation
+        self.uid = uid
+        self.todo = todo
+        self.rank = rank
+        self.is_new = is_new
+
 class TodoList:
+    """The todos of a list, each stored in a file named after its UID
+    through the storage backend of the database.
+
+    Files are only written or deleted if they are still in the state they
+    had when they were read or last written, so that changes of other
+    applications, e.g., vdirsyncer, are not overwritten. Files that have been
+    touched without changing their content are not considered as changed."""
 
-    def __init__(self, config: Configuration, name: str, todos: List[TodoModel]) -> None:
+    def __init__(self, config: Configuration, name: str, todos: List[TodoModel],
+                 file_states : Optional[Dict[str, FileState]] = None,
+                 storage : Optional[StorageBackend] = None) -> None:
 
         self.name = name
         self.todos = todos
         self.config = config
+        self.storage = storage if storage is not None else VdirStorage(config)
+
+        # Kept for the lifetime of the list, so that the materialized
+        # reports are not compiled and read anew for every change.
+        self.reports = MaterializedReports(config)
+
+        # State of each file as read or last written, shared with the database
+        self.file_states : Dict[str, FileState] = file_states if file_states is not None else {}
+        self.held_lock : Optional[object] = None
+
+        # Incremented with every change, so that results
+        # derived from the todos can be cached.
+        self.generation = 0
+
+        # Changes not stored yet, if storing is deferred
+        self.pending : Optional[List[PendingChange]] = None
+
+        # UIDs of the todos added, changed or removed since the
+        # last snapshot of the database has been taken
+        self.changed_uids : Set[str] = set()
+
+    def __get_rank(self, uid : str) -> int:
+        """Returns the position of the todo with the given UID within the
+        list, or the position at which it would be inserted."""
+
+        return bisect.bisect_left(self.todos, uid, key=lambda item: item.get_string('uid'))
+
+    def __contains_at(self, rank : int, uid : str) -> bool:
+        return rank < len(self.todos) and self.todos[rank].get_string('uid') == uid
 
     def get_by_uid(self, uid : str) -> icalendar.Todo:
 
@@ -79,7 +185,110 @@ class TodoList:
 
         raise TodoNotFoundError(self.name, uid)
 
-    def add(self, todo : icalendar.Todo) -> None:
+    def add(self, todo : icalendar.Todo, model : Optional[TodoModel] = None) -> None:
+        """Stores a new or modified todo. A new todo is kept in memory as
+        well, using the given model if any, so that the positions of the
+        todos of the list remain known, e.g., for todos moved from another list."""
+
+        uid = str(todo['uid'])
+        rank = self.__get_rank(uid)
+        is_new = not self.__contains_at(rank, uid)
+        if is_new:
+            self.insert(model if model is not None else TodoModel(self.config, todo))
+
+        change = PendingChange(ChangeJournal.WRITE, uid, self.todos[rank], rank, is_new)
+        if self.pending is not None:
+            self.pending.append(change)
+        else:
+            self.__store([change])
+        self.changed_uids.add(uid)
+        self.generation += 1
+
+    def remove(self, uid : str) -> None:
+        """Removes a todo from the in-memory list only, e.g., after its file has been deleted."""
+
+        rank = self.__get_rank(uid)
+        if self.__contains_at(rank, uid):
+            del self.todos[rank]
+            self.changed_uids.add(uid)
+            self.generation += 1
+
+    def insert(self, todo : TodoModel) -> None:
+        """Inserts an already stored todo into the in-memory list,
+        keeping the order in which the todos of a list are enumerated."""
+
+        todo.set_context('list', self.name)
+        bisect.insort(self.todos, todo, key=lambda item: item.get_string('uid'))
+        self.changed_uids.add(todo.get_string('uid'))
+        self.generation += 1
+
+    def delete(self, todo : icalendar.Todo) -> None:
+
+        uid = str(todo['uid'])
+        rank = self.__get_rank(uid)
+        if self.__contains_at(rank, uid):
+            del self.todos[rank]
+
+        change = PendingChange(ChangeJournal.DELETE, uid, None, rank, False)
+        if self.pending is not None:
+            self.pending.append(change)
+        else:
+            self.__store([change])
+        self.changed_uids.add(uid)
+        self.generation += 1
+
+    def begin(self) -> None:
+        """Defers storing changes until commit is called. Changes
+        are applied to the todos in memory right away."""
+
+        if self.pending is None:
+            self.pending = []
+
+    def commit(self) -> None:
+        """Stores the changes deferred since begin was called,
+        writing each changed todo only once."""
+
+        if self.pending is not None:
+            changes = self.pending
+            self.pending = None
+            self.__store(changes)
+
+    @contextlib.contextmanager
+    def locked(self) -> Iterator['TodoList']:
+        """Holds the advisory lock of the list, so that other icalwarrior
+        processes do not write to the list in between, e.g., during bulk
+        changes. The lock is taken while storing changes anyway."""
+
+        if self.held_lock is not None:
+            yield self
+            return
+
+        with self.storage.lock(self.name) as lock:
+            self.held_lock = lock
+            try:
+                yield self
+            finally:
+                self.held_lock = None
+
+    def __has_conflict(self, file_name : str, operation : str) -> bool:
+        """Tells whether a file differs from the state it had when it was
+        read or last written."""
+
+        expected = self.file_states.get(file_name, None)
+        stat = self.storage.stat_item(self.name, file_name)
+        if stat is None:
+            # Writing a todo deleted in the meantime would restore it
+            return expected is not None and operation == ChangeJournal.WRITE
+
+        if expected is None:
+            return True
+
+        if stat == expected[0:2]:
+            return False
+
+        return get_digest(self.storage.read_item(self.name, file_name)) != expected[2]
+
+    def __write_file(self, todo : icalendar.Todo) -> None:
 
         # Since we assume that each todo is stored in a separate calendar,
         # create a calendar as wrapper for the todo item
@@ -88,67 +297,362 @@ class TodoList:
         todo_cal.add('prodid', '-//' + __author__ + '//' + __productname__ + ' ' + __version__ + '//EN')
         todo_cal.add_component(todo)
 
-        path = os.path.join(self.config.get_lists_dir(), self.name, todo['uid'] + ".ics")
-        file_handle = open(path, "wb")
-        file_handle.write(todo_cal.to_ical())
-        file_handle.close()
+        file_name = str(todo['uid']) + ".ics"
+        self.file_states[file_name] = self.storage.write_item(self.name, file_name, todo_cal.to_ical())
+
+    def __store(self, changes : List['PendingChange']) -> None:
+        """Stores the given changes, except for the ones of todos whose
+        files have been changed by another application. Those are reported
+        by a WriteConflictError after storing the other changes."""
+
+        with self.locked():
+            # Whether the stored counters and reports are up to date needs to be
+            # determined before writing, as adding or removing files changes the
+            # modification time of the list. Backends that are not persistent
+            # have no state directory to keep them in.
+            persistent = self.storage.PERSISTENT
+            counters = StatusCounters(self.config)
+            counters_valid = persistent and counters.is_list_valid(self.name)
+            reports = self.reports
+            valid_reports = reports.get_valid_report_names() if persistent else []
+
+            # Only the last change of each todo needs to be stored, but a todo
+            # written before being deleted may not have a file yet.
+            last_changes = {change.uid : change for change in changes}
+            conflicts : List[str] = []
+            for change in last_changes.values():
+                file_name = change.uid + ".ics"
+                if self.__has_conflict(file_name, change.operation):
+                    conflicts.append(change.uid)
+                elif change.operation == ChangeJournal.WRITE:
+                    assert change.todo is not None
+                    self.__write_file(change.todo.get_ical_todo())
+                else:
+                    self.storage.delete_item(self.name, file_name)
+                    self.file_states.pop(file_name, None)
+
+            # The counters and reports are written once for all changes
+            journal = ChangeJournal(self.config)
+            counters.begin()
+            reports.begin()
+            try:
+                for change in changes:
+                    if change.uid in conflicts or not persistent:
+                        continue
+
+                    journal.record(change.operation, self.name, change.uid)
+                    if change.operation == ChangeJournal.WRITE:
+                        assert change.todo is not None
+                        counters.record_write(self.name, change.uid, get_counter_facts(change.todo), counters_valid)
+                        reports.record_write(self.name, change.todo, change.rank, change.is_new, valid_reports)
+                    else:
+                        counters.record_delete(self.name, change.uid, counters_valid)
+                        reports.record_delete(self.name, change.uid, change.rank, valid_reports)
+            finally:
+                counters.flush()
+                reports.flush()
+
+        if len(conflicts) > 0:
+            raise WriteConflictError({self.name : conflicts})
+
+    def iter_todos(self, constraint_evaluator : Optional[ConstraintEvaluator] = None) -> Iterator[TodoModel]:
 
-    def delete(self, todo : icalendar.Todo) -> None:
+        for todo_item in self.todos:
 
-        path = os.path.join(self.config.get_lists_dir(), self.name, todo['uid'] + ".ics")
-        os.remove(path)
+            if constraint_evaluator is None or constraint_evaluator.satisfies_constraints(todo_item):
+                yield todo_item
 
     def get_todos(self, constraint_evaluator : Optional[ConstraintEvaluator] = None) -> List[TodoModel]:
+        return list(self.iter_todos(constraint_evaluator))
 
-        result : List[TodoModel] = []
-        for todo_item in self.todos:
+class TodoSnapshot:
+    """The todos of a TodoDatabase at one generation, which can be read from
+    any number of threads without locking while the database is changed.
 
-            if constraint_evaluator is None or constraint_evaluator.satisfies_constraints(todo_item):
-                result.append(todo_item)
+    The todos of a snapshot are copies of the ones of the database, so that
+    later changes do not affect them, and must not be modified. Snapshots
+    share the copies of the todos that did not change in between."""
 
-        return result
+    def __init__(self, generation : int, lists : Dict[str, Tuple[TodoModel, ...]]) -> None:
+        self.generation = generation
+        self.lists : Mapping[str, Tuple[TodoModel, ...]] = MappingProxyType(lists)
+
+    def get_generation(self) -> int:
+        return self.generation
+
+    def list_exists(self, name : str) -> bool:
+        return name in self.lists
+
+    def get_list_names(self) -> List[str]:
+        return list(self.lists.keys())
+
+    def get_list_todos(self, name : str) -> Tuple[TodoModel, ...]:
+
+        if name not in self.lists:
+            raise ListNotFoundError(name)
+
+        return self.lists[name]
+
+    def iter_todos(self, constraint_evaluator : Optional[ConstraintEvaluator] = None) -> Iterator[TodoModel]:
+
+        for todos in self.lists.values():
+            for todo in todos:
+                if constraint_evaluator is None or constraint_evaluator.satisfies_constraints(todo):
+                    yield todo
+
+    def get_todos(self, constraint_evaluator : Optional[ConstraintEvaluator] = None) -> List[TodoModel]:
+        return list(self.iter_todos(constraint_evaluator))
 
 class TodoDatabase:
 
-    def __init__(self, config : Configuration) -> None:
+    def __init__(self, config : Configuration, stable_ids : bool = False, storage : Optional[StorageBackend] = None) -> None:
+        """Reads all todo lists from the given storage backend, or the one
+        selected by the configuration. With stable_ids, each todo keeps the
+        ID it has been assigned first as long as this database exists, and
+        new todos get the next unused ID instead of the ones of later todos
+        being shifted."""
+
         self.config = config
+        self.storage = storage if storage is not None else create_storage(config)
+        self.uids : Set[str] = set()
+        self.generation = 0
+        self.modification_index : Optional[List[Tuple[float, str, TodoModel]]] = None
+        self.stable_ids = stable_ids
+        self.ids : Dict[str, int] = {}
+        self.in_transaction = False
+
+        # Modification time and size as well as the UIDs of the todos
+        # of each file per list, used to refresh the lists incrementally.
+        self.file_stats : Dict[str, Dict[str, ItemStat]] = {}
+        self.file_uids : Dict[str, Dict[str, List[str]]] = {}
+
+        # State of each file when it was read, used by the lists to
+        # detect files changed by other applications before writing.
+        self.file_states : Dict[str, Dict[str, FileState]] = {}
+
+        # Changes are serialized by a lock, while readers use snapshots,
+        # which are only published once the first one has been requested.
+        self.lock = threading.RLock()
+        self.write_depth = 0
+        self.ids_version = 0
+        self.current_snapshot : Optional[TodoSnapshot] = None
+        self.snapshot_copies : Dict[str, Dict[str, TodoModel]] = {}
+        self.snapshot_generations : Dict[str, Tuple[TodoList, int]] = {}
+        self.snapshot_ids_version = 0
+
+        self.aggregator : Optional['TodoAggregator'] = None
+
         self.lists = self.__read_todo_lists()
+        self.__assign_ids()
+
+    def __add_file(self, list_name : str, todo_file : str, state : FileState, data : bytes) -> List[TodoModel]:
+
+        todos = parse_todos(self.config, list_name, data)
+        self.file_states.setdefault(list_name, {})[todo_file] = state
+        uids = [todo.get_string('uid') for todo in todos]
+        self.uids.update(uids)
+        self.file_uids.setdefault(list_name, {})[todo_file] = uids
+        return todos
+
+    def __read_files(self, files : List[Tuple[str, str]]) -> Dict[str, List[TodoModel]]:
+        """Reads the given files, each given by its list and file name, and
+        returns the todos read per list."""
+
+        result : Dict[str, List[TodoModel]] = {list_name : [] for list_name, _ in files}
+
+        def add_file(list_name : str, todo_file : str, state : FileState, data : bytes) -> None:
+            result[list_name].extend(self.__add_file(list_name, todo_file, state, data))
+
+        self.storage.read_items(files, add_file)
+        return result
 
     def __read_todo_lists(self) -> Dict[str, TodoList]:
 
         try:
             result : Dict[str, TodoList] = {}
-            list_names = os.listdir(self.config.get_lists_dir())
-            todo_id = 1
-            for current_list in list_names:
+            todos : Dict[str, List[TodoModel]] = {}
 
-                todo_files = os.listdir(os.path.join(self.config.get_lists_dir(), current_list))
-                todo_list : List[TodoModel] = []
+            def add_file(list_name : str, todo_file : str, state : FileState, data : bytes) -> None:
+                todos.setdefault(list_name, []).extend(self.__add_file(list_name, todo_file, state, data))
 
-                for todo_file in todo_files:
-                    ical_file = open(os.path.join(self.config.get_lists_dir(), current_list, todo_file), 'r')
-                    calendar = icalendar.Calendar.from_ical(ical_file.read())
+            self.file_stats = self.storage.load(add_file)
 
-                    for todo in calendar.walk('vtodo'):
+            for current_list in self.file_stats:
+                todo_list = todos.get(current_list, [])
+                self.file_uids.setdefault(current_list, {})
+                self.file_states.setdefault(current_list, {})
 
-                        wrapped_todo = TodoModel(self.config, todo)
-                        # Add context information to be used for filtering etc.
-                        wrapped_todo.set_context('list', current_list)
-                        wrapped_todo.set_context('id', todo_id)
-                        todo_id += 1
+                # Enumerate todos in the order of their UIDs, so that the ID
+                # of a new todo can be determined without reading the lists again.
+                todo_list.sort(key=lambda item: item.get_string('uid'))
+                result[current_list] = TodoList(self.config, current_list, todo_list, self.file_states[current_list], self.storage)
 
-                        todo_list.append(wrapped_todo)
+        except OSError as err:
+            raise TodoDatabaseAccessError(self.config.get_lists_dir()) from err
 
-                    ical_file.close()
+        return result
 
-                result[current_list] = TodoList(self.config, current_list, todo_list)
+    def __assign_ids(self) -> None:
+
+        self.ids_version += 1
+        if self.stable_ids:
+            next_id = max(self.ids.values(), default=0) + 1
+            for todo_list in self.lists.values():
+                for todo in todo_list.todos:
+                    uid = todo.get_string('uid')
+                    if uid not in self.ids:
+                        self.ids[uid] = next_id
+                        next_id += 1
+                    todo.set_context('id', self.ids[uid])
+            return
+
+        todo_id = 1
+        for todo_list in self.lists.values():
+            for todo in todo_list.todos:
+                todo.set_context('id', todo_id)
+                todo_id += 1
+
+    @contextlib.contextmanager
+    def write(self) -> Iterator['TodoDatabase']:
+        """Serializes changes of the database made from several threads.
+        Changes made within the outermost block become visible to readers of
+        snapshots at once when the block ends. All methods changing the
+        database use it, but changes made through a TodoList need to be
+        enclosed in it explicitly."""
+
+        with self.lock:
+            self.write_depth += 1
+            try:
+                yield self
+            finally:
+                self.write_depth -= 1
+                if self.write_depth == 0 and self.current_snapshot is not None:
+                    self.__publish()
+
+    def snapshot(self) -> TodoSnapshot:
+        """Returns the todos as of the last completed change, without locking."""
+
+        snapshot = self.current_snapshot
+        if snapshot is None:
+            with self.lock:
+                if self.current_snapshot is None:
+                    self.__publish()
+                snapshot = self.current_snapshot
+                assert snapshot is not None
+
+        return snapshot
+
+    def __publish(self) -> None:
+
+        # Only lists changed since the previous snapshot are copied, and of
+        # those only the todos that changed or got another ID.
+        lists : Dict[str, Tuple[TodoModel, ...]] = {}
+        for name, todo_list in self.lists.items():
+
+            changed_uids = todo_list.changed_uids
+            todo_list.changed_uids = set()
+
+            if (self.current_snapshot is not None
+                and name in self.snapshot_copies
+                and self.snapshot_generations[name] == (todo_list, todo_list.generation)
+                and self.snapshot_ids_version == self.ids_version):
+                lists[name] = self.current_snapshot.lists[name]
+                continue
+
+            old_copies = self.snapshot_copies.get(name, {})
+            new_copies : Dict[str, TodoModel] = {}
+            for todo in todo_list.todos:
+                uid = todo.get_string('uid')
+                todo_copy = old_copies.get(uid, None)
+                if todo_copy is None or uid in changed_uids or todo_copy.context != todo.context:
+                    todo_copy = todo.copy()
+                new_copies[uid] = todo_copy
+
+            self.snapshot_copies[name] = new_copies
+            self.snapshot_generations[name] = (todo_list, todo_list.generation)
+            lists[name] = tuple(new_copies.values())
+
+        for name in [name for name in self.snapshot_copies if name not in self.lists]:
+            del self.snapshot_copies[name]
+            del self.snapshot_generations[name]
+
+        self.snapshot_ids_version = self.ids_version
+        self.current_snapshot = TodoSnapshot(self.get_generation(), lists)
+
+    def refresh(self) -> bool:
+        """Updates the todos in memory with the lists and files that have been
+        added, modified or removed since they were read, e.g., by other
+        applications, only reading the files that changed. Returns whether
+        any todo changed."""
+
+        with self.write():
+            return self.__refresh()
+
+    def __refresh(self) -> bool:
+
+        try:
+            list_names = self.storage.list_names()
+            changed = False
+            changed_files : List[Tuple[str, str]] = []
+
+            for list_name in [name for name in self.lists if name not in list_names]:
+                for uids in self.file_uids[list_name].values():
+                    self.uids.difference_update(uids)
+                del self.lists[list_name]
+                del self.file_stats[list_name]
+                del self.file_uids[list_name]
+                del self.file_states[list_name]
+                changed = True
+
+            for list_name in list_names:
+                if list_name not in self.lists:
+                    self.file_stats[list_name] = {}
+                    self.file_uids[list_name] = {}
+                    self.file_states[list_name] = {}
+                    self.lists[list_name] = TodoList(self.config, list_name, [], self.file_states[list_name], self.storage)
+                    changed = True
+
+                todo_list = self.lists[list_name]
+                old_stats = self.file_stats[list_name]
+                new_stats = self.storage.scan_list(list_name)
+
+                for todo_file in old_stats.keys() | new_stats.keys():
+                    if old_stats.get(todo_file) == new_stats.get(todo_file):
+                        continue
+
+                    for uid in self.file_uids[list_name].pop(todo_file, []):
+                        todo_list.remove(uid)
+                        self.uids.discard(uid)
+                    self.file_states[list_name].pop(todo_file, None)
+
+                    if todo_file in new_stats:
+                        changed_files.append((list_name, todo_file))
+
+                    changed = True
+
+                self.file_stats[list_name] = new_stats
+
+            for list_name, todos in self.__read_files(changed_files).items():
+                todo_list = self.lists[list_name]
+                for todo in todos:
+                    todo_list.remove(todo.get_string('uid'))
+                    todo_list.insert(todo)
 
-        except FileNotFoundError as err:
-            raise TodoDatabaseAccessError(self.config.get_lists_dir()) from err
         except OSError as err:
             raise TodoDatabaseAccessError(self.config.get_lists_dir()) from err
 
-        return result
+        if changed:
+            self.lists = dict(sorted(self.lists.items()))
+            self.modification_index = None
+            self.generation += 1
+            self.__assign_ids()
+
+        return changed
+
+    def get_generation(self) -> int:
+        """Returns a number that increases whenever the todos are changed
+        through this database."""
+        return self.generation + sum(todo_list.generation for todo_list in self.lists.values())
 
     def list_exists(self, calendar : str) -> bool:
         return calendar in self.lists
@@ -158,19 +662,90 @@ class TodoDatabase:
 
     def add_list(self, name : str) -> None:
 
-        list_path = os.path.join(self.config.get_lists_dir(), name)
-        if not os.path.exists(list_path):
-            os.mkdir(list_path)
-        else:
-            raise InvalidTodolistError(list_path)
+        with self.write():
+            if not self.storage.list_exists(name):
+                counters = StatusCounters(self.config)
+                counters_valid = self.storage.PERSISTENT and counters.is_root_valid()
+                self.storage.add_list(name)
+                if self.storage.PERSISTENT:
+                    counters.record_list_added(name, counters_valid)
+                self.generation += 1
+
+                self.file_stats[name] = {}
+                self.file_uids[name] = {}
+                self.file_states[name] = {}
+                todo_list = TodoList(self.config, name, [], self.file_states[name], self.storage)
+                if self.in_transaction:
+                    todo_list.begin()
+                self.lists[name] = todo_list
+                self.lists = dict(sorted(self.lists.items()))
+            else:
+                raise InvalidTodolistError(os.path.join(self.config.get_lists_dir(), name))
 
     def delete_list(self, name: str) -> None:
 
-        list_path = os.path.join(self.config.get_lists_dir(), name)
-        if os.path.exists(list_path):
-            rmtree(list_path)
-        else:
-            raise InvalidTodolistError(list_path)
+        with self.write():
+            if self.storage.list_exists(name):
+                # Changes to the list must not be stored after it has been removed
+                if self.list_exists(name):
+                    self.lists[name].pending = None
+
+                persistent = self.storage.PERSISTENT
+                counters = StatusCounters(self.config)
+                counters_valid = persistent and counters.is_root_valid()
+                self.storage.delete_list(name)
+                if persistent:
+                    counters.record_list_deleted(name, counters_valid)
+                self.generation += 1
+
+                if self.list_exists(name):
+                    journal = ChangeJournal(self.config)
+                    for todo in self.lists[name].todos:
+                        if persistent:
+                            journal.record(ChangeJournal.DELETE, name, todo.get_string('uid'))
+                        self.uids.discard(todo.get_string('uid'))
+
+                    del self.lists[name]
+                    del self.file_stats[name]
+                    del self.file_uids[name]
+                    del self.file_states[name]
+                    self.modification_index = None
+                    self.__assign_ids()
+            else:
+                raise InvalidTodolistError(os.path.join(self.config.get_lists_dir(), name))
+
+    def begin(self) -> None:
+        """Defers storing changes of todos until commit is called, so that
+        each todo changed several times is only written once."""
+
+        with self.write():
+            self.in_transaction = True
+            for todo_list in self.lists.values():
+                todo_list.begin()
+
+    def commit(self) -> None:
+        """Stores all changes deferred since begin was called. The changes
+        of all lists are stored even if storing the ones of a list fails, and
+        the conflicts of all lists are reported by one WriteConflictError."""
+
+        with self.write():
+            self.in_transaction = False
+            conflicts : Dict[str, List[str]] = {}
+            error : Optional[Exception] = None
+            for todo_list in self.lists.values():
+                try:
+                    todo_list.commit()
+                except WriteConflictError as err:
+                    conflicts.update(err.conflicts)
+                except Exception as err:
+                    if error is None:
+                        error = err
+
+            if error is not None:
+                raise error
+
+            if len(conflicts) > 0:
+                raise WriteConflictError(conflicts)
 
     def get_list(self, name : str) -> TodoList:
 
@@ -186,21 +761,14 @@ class TodoDatabase:
         return uid
 
     def is_unique_uid(self, uid : str) -> bool:
-
-        result = True
-        todos = self.get_todos()
-
-        for todo in todos:
-            if todo.get_string('uid') == uid:
-                result = False
-                break
-
-        return result
+        return uid not in self.uids
 
     def create_todo(self) -> icalendar.Todo:
         todo = icalendar.Todo()
 
-        uid = self.get_unused_uid()
+        with self.lock:
+            uid = self.get_unused_uid()
+            self.uids.add(uid)
         todo.add('uid', uid)
         now = datetime.datetime.now(tz.gettz())
         todo.add('dtstamp', now, encode=True)
@@ -208,18 +776,128 @@ class TodoDatabase:
 
         return todo
 
+    def add_todos(self, list_name : str, todos : List[TodoModel]) -> None:
+        """Stores the given todos in a list and assigns the IDs
+        they would get when the lists are read anew."""
+
+        with self.write():
+            # The todos are stored at once, unless a transaction is pending
+            todo_list = self.get_list(list_name)
+            deferred = todo_list.pending is None
+            if deferred:
+                todo_list.begin()
+            try:
+                for todo in todos:
+                    todo_list.add(todo.get_ical_todo(), todo)
+            finally:
+                if deferred:
+                    todo_list.commit()
+
+            self.modification_index = None
+            self.__assign_ids()
+
     def move_todo(self, uid : str, source : str, destination : str) -> None:
 
-        src_path = os.path.join(self.config.get_lists_dir(),source,uid + ".ics")
-        dst_path = os.path.join(self.config.get_lists_dir(),destination,uid + ".ics")
-        os.rename(src_path, dst_path)
+        with self.write():
+            persistent = self.storage.PERSISTENT
+            counters = StatusCounters(self.config)
+            counters_valid = persistent and counters.is_list_valid(source) and counters.is_list_valid(destination)
+
+            self.storage.move_item(uid + ".ics", source, destination)
+
+            if persistent:
+                counters.record_move(source, destination, uid, counters_valid)
+
+    def rebuild_counters(self) -> None:
+        """Replaces the status counters by the ones of the todos read by this database."""
+
+        facts : Dict[str, Dict[str, TodoFacts]] = {}
+        for list_name, todo_list in self.lists.items():
+            facts[list_name] = {todo.get_string('uid') : get_counter_facts(todo) for todo in todo_list.todos}
+
+        StatusCounters(self.config).rebuild(facts)
+
+    def rebuild_report(self, report_name : str) -> None:
+        """Recomputes the stored todos of a materialized report from the todos read by this database."""
+
+        MaterializedReports(self.config).rebuild(report_name, {name : todo_list.todos for name, todo_list in self.lists.items()})
+
+    def get_aggregator(self) -> 'TodoAggregator':
+        """Returns the aggregator of this database, which keeps its counts
+        for as long as the database lives and the todos do not change."""
+
+        if self.aggregator is None:
+            from icalwarrior.model.statistics import TodoAggregator
+            self.aggregator = TodoAggregator(self)
+        return self.aggregator
+
+    def iter_todos(self, constraint_evaluator : Optional[ConstraintEvaluator] = None) -> Iterator[TodoModel]:
+
+        for todo_list in self.lists.values():
+            yield from todo_list.iter_todos(constraint_evaluator)
 
     def get_todos(self, constraint_evaluator : Optional[ConstraintEvaluator] = None) -> List[TodoModel]:
+        return list(self.iter_todos(constraint_evaluator))
+
+    def __get_modification_index(self) -> List[Tuple[float, str, TodoModel]]:
+
+        if self.modification_index is None:
+            self.modification_index = []
+            for todo in self.iter_todos():
+                timestamp = 0.0
+                if todo.has_property('last-modified'):
+                    timestamp = todo.get_timestamp('last-modified')
+                elif todo.has_property('created'):
+                    timestamp = todo.get_timestamp('created')
+                self.modification_index.append((timestamp, todo.get_string('uid'), todo))
+
+            self.modification_index.sort(key=lambda entry: entry[0])
+
+        return self.modification_index
+
+    def get_modified_since(self, timestamp : float) -> List[TodoModel]:
+        """Returns all todos created or modified at or after the given time."""
 
-        result : List[TodoModel] = []
+        index = self.__get_modification_index()
+        start = bisect.bisect_left(index, timestamp, key=lambda entry: entry[0])
+        return [entry[2] for entry in index[start:]]
 
-        for _, todo_list in self.lists.items():
+    def get_changes(self,
+                    timestamp : float,
+                    journal_entries : List[Dict[str, Any]],
+                    constraint_evaluator : Optional[ConstraintEvaluator] = None) -> List[Change]:
+        """Determines the todos that have been created, modified or deleted since the given time.
 
-            result = result + todo_list.get_todos(constraint_evaluator)
+        Todos are considered as changed if their modification date is not before
+        the given time or if they are referenced by one of the given journal entries.
+        Deletions are only known from the journal and cannot be filtered by constraints."""
 
-        return result
\ No newline at end of file
+        changed : Dict[str, TodoModel] = {}
+        for todo in self.get_modified_since(timestamp):
+            changed[todo.get_string('uid')] = todo
+
+        deleted : Dict[str, str] = {}
+        journaled_uids = set(entry['uid'] for entry in journal_entries)
+        if len(journaled_uids) > 0:
+            for _, uid, todo in self.__get_modification_index():
+                if uid in journaled_uids:
+                    changed[uid] = todo
+
+        for entry in journal_entries:
+            if entry['operation'] == ChangeJournal.DELETE and entry['uid'] not in self.uids:
+                deleted[entry['uid']] = entry['list']
+
+        result : List[Change] = []
+        for uid, list_name in deleted.items():
+            result.append(Change(Change.DELETE, list_name, uid, None))
+
+        for uid, todo in changed.items():
+            if constraint_evaluator is not None and not constraint_evaluator.satisfies_constraints(todo):
+                continue
+
+            operation = Change.UPDATE
+            if todo.has_property('created') and todo.get_timestamp('created') >= timestamp:
+                operation = Change.CREATE
+            result.append(Change(operation, str(todo.get_context('list')), uid, todo))
+
+        return result
@@ -0,0 +1,122 @@
+# SPDX-FileCopyrightText: 2022 Martin Byrenheid <martin@byrenheid.net>
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+from typing import List, Dict, Optional, Any, Tuple
+import json
+import os
+import os.path
+
+from icalwarrior.configuration import Configuration
+
+# Modification time, size, digest and content of a cached todo file
+CachedFile = Tuple[int, int, str, bytes]
+
+class LoadCache:
+    """Keeps the content of the todo files in the state directory, along with
+    the modification time and size of each file and list directory, so that
+    files on slow file systems, e.g., network file systems, need not be
+    opened again as long as they are unchanged.
+
+    With the 'verify' policy, the files of each list are still listed and
+    their modification times compared, but only changed files are read. With
+    the 'trust' policy, lists whose directory has the modification time
+    recorded in the cache are not listed at all, and neither is the lists
+    directory. This requires other applications to add, replace or remove
+    files instead of modifying them in place, as vdirsyncer does."""
+
+    OFF = "off"
+    VERIFY = "verify"
+    TRUST = "trust"
+
+    # Incremented whenever the format of the cache changes
+    VERSION = 1
+
+    def __init__(self, config : Configuration) -> None:
+        self.lists_dir = config.get_lists_dir()
+        self.policy = config.get_load_cache_policy()
+        self.path = os.path.join(config.get_state_dir(), "load-cache")
+
+    @staticmethod
+    def __write_json(path : str, data : Any) -> None:
+
+        # The cache is an optimization only, so that failing
+        # to write it must not fail the command.
+        tmp_path = path + "." + str(os.getpid()) + ".tmp"
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(tmp_path, 'w') as handle:
+                json.dump(data, handle)
+            os.replace(tmp_path, path)
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def __read_json(self, path : str) -> Optional[Dict[str, Any]]:
+
+        try:
+            with open(path, 'r') as handle:
+                data = json.load(handle)
+        except (OSError, ValueError):
+            return None
+
+        if not isinstance(data, dict) or data.get('version', None) != LoadCache.VERSION or data.get('lists_dir', None) != self.lists_dir:
+            return None
+
+        return data
+
+    def __list_path(self, list_name : str) -> str:
+        return os.path.join(self.path, "lists", list_name + ".json")
+
+    def get_list_names(self) -> List[str]:
+        """Returns the names of the lists in sorted order, only listing
+        the lists directory if it changed and the cache is not trusted."""
+
+        if self.policy != LoadCache.TRUST:
+            return sorted(os.listdir(self.lists_dir))
+
+        # Determined before listing, so that changes made while
+        # listing cause the directory to be listed next time.
+        index_path = os.path.join(self.path, "index.json")
+        mtime = os.stat(self.lists_dir).st_mtime_ns
+        index = self.__read_json(index_path)
+        if index is not None and index['mtime'] == mtime:
+            list_names : List[str] = index['lists']
+            return list_names
+
+        list_names = sorted(os.listdir(self.lists_dir))
+        self.__write_json(index_path, {'version' : LoadCache.VERSION, 'lists_dir' : self.lists_dir, 'mtime' : mtime, 'lists' : list_names})
+        return list_names
+
+    def get_list_mtime(self, list_name : str) -> int:
+        return os.stat(os.path.join(self.lists_dir, list_name)).st_mtime_ns
+
+    def read_list(self, list_name : str) -> Tuple[Optional[int], Dict[str, CachedFile]]:
+        """Returns the modification time of a list directory as recorded in
+        the cache and the cached files of the list."""
+
+        data = self.__read_json(self.__list_path(list_name))
+        if data is None:
+            return (None, {})
+
+        # The content is stored as text, keeping bytes
+        # that are not valid UTF-8 as surrogates.
+        files : Dict[str, CachedFile] = {}
+        for file_name, (mtime, size, digest, content) in data['files'].items():
+            files[file_name] = (mtime, size, digest, content.encode('utf-8', 'surrogateescape'))
+
+        return (data['mtime'], files)
+
+    def is_list_trusted(self, list_mtime : Optional[int], current_mtime : int) -> bool:
+        """Tells whether the files of a list can be taken from the cache without listing them."""
+        return self.policy == LoadCache.TRUST and list_mtime == current_mtime
+
+    def write_list(self, list_name : str, list_mtime : int, files : Dict[str, CachedFile]) -> None:
+
+        self.__write_json(self.__list_path(list_name), {
+            'version' : LoadCache.VERSION,
+            'lists_dir' : self.lists_dir,
+            'mtime' : list_mtime,
+            'files' : {file_name : [mtime, size, digest, content.decode('utf-8', 'surrogateescape')]
+                       for file_name, (mtime, size, digest, content) in files.items()}
+        })
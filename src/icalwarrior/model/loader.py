@@ -0,0 +1,56 @@
+# SPDX-FileCopyrightText: 2022 Martin Byrenheid <martin@byrenheid.net>
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+from typing import List, Tuple, Callable, Set, Dict, Any
+import os
+
+FileHandler = Callable[[int, os.stat_result, bytes], None]
+
+def read_file(path : str) -> Tuple[os.stat_result, bytes]:
+    """Returns the status and the content of a file, as of the same time."""
+
+    with open(path, 'rb') as file_handle:
+        return (os.fstat(file_handle.fileno()), file_handle.read())
+
+def load_files(paths : List[str], concurrency : int, handle : FileHandler) -> None:
+    """Reads the given files and passes the index, status and content of
+    each file to handle, in the order in which the files have been read.
+
+    With a concurrency above one, up to that many files are read at a time
+    by a pool of threads, while the files already read are handled by the
+    calling thread. This only pays off if opening and reading a file takes
+    long compared to handling it, e.g., on a network file system."""
+
+    if concurrency <= 1 or len(paths) <= 1:
+        for index, path in enumerate(paths):
+            stat, data = read_file(path)
+            handle(index, stat, data)
+        return
+
+    # Only imported when actually needed, as it takes a while
+    import asyncio
+    asyncio.run(load_files_async(paths, concurrency, handle))
+
+async def load_files_async(paths : List[str], concurrency : int, handle : FileHandler) -> None:
+
+    import asyncio
+    from concurrent.futures import ThreadPoolExecutor
+
+    loop = asyncio.get_running_loop()
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="icalwarrior-reader") as executor:
+        indices : Dict[Any, int] = {}
+        for index, path in enumerate(paths):
+            indices[loop.run_in_executor(executor, read_file, path)] = index
+
+        pending : Set[Any] = set(indices.keys())
+        try:
+            while len(pending) > 0:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for future in done:
+                    stat, data = future.result()
+                    handle(indices[future], stat, data)
+        finally:
+            # Files not read yet are not needed after an error
+            for future in pending:
+                future.cancel()
@@ -0,0 +1,68 @@
+# SPDX-FileCopyrightText: 2022 Martin Byrenheid <martin@byrenheid.net>
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+from typing import Optional, TextIO, Any
+import os
+import os.path
+import time
+
+from icalwarrior.configuration import Configuration
+
+class ListLockedError(Exception):
+
+    def __init__(self, list_name : str) -> None:
+        self.list_name = list_name
+
+    def __str__(self) -> str:
+        return "Todo list " + self.list_name + " is locked by another process. Please try again later."
+
+class ListLock:
+    """Advisory lock of a todo list, which icalwarrior holds while writing
+    to the list, so that several icalwarrior processes writing to the same
+    list do not interleave. Reading a list never requires its lock.
+
+    The lock is a file in the state directory locked via flock, which is
+    released by the operating system if the process ends. Other
+    applications, such as vdirsyncer, do not take the lock. On platforms
+    without flock, locking is skipped."""
+
+    TIMEOUT = 10.0
+    RETRY_INTERVAL = 0.05
+
+    def __init__(self, config : Configuration, list_name : str, timeout : float = TIMEOUT) -> None:
+        self.list_name = list_name
+        self.path = os.path.join(config.get_state_dir(), "locks", list_name + ".lock")
+        self.timeout = timeout
+        self.handle : Optional[TextIO] = None
+
+    def __enter__(self) -> 'ListLock':
+
+        try:
+            import fcntl
+        except ImportError:
+            return self
+
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        handle = open(self.path, 'a')
+        deadline = time.monotonic() + self.timeout
+        while True:
+            try:
+                fcntl.flock(handle.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                break
+            except BlockingIOError as err:
+                if time.monotonic() >= deadline:
+                    handle.close()
+                    raise ListLockedError(self.list_name) from err
+                time.sleep(ListLock.RETRY_INTERVAL)
+
+        self.handle = handle
+        return self
+
+    def __exit__(self, *args : Any) -> None:
+
+        if self.handle is not None:
+            import fcntl
+            fcntl.flock(self.handle.fileno(), fcntl.LOCK_UN)
+            self.handle.close()
+            self.handle = None
@@ -0,0 +1,212 @@
+# SPDX-FileCopyrightText: 2022 Martin Byrenheid <martin@byrenheid.net>
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+from typing import List, Dict, Optional, Any, Tuple
+import bisect
+import heapq
+import io
+
+import icalendar
+
+from icalwarrior.configuration import Configuration
+from icalwarrior.model.items import TodoModel
+from icalwarrior.model.lists import parse_todos
+from icalwarrior.model.storage import create_storage
+from icalwarrior.filtering.constraints import ConstraintEvaluator
+from icalwarrior.view.formatter import StringFormatter
+from icalwarrior.view.exporter import Exporter
+from icalwarrior.view.sorter import ToDoSorter
+
+class UnsupportedParallelQueryError(Exception):
+
+    def __init__(self, prop : str) -> None:
+        self.prop = prop
+
+    def __str__(self) -> str:
+        return "Queries referring to \"" + self.prop + "\" cannot be run in parallel, as it depends on all todo lists."
+
+# A todo matching a query, given by its sort key, list, UID and either
+# its exported record or its serialized iCalendar representation
+Match = Tuple[Tuple[Any, ...], str, str, Any]
+
+def query_shard(config : Configuration,
+                files : List[Tuple[str, str]],
+                constraints : List[str],
+                fields : Optional[List[str]],
+                sort_keys : Optional[str],
+                missing : str,
+                limit : Optional[int],
+                after : Optional[str]) -> Dict[str, Any]:
+    """Reads the given files in a worker process and returns the number of
+    todos matching the constraints, the UIDs of all todos per list as
+    needed to derive IDs, and the matching todos.
+
+    Without sort keys, the record of each matching todo is returned, limited
+    to the given fields. With sort keys, only the first limit todos
+    following the cursor are returned, as serialized iCalendar todos."""
+
+    evaluator = None
+    if len(constraints) > 0:
+        evaluator = ConstraintEvaluator.from_string_list(config, constraints)
+
+    storage = create_storage(config)
+    uids : Dict[str, List[str]] = {}
+    matching : List[TodoModel] = []
+    for list_name, file_name in files:
+        for todo in parse_todos(config, list_name, storage.read_item(list_name, file_name)):
+            uids.setdefault(list_name, []).append(todo.get_string('uid'))
+            if evaluator is None or evaluator.satisfies_constraints(todo):
+                matching.append(todo)
+
+    matches : List[Match] = []
+    remaining = len(matching)
+    if sort_keys is None:
+        # IDs are only known to the calling process, which replaces them
+        for todo in matching:
+            todo.set_context('id', 0)
+        records = Exporter(StringFormatter(config), fields, io.StringIO()).records(matching)
+        for todo, record in zip(matching, records):
+            matches.append(((), str(todo.get_context('list')), todo.get_string('uid'), record))
+    else:
+        sorter = ToDoSorter(matching, sort_keys, limit, missing, 0, after)
+        for todo in sorter.get_sorted()[0:limit]:
+            matches.append((sorter.get_key(todo), str(todo.get_context('list')), todo.get_string('uid'),
+                            todo.get_ical_todo().to_ical()))
+        remaining = sorter.remaining
+
+    return {'count' : len(matching), 'remaining' : remaining, 'uids' : uids, 'matches' : matches}
+
+class ParallelQuery:
+    """Runs a query against all todo lists in worker processes, each of
+    which reads a shard of the todo files, filters them and only sends back
+    what the query asks for, e.g., the exported fields of the matching todos
+    or the first todos of a report, which the calling process merges.
+
+    The IDs of the matching todos are derived from the UIDs of all todos,
+    so constraints and sort keys referring to IDs are not supported. Each
+    worker accesses the storage backend on its own, which therefore needs
+    to be persistent."""
+
+    # Number of shards per worker, so that workers finishing
+    # early can take over shards of others.
+    SHARDS_PER_JOB = 4
+
+    def __init__(self, config : Configuration, jobs : int) -> None:
+        self.config = config
+        self.jobs = max(jobs, 1)
+        self.storage = create_storage(config)
+
+        # Total number of matching todos, number of matching todos following
+        # the offset or cursor and the cursor of the last todo, as of the last query
+        self.total = 0
+        self.remaining = 0
+        self.cursor = ""
+
+        self.list_ids : Dict[str, Tuple[int, List[str]]] = {}
+
+    @staticmethod
+    def check_supported(config : Configuration, constraints : List[str], sort_keys : Optional[str] = None) -> None:
+        """Raises an UnsupportedParallelQueryError if the query cannot be run in parallel."""
+
+        if len(constraints) > 0:
+            for prop in ConstraintEvaluator.from_string_list(config, constraints).get_property_names():
+                if prop == 'id':
+                    raise UnsupportedParallelQueryError(prop)
+
+        if sort_keys is not None:
+            for prop, _ in ToDoSorter([], sort_keys).keys:
+                if prop == 'id':
+                    raise UnsupportedParallelQueryError(prop)
+
+    def get_list_names(self) -> List[str]:
+        return self.storage.list_names()
+
+    def __get_shards(self) -> List[List[Tuple[str, str]]]:
+
+        self.list_ids = {}
+        files : List[Tuple[str, str]] = []
+        for list_name in self.get_list_names():
+            self.list_ids[list_name] = (0, [])
+            files.extend((list_name, file_name) for file_name in self.storage.scan_list(list_name))
+
+        num_shards = min(len(files), self.jobs * ParallelQuery.SHARDS_PER_JOB)
+        return [files[index::num_shards] for index in range(num_shards)]
+
+    def __run(self, *args : Any) -> List[Dict[str, Any]]:
+
+        shards = self.__get_shards()
+        if self.jobs == 1 or len(shards) <= 1:
+            results = [query_shard(self.config, shard, *args) for shard in shards]
+        else:
+            from concurrent.futures import ProcessPoolExecutor
+            with ProcessPoolExecutor(max_workers=self.jobs) as executor:
+                futures = [executor.submit(query_shard, self.config, shard, *args) for shard in shards]
+                results = [future.result() for future in futures]
+
+        # Todos are enumerated in the order of their lists and UIDs
+        uids : Dict[str, List[str]] = {list_name : [] for list_name in self.list_ids}
+        for result in results:
+            for list_name, list_uids in result['uids'].items():
+                uids[list_name].extend(list_uids)
+
+        first_id = 1
+        for list_name, list_uids in uids.items():
+            list_uids.sort()
+            self.list_ids[list_name] = (first_id, list_uids)
+            first_id += len(list_uids)
+
+        self.total = sum(result['count'] for result in results)
+        self.remaining = sum(result['remaining'] for result in results)
+        return results
+
+    def get_id(self, list_name : str, uid : str) -> int:
+
+        first_id, uids = self.list_ids[list_name]
+        return first_id + bisect.bisect_left(uids, uid)
+
+    def select_records(self, constraints : List[str], fields : Optional[List[str]]) -> List[Dict[str, str]]:
+        """Returns the exported records of the todos matching the constraints,
+        in the order of their lists and UIDs, as TodoDatabase.iter_todos does."""
+
+        results = self.__run(constraints, fields, None, "last", None, None)
+        matches = sorted((match for result in results for match in result['matches']), key=lambda match: (match[1], match[2]))
+
+        records = []
+        for _, list_name, uid, record in matches:
+            if 'id' in record:
+                record['id'] = str(self.get_id(list_name, uid))
+            records.append(record)
+
+        return records
+
+    def select_todos(self,
+                     constraints : List[str],
+                     sort_keys : str,
+                     missing : str = "last",
+                     limit : Optional[int] = None,
+                     offset : int = 0,
+                     after : Optional[str] = None) -> List[TodoModel]:
+        """Returns the todos matching the constraints as sorted by ToDoSorter,
+        restricted to the window given by limit, offset and cursor."""
+
+        window = None if limit is None else offset + limit
+        results = self.__run(constraints, None, sort_keys, missing, window, after)
+        self.remaining = max(self.remaining - offset, 0)
+
+        # Each shard is sorted already. Todos with the same key, UID and
+        # list are kept in the order of their shards, as the data of their
+        # files must not decide it.
+        merged = heapq.merge(*[[(key, uid, list_name, data) for key, list_name, uid, data in result['matches']]
+                               for result in results], key=lambda match: match[0:3])
+
+        todos = []
+        self.cursor = ""
+        for key, uid, list_name, data in list(merged)[offset:window]:
+            todo = TodoModel(self.config, icalendar.Todo.from_ical(data))
+            todo.set_context('list', list_name)
+            todo.set_context('id', self.get_id(list_name, uid))
+            todos.append(todo)
+            self.cursor = ToDoSorter.make_cursor(ToDoSorter.encode_key(key), uid)
+
+        return todos
@@ -0,0 +1,121 @@
+# SPDX-FileCopyrightText: 2022 Martin Byrenheid <martin@byrenheid.net>
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+from typing import List, Dict, Tuple, Callable
+import datetime
+import itertools
+import dateutil.tz as tz
+
+from icalwarrior.model.items import TodoModel
+from icalwarrior.model.lists import TodoDatabase
+import icalwarrior.constants as constants
+
+class UnknownGroupError(Exception):
+
+    def __init__(self, group : str) -> None:
+        self.group = group
+
+    def __str__(self) -> str:
+        return "Unknown group \"" + self.group + "\". Supported groups are " + ", ".join(TodoAggregator.GROUPS)
+
+GroupKey = Tuple[str, ...]
+
+class TodoAggregator:
+    """Counts the todos of each list, grouped by any combination of
+    their status, priority, categories and due date.
+
+    The counts are computed in a single pass over all todos and are kept
+    until the todos in the database change or the day changes, as the due
+    date buckets are relative to the current date. Use
+    TodoDatabase.get_aggregator to share the counts between queries."""
+
+    GROUPS = constants.AGGREGATION_GROUPS
+
+    NONE = "none"
+
+    DUE_OVERDUE = "overdue"
+    DUE_TODAY = "today"
+    DUE_THIS_WEEK = "this week"
+    DUE_LATER = "later"
+
+    DUE_BUCKETS = [DUE_OVERDUE, DUE_TODAY, DUE_THIS_WEEK, DUE_LATER, NONE]
+
+    def __init__(self, cal_db : TodoDatabase) -> None:
+        self.cal_db = cal_db
+        self.results : Dict[Tuple[int, datetime.date, GroupKey], Dict[GroupKey, int]] = {}
+
+    def __status(self, todo : TodoModel) -> List[str]:
+        return [todo.get_string('status').lower()]
+
+    def __priority(self, todo : TodoModel) -> List[str]:
+        if not todo.has_property('priority'):
+            return [TodoAggregator.NONE]
+        return [str(todo.get_int('priority'))]
+
+    def __categories(self, todo : TodoModel) -> List[str]:
+        # A todo is counted once for each of its categories
+        if not todo.has_property('categories') or len(todo.get_categories()) == 0:
+            return [TodoAggregator.NONE]
+        return [str(c) for c in todo.get_categories()]
+
+    def __due_bucket(self, todo : TodoModel, today : datetime.date) -> List[str]:
+
+        if not todo.has_property('due'):
+            return [TodoAggregator.NONE]
+
+        due = todo.get_date_or_datetime('due')
+        if isinstance(due, datetime.datetime):
+            if due.tzinfo is not None:
+                due = due.astimezone(tz.gettz())
+            due = due.date()
+
+        # Weeks end on Sunday
+        end_of_week = today + datetime.timedelta(days=6 - today.weekday())
+
+        if due < today:
+            return [TodoAggregator.DUE_OVERDUE]
+        if due == today:
+            return [TodoAggregator.DUE_TODAY]
+        if due <= end_of_week:
+            return [TodoAggregator.DUE_THIS_WEEK]
+        return [TodoAggregator.DUE_LATER]
+
+    def aggregate(self, group_by : List[str]) -> Dict[GroupKey, int]:
+        """Returns the number of todos for each combination of a list
+        name and the values of the given groups."""
+
+        for group in group_by:
+            if group not in TodoAggregator.GROUPS:
+                raise UnknownGroupError(group)
+
+        today = datetime.date.today()
+        cache_key = (self.cal_db.get_generation(), today, tuple(group_by))
+        if cache_key in self.results:
+            return self.results[cache_key]
+
+        extractors : Dict[str, Callable[[TodoModel], List[str]]] = {
+            'status' : self.__status,
+            'priority' : self.__priority,
+            'category' : self.__categories,
+            'due' : lambda todo: self.__due_bucket(todo, today)
+        }
+        group_extractors = [extractors[group] for group in group_by]
+
+        result : Dict[GroupKey, int] = {}
+        for list_name in self.cal_db.get_list_names():
+
+            # Include lists without any todos
+            if len(group_by) == 0:
+                result[(list_name,)] = 0
+
+            for todo in self.cal_db.get_list(list_name).iter_todos():
+                values = [extract(todo) for extract in group_extractors]
+                for combination in itertools.product(*values):
+                    key = (list_name,) + combination
+                    result[key] = result.get(key, 0) + 1
+
+        # Only the counts of the current todos are kept, for any groups
+        self.results = {key : counts for key, counts in self.results.items() if key[0:2] == cache_key[0:2]}
+        self.results[cache_key] = result
+        return result
@@ -0,0 +1,338 @@
+# SPDX-FileCopyrightText: 2022 Martin Byrenheid <martin@byrenheid.net>
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+from typing import List, Dict, Optional, Tuple, Callable, ContextManager, Type
+from abc import ABC, abstractmethod
+import contextlib
+import hashlib
+import os
+import os.path
+from shutil import rmtree
+
+from icalwarrior.configuration import Configuration
+import icalwarrior.constants as constants
+from icalwarrior.model.locking import ListLock
+from icalwarrior.model.loader import load_files
+from icalwarrior.model.loadcache import LoadCache, CachedFile
+
+# Version of an item, e.g., the modification time of its file, and its size
+ItemStat = Tuple[int, int]
+
+# Version, size and digest of the content of an item
+FileState = Tuple[int, int, str]
+
+# Called with the list, name, state and content of each item read
+ItemHandler = Callable[[str, str, FileState, bytes], None]
+
+def get_digest(data : bytes) -> str:
+    return hashlib.sha1(data).hexdigest()
+
+class StorageBackend(ABC):
+    """Stores the todo lists, each of which holds items named after the UID
+    of their todo, e.g., "<uid>.ics", whose content is an iCalendar file.
+
+    TodoDatabase and TodoList access the todos through a backend only, so
+    that further backends can be added by implementing this class and
+    listing their NAME in constants.STORAGE_BACKENDS. Changes made by other
+    applications are detected by comparing the stats of the items, which
+    need to change whenever the content of an item changes.
+
+    Persistent backends also keep the journal, status counters and
+    materialized reports in the state directory."""
+
+    # Name by which the backend is selected in the configuration
+    NAME = ""
+
+    PERSISTENT = True
+
+    def __init__(self, config : Configuration) -> None:
+        self.config = config
+
+    @abstractmethod
+    def list_names(self) -> List[str]:
+        """Returns the names of all lists in sorted order."""
+
+    @abstractmethod
+    def scan_list(self, list_name : str) -> Dict[str, ItemStat]:
+        """Returns the stat of each item of a list."""
+
+    @abstractmethod
+    def stat_item(self, list_name : str, item_name : str) -> Optional[ItemStat]:
+        """Returns the stat of an item, or None if it does not exist."""
+
+    @abstractmethod
+    def read_item(self, list_name : str, item_name : str) -> bytes:
+        pass
+
+    @abstractmethod
+    def write_item(self, list_name : str, item_name : str, data : bytes) -> FileState:
+        """Replaces the content of an item at once, creating it if needed, and returns its new state."""
+
+    @abstractmethod
+    def delete_item(self, list_name : str, item_name : str) -> None:
+        """Deletes an item, if it exists."""
+
+    @abstractmethod
+    def move_item(self, item_name : str, source : str, destination : str) -> None:
+        pass
+
+    @abstractmethod
+    def add_list(self, list_name : str) -> None:
+        pass
+
+    @abstractmethod
+    def delete_list(self, list_name : str) -> None:
+        pass
+
+    def list_exists(self, list_name : str) -> bool:
+        return list_name in self.list_names()
+
+    def lock(self, list_name : str) -> ContextManager[object]:
+        """Returns a context manager that excludes other processes from
+        changing the given list, as far as the backend supports it."""
+
+        return contextlib.nullcontext()
+
+    def read_items(self, items : List[Tuple[str, str]], handle : ItemHandler) -> None:
+        """Reads the given items, each given by its list and name, and passes
+        each to handle, in no particular order."""
+
+        for list_name, item_name in items:
+            # Determined before reading, so that an item changed in between
+            # is not taken for having been changed by another application.
+            stat = self.stat_item(list_name, item_name)
+            if stat is None:
+                raise FileNotFoundError(item_name)
+            data = self.read_item(list_name, item_name)
+            handle(list_name, item_name, stat + (get_digest(data),), data)
+
+    def load(self, handle : ItemHandler) -> Dict[str, Dict[str, ItemStat]]:
+        """Reads all items of all lists, passing each to handle, and returns
+        the stat of each item per list."""
+
+        result : Dict[str, Dict[str, ItemStat]] = {}
+        items : List[Tuple[str, str]] = []
+        for list_name in self.list_names():
+            result[list_name] = self.scan_list(list_name)
+            items.extend((list_name, item_name) for item_name in result[list_name])
+
+        self.read_items(items, handle)
+        return result
+
+class VdirStorage(StorageBackend):
+    """Stores each list as a directory within the lists directory and each
+    todo as a file in it, as vdirsyncer does. Hidden files are ignored.
+
+    Files are read concurrently and taken from the load cache as
+    configured, and are written through temporary files, so that other
+    applications never read a partially written todo."""
+
+    NAME = "vdir"
+
+    def __init__(self, config : Configuration) -> None:
+        super().__init__(config)
+        self.lists_dir = config.get_lists_dir()
+
+    def __get_path(self, list_name : str, item_name : str = "") -> str:
+        return os.path.join(self.lists_dir, list_name, item_name)
+
+    def list_names(self) -> List[str]:
+        return sorted(os.listdir(self.lists_dir))
+
+    def list_exists(self, list_name : str) -> bool:
+        return os.path.exists(self.__get_path(list_name))
+
+    def scan_list(self, list_name : str) -> Dict[str, ItemStat]:
+
+        result : Dict[str, ItemStat] = {}
+        with os.scandir(self.__get_path(list_name)) as entries:
+            for entry in entries:
+                # Hidden files, e.g., files being written, are no todos
+                if entry.name.startswith("."):
+                    continue
+                stat = entry.stat()
+                result[entry.name] = (stat.st_mtime_ns, stat.st_size)
+
+        return result
+
+    def stat_item(self, list_name : str, item_name : str) -> Optional[ItemStat]:
+
+        try:
+            stat = os.stat(self.__get_path(list_name, item_name))
+        except FileNotFoundError:
+            return None
+
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def read_item(self, list_name : str, item_name : str) -> bytes:
+
+        with open(self.__get_path(list_name, item_name), 'rb') as item_file:
+            return item_file.read()
+
+    def read_items(self, items : List[Tuple[str, str]], handle : ItemHandler) -> None:
+
+        def handle_file(index : int, stat : os.stat_result, data : bytes) -> None:
+            list_name, item_name = items[index]
+            handle(list_name, item_name, (stat.st_mtime_ns, stat.st_size, get_digest(data)), data)
+
+        paths = [self.__get_path(list_name, item_name) for list_name, item_name in items]
+        load_files(paths, self.config.get_read_concurrency(), handle_file)
+
+    def write_item(self, list_name : str, item_name : str, data : bytes) -> FileState:
+
+        path = self.__get_path(list_name, item_name)
+        tmp_path = self.__get_path(list_name, "." + item_name + ".tmp")
+        with open(tmp_path, "wb") as file_handle:
+            file_handle.write(data)
+        os.replace(tmp_path, path)
+
+        stat = os.stat(path)
+        return (stat.st_mtime_ns, stat.st_size, get_digest(data))
+
+    def delete_item(self, list_name : str, item_name : str) -> None:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(self.__get_path(list_name, item_name))
+
+    def move_item(self, item_name : str, source : str, destination : str) -> None:
+        os.rename(self.__get_path(source, item_name), self.__get_path(destination, item_name))
+
+    def add_list(self, list_name : str) -> None:
+        os.mkdir(self.__get_path(list_name))
+
+    def delete_list(self, list_name : str) -> None:
+        rmtree(self.__get_path(list_name))
+
+    def lock(self, list_name : str) -> ContextManager[object]:
+        return ListLock(self.config, list_name)
+
+    def load(self, handle : ItemHandler) -> Dict[str, Dict[str, ItemStat]]:
+
+        if self.config.get_load_cache_policy() == LoadCache.OFF:
+            return super().load(handle)
+
+        cache = LoadCache(self.config)
+        result : Dict[str, Dict[str, ItemStat]] = {}
+        items : List[Tuple[str, str]] = []
+
+        # Lists whose cached files need to be updated, along with the
+        # modification time of their directory and their unchanged files
+        outdated_lists : Dict[str, Tuple[int, Dict[str, CachedFile]]] = {}
+        for list_name in cache.get_list_names():
+
+            list_mtime = cache.get_list_mtime(list_name)
+            cached_mtime, cached_files = cache.read_list(list_name)
+            if cache.is_list_trusted(cached_mtime, list_mtime):
+                result[list_name] = {item_name : cached[0:2] for item_name, cached in cached_files.items()}
+            else:
+                result[list_name] = self.scan_list(list_name)
+
+            unchanged_files : Dict[str, CachedFile] = {}
+            for item_name, stat in result[list_name].items():
+                cached = cached_files.get(item_name, None)
+                if cached is not None and cached[0:2] == stat:
+                    handle(list_name, item_name, cached[0:3], cached[3])
+                    unchanged_files[item_name] = cached
+                else:
+                    items.append((list_name, item_name))
+
+            if list_mtime != cached_mtime or len(unchanged_files) != len(cached_files) or len(unchanged_files) != len(result[list_name]):
+                outdated_lists[list_name] = (list_mtime, unchanged_files)
+
+        def handle_read(list_name : str, item_name : str, state : FileState, data : bytes) -> None:
+            handle(list_name, item_name, state, data)
+            if list_name in outdated_lists:
+                outdated_lists[list_name][1][item_name] = state + (data,)
+
+        self.read_items(items, handle_read)
+
+        for list_name, (list_mtime, files) in outdated_lists.items():
+            cache.write_list(list_name, list_mtime, files)
+
+        return result
+
+class MemoryStorage(StorageBackend):
+    """Keeps the todo lists in memory only, e.g., to measure the costs
+    of filtering, sorting and rendering todos in benchmarks and tests
+    without any file system access. The version of an item is a counter
+    incremented with every write.
+
+    The backend cannot be selected by the configuration, as each process
+    and each database would get lists of its own, but is passed to
+    TodoDatabase instead."""
+
+    NAME = "memory"
+
+    PERSISTENT = False
+
+    def __init__(self, config : Configuration) -> None:
+        super().__init__(config)
+        self.lists : Dict[str, Dict[str, Tuple[FileState, bytes]]] = {}
+        self.version = 0
+
+    def list_names(self) -> List[str]:
+        return sorted(self.lists.keys())
+
+    def __get_list(self, list_name : str) -> Dict[str, Tuple[FileState, bytes]]:
+
+        if list_name not in self.lists:
+            raise FileNotFoundError(list_name)
+
+        return self.lists[list_name]
+
+    def scan_list(self, list_name : str) -> Dict[str, ItemStat]:
+        return {item_name : state[0:2] for item_name, (state, _) in self.__get_list(list_name).items()}
+
+    def stat_item(self, list_name : str, item_name : str) -> Optional[ItemStat]:
+
+        item = self.__get_list(list_name).get(item_name, None)
+        if item is None:
+            return None
+
+        return item[0][0:2]
+
+    def read_item(self, list_name : str, item_name : str) -> bytes:
+
+        items = self.__get_list(list_name)
+        if item_name not in items:
+            raise FileNotFoundError(item_name)
+
+        return items[item_name][1]
+
+    def write_item(self, list_name : str, item_name : str, data : bytes) -> FileState:
+
+        self.version += 1
+        state = (self.version, len(data), get_digest(data))
+        self.__get_list(list_name)[item_name] = (state, data)
+        return state
+
+    def delete_item(self, list_name : str, item_name : str) -> None:
+        self.__get_list(list_name).pop(item_name, None)
+
+    def move_item(self, item_name : str, source : str, destination : str) -> None:
+
+        item = self.__get_list(source).pop(item_name)
+        self.__get_list(destination)[item_name] = item
+
+    def add_list(self, list_name : str) -> None:
+
+        if list_name in self.lists:
+            raise FileExistsError(list_name)
+
+        self.lists[list_name] = {}
+
+    def delete_list(self, list_name : str) -> None:
+
+        self.__get_list(list_name)
+        del self.lists[list_name]
+
+# Backends that can be selected by the configuration, derived from the
+# names listed in constants.STORAGE_BACKENDS
+BACKENDS : Dict[str, Type[StorageBackend]] = {backend.NAME : backend for backend in StorageBackend.__subclasses__()
+                                              if backend.NAME in constants.STORAGE_BACKENDS}
+assert sorted(BACKENDS.keys()) == sorted(constants.STORAGE_BACKENDS), "Unknown backend in constants.STORAGE_BACKENDS"
+
+def create_storage(config : Configuration) -> StorageBackend:
+    """Returns the storage backend selected by the configuration."""
+
+    return BACKENDS[config.get_storage_backend()](config)
@@ -0,0 +1,392 @@
+# SPDX-FileCopyrightText: 2022 Martin Byrenheid <martin@byrenheid.net>
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+from typing import List, Dict, Optional, Any, Tuple
+import bisect
+import datetime
+import json
+import os
+import os.path
+
+from icalwarrior.model.items import TodoModel
+from icalwarrior.configuration import Configuration
+from icalwarrior.filtering.constraints import ConstraintEvaluator
+from icalwarrior.view.sorter import ToDoSorter
+
+CompiledReport = Tuple[Dict[str, Any], Optional[ConstraintEvaluator], ToDoSorter]
+
+FileSignature = Tuple[Tuple[int, int, int], Tuple[int, int, int]]
+
+class LoadedReport:
+    """The stored head and members of a report. The members of each list are
+    additionally kept ordered by their position within the list, so that the
+    member of a written todo and the ones following it can be found by bisection."""
+
+    def __init__(self, head : Dict[str, Any], members : List[List[Any]]) -> None:
+        self.head = head
+        self.members = members
+        self.by_rank : Dict[str, List[List[Any]]] = {}
+        for member in members:
+            self.by_rank.setdefault(member[MaterializedReports.LIST], []).append(member)
+        for list_members in self.by_rank.values():
+            list_members.sort(key=lambda member: member[MaterializedReports.RANK])
+
+class MaterializedReports:
+    """Keeps the sorted todos of reports with the 'materialize' option in the
+    state directory, so that showing a report does not require reading all
+    todo lists.
+
+    Each report is stored in two files: the first holds the definition of
+    the report, the number of todos per list and the first max_list_length
+    todos, and the second holds all todos of the report. For each todo, its
+    encoded sort key, UID, list and position within its list are stored,
+    from which its ID is derived. Both files are updated with every write
+    through TodoList and are recomputed if the definition of the report
+    changed, if the current date changed, as reports may refer to dates
+    relative to today, or if another application added or removed files.
+
+    Changes recorded between begin and flush are applied in memory and
+    written at once, so that storing many todos rewrites each report only
+    once. The compiled definitions and the loaded todos of the reports are
+    kept as long as their files are not replaced by another process, and the
+    file of all todos is only rewritten if the todos of a report changed.
+    Rewriting it still takes time linear in the size of the report."""
+
+    UID = 1
+    LIST = 2
+    RANK = 3
+
+    def __init__(self, config : Configuration) -> None:
+        self.config = config
+        self.lists_dir = config.get_lists_dir()
+        self.path = os.path.join(config.get_state_dir(), "views")
+
+        # Definition, constraint evaluator and sorter of each report,
+        # compiled on the date they are stored for
+        self.compiled : Dict[str, Optional[CompiledReport]] = {}
+        self.compiled_date : Optional[datetime.date] = None
+
+        # Head and members of each report as last read or written,
+        # together with the state of their files at that time
+        self.loaded : Dict[str, Tuple[FileSignature, LoadedReport]] = {}
+
+        # Names of the reports changed since begin, if updates are deferred
+        self.batch : Optional[Dict[str, bool]] = None
+
+    @staticmethod
+    def __mtime(path : str) -> int:
+        return os.stat(path).st_mtime_ns
+
+    @staticmethod
+    def __write_json(path : str, data : Any) -> None:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'w') as handle:
+            json.dump(data, handle)
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def __read_json(path : str) -> Any:
+        with open(path, 'r') as handle:
+            return json.load(handle)
+
+    def __head_path(self, report_name : str) -> str:
+        return os.path.join(self.path, report_name + ".json")
+
+    def __members_path(self, report_name : str) -> str:
+        return os.path.join(self.path, report_name + ".members.json")
+
+    def __compile(self, report_name : str) -> Optional[CompiledReport]:
+
+        # Constraints may refer to dates relative to today
+        today = datetime.date.today()
+        if today != self.compiled_date:
+            self.compiled.clear()
+            self.compiled_date = today
+
+        if report_name in self.compiled:
+            return self.compiled[report_name]
+
+        result : Optional[CompiledReport] = None
+        report = self.config.get_report(report_name)
+        if report.materialize:
+
+            definition = {
+                'constraints' : report.constraints,
+                'sort' : report.sort or ToDoSorter.DEFAULT_SORT_KEYS,
+                'sort_missing' : report.sort_missing,
+                'max_list_length' : report.max_list_length
+            }
+
+            sorter = ToDoSorter([], definition['sort'], None, definition['sort_missing'])
+            evaluator = self.__get_evaluator(definition)
+
+            if (not any(prop_name == 'id' for prop_name, _ in sorter.keys)
+                    and (evaluator is None or 'id' not in evaluator.get_property_names())):
+                result = (definition, evaluator, sorter)
+
+        self.compiled[report_name] = result
+        return result
+
+    def get_definition(self, report_name : str) -> Optional[Dict[str, Any]]:
+        """Returns the options of a report that determine its todos, or None
+        if the report is not to be materialized. Reports referring to IDs
+        cannot be materialized, as IDs change without the todos being written."""
+
+        compiled = self.__compile(report_name)
+        if compiled is None:
+            return None
+        return compiled[0]
+
+    def get_report_names(self) -> List[str]:
+        """Returns the names of all reports to be materialized."""
+
+        return [name for name in self.config.get_report_names() if self.get_definition(name) is not None]
+
+    def __get_evaluator(self, definition : Dict[str, Any]) -> Optional[ConstraintEvaluator]:
+
+        if len(definition['constraints']) == 0:
+            return None
+
+        return ConstraintEvaluator.from_string_list(self.config, definition['constraints'])
+
+    def get_head(self, report_name : str) -> Optional[Dict[str, Any]]:
+        """Returns the stored first todos of a report if they are up to date, and None otherwise."""
+
+        definition = self.get_definition(report_name)
+        if definition is None:
+            return None
+
+        try:
+            head : Dict[str, Any] = self.__read_json(self.__head_path(report_name))
+
+            if head['definition'] != definition or head['date'] != datetime.date.today().isoformat():
+                return None
+
+            if head['root_mtime'] != self.__mtime(self.lists_dir):
+                return None
+
+            for list_name, mtime in head['list_mtimes'].items():
+                if mtime != self.__mtime(os.path.join(self.lists_dir, list_name)):
+                    return None
+        except (OSError, ValueError, KeyError):
+            return None
+
+        return head
+
+    def get_valid_report_names(self) -> List[str]:
+        """Returns the names of the materialized reports that are up to date.
+        Needs to be called before writing, as adding a file changes the
+        modification time of its list."""
+
+        return [name for name in self.get_report_names() if self.get_head(name) is not None]
+
+    def get_id(self, head : Dict[str, Any], member : List[Any]) -> int:
+        """Returns the ID of a todo of a report, i.e., the one it gets when the lists are read."""
+
+        offset = 0
+        for list_name in sorted(head['totals'].keys()):
+            if list_name == member[MaterializedReports.LIST]:
+                break
+            offset += head['totals'][list_name]
+
+        return int(offset + member[MaterializedReports.RANK] + 1)
+
+    @staticmethod
+    def __signature(path : str) -> Tuple[int, int, int]:
+        # Files are replaced when written, which changes their inode
+        stat = os.stat(path)
+        return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+    def __get_signature(self, report_name : str) -> FileSignature:
+        return (self.__signature(self.__head_path(report_name)), self.__signature(self.__members_path(report_name)))
+
+    def __load(self, report_name : str) -> LoadedReport:
+
+        signature = self.__get_signature(report_name)
+        if report_name in self.loaded and self.loaded[report_name][0] == signature:
+            return self.loaded[report_name][1]
+
+        loaded = LoadedReport(self.__read_json(self.__head_path(report_name)), self.__read_json(self.__members_path(report_name)))
+        self.loaded[report_name] = (signature, loaded)
+        return loaded
+
+    def __store(self,
+                report_name : str,
+                definition : Dict[str, Any],
+                totals : Dict[str, int],
+                members : List[List[Any]],
+                members_changed : bool = True) -> Dict[str, Any]:
+
+        list_mtimes = {list_name : self.__mtime(os.path.join(self.lists_dir, list_name)) for list_name in totals.keys()}
+
+        head = {
+            'definition' : definition,
+            'date' : datetime.date.today().isoformat(),
+            'root_mtime' : self.__mtime(self.lists_dir),
+            'list_mtimes' : list_mtimes,
+            'totals' : totals,
+            'size' : len(members),
+            'head' : members if definition['max_list_length'] is None else members[:definition['max_list_length']]
+        }
+
+        if members_changed:
+            self.__write_json(self.__members_path(report_name), members)
+        self.__write_json(self.__head_path(report_name), head)
+
+        return head
+
+    def rebuild(self, report_name : str, lists : Dict[str, List[TodoModel]]) -> None:
+        """Recomputes a report from all todos, given per list in the order of their UIDs."""
+
+        definition = self.get_definition(report_name)
+        if definition is None:
+            return
+
+        compiled = self.__compile(report_name)
+        assert compiled is not None
+        _, evaluator, sorter = compiled
+
+        decorated = []
+        for list_name, todos in lists.items():
+            for rank, todo in enumerate(todos):
+                if evaluator is None or evaluator.satisfies_constraints(todo):
+                    uid = todo.get_string('uid')
+                    decorated.append((sorter.get_key(todo), uid, list_name, rank))
+
+        decorated.sort(key=lambda entry: (entry[0], entry[1]))
+        members = [[ToDoSorter.encode_key(key), uid, list_name, rank] for key, uid, list_name, rank in decorated]
+
+        totals = {list_name : len(todos) for list_name, todos in lists.items()}
+        head = self.__store(report_name, definition, totals, members)
+        self.loaded[report_name] = (self.__get_signature(report_name), LoadedReport(head, members))
+
+    def begin(self) -> None:
+        """Defers writing the reports until flush is called."""
+
+        if self.batch is None:
+            self.batch = {}
+
+    def flush(self) -> None:
+        """Writes the reports changed since begin was called."""
+
+        if self.batch is None:
+            return
+
+        batch = self.batch
+        self.batch = None
+        for report_name, members_changed in batch.items():
+            self.__write(report_name, members_changed)
+
+    def __write(self, report_name : str, members_changed : bool) -> None:
+
+        definition = self.get_definition(report_name)
+        assert definition is not None
+
+        # The loaded report is dropped if writing fails, so that it is read again
+        _, loaded = self.loaded.pop(report_name)
+        loaded.head = self.__store(report_name, definition, loaded.head['totals'], loaded.members, members_changed)
+        self.loaded[report_name] = (self.__get_signature(report_name), loaded)
+
+    def __find(self, members : List[List[Any]], member : List[Any]) -> int:
+
+        position = (ToDoSorter.decode_key(member[0]), member[MaterializedReports.UID])
+        index = bisect.bisect_left(members, position,
+                                   key=lambda member: (ToDoSorter.decode_key(member[0]), member[MaterializedReports.UID]))
+
+        # Files copied by other applications may add todos with the same UID to several lists
+        while members[index] is not member:
+            index += 1
+        return index
+
+    def __update(self,
+                 report_name : str,
+                 list_name : str,
+                 uid : str,
+                 rank : int,
+                 todo : Optional[TodoModel],
+                 shift : int) -> None:
+        """Applies the change of the todo at the given position within its
+        list to a report, where shift is 1 if the todo has been added, -1
+        if it has been removed and 0 if it has been changed."""
+
+        compiled = self.__compile(report_name)
+        assert compiled is not None
+        _, evaluator, sorter = compiled
+
+        # The report has been up to date before writing, so that
+        # only the modification time of the list may have changed.
+        report = self.__load(report_name)
+        try:
+            members_changed = self.__apply(report, list_name, uid, rank, todo, shift, evaluator, sorter)
+        except BaseException:
+            # The loaded report may have been changed partially
+            self.loaded.pop(report_name, None)
+            raise
+
+        if self.batch is not None:
+            self.batch[report_name] = self.batch.get(report_name, False) or members_changed
+        else:
+            self.__write(report_name, members_changed)
+
+    def __apply(self,
+                report : LoadedReport,
+                list_name : str,
+                uid : str,
+                rank : int,
+                todo : Optional[TodoModel],
+                shift : int,
+                evaluator : Optional[ConstraintEvaluator],
+                sorter : ToDoSorter) -> bool:
+        """Changes the loaded report and returns whether its members changed."""
+
+        members = report.members
+        list_members = report.by_rank.setdefault(list_name, [])
+        members_changed = False
+
+        key = None
+        if todo is not None and (evaluator is None or evaluator.satisfies_constraints(todo)):
+            key = sorter.get_key(todo)
+
+        index = bisect.bisect_left(list_members, rank, key=lambda member: member[MaterializedReports.RANK])
+        if shift <= 0 and index < len(list_members) and list_members[index][MaterializedReports.RANK] == rank:
+            assert list_members[index][MaterializedReports.UID] == uid
+
+            # Changes not affecting the sort key, e.g., of the summary, keep the todo in place
+            if shift == 0 and key is not None and list_members[index][0] == ToDoSorter.encode_key(key):
+                return False
+
+            member = list_members.pop(index)
+            del members[self.__find(members, member)]
+            members_changed = True
+
+        # Adding or removing a todo changes the position of
+        # the todos of the same list that follow it.
+        if shift != 0:
+            for following in range(index, len(list_members)):
+                list_members[following][MaterializedReports.RANK] += shift
+                members_changed = True
+            report.head['totals'][list_name] = report.head['totals'].get(list_name, 0) + shift
+
+        if key is not None:
+            member = [ToDoSorter.encode_key(key), uid, list_name, rank]
+            position = bisect.bisect_left(members, (key, uid),
+                                          key=lambda member: (ToDoSorter.decode_key(member[0]), member[MaterializedReports.UID]))
+            members.insert(position, member)
+            list_members.insert(index, member)
+            members_changed = True
+
+        return members_changed
+
+    def record_write(self, list_name : str, todo : TodoModel, rank : int, is_new : bool, valid_reports : List[str]) -> None:
+        """Updates the reports that were up to date before the todo at the given
+        position within its list has been written."""
+
+        for report_name in valid_reports:
+            self.__update(report_name, list_name, todo.get_string('uid'), rank, todo, 1 if is_new else 0)
+
+    def record_delete(self, list_name : str, uid : str, rank : int, valid_reports : List[str]) -> None:
+
+        for report_name in valid_reports:
+            self.__update(report_name, list_name, uid, rank, None, -1)
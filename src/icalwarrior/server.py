@@ -0,0 +1,279 @@
+# SPDX-FileCopyrightText: 2022 Martin Byrenheid <martin@byrenheid.net>
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+from typing import List, Dict, Optional, Any, Tuple, Callable
+from http.server import HTTPServer, BaseHTTPRequestHandler
+import datetime
+import hashlib
+import io
+import json
+import shlex
+import urllib.parse
+import uuid
+
+from icalwarrior.configuration import Configuration
+from icalwarrior.daemon import ListsWatcher
+from icalwarrior.input.date import expand_prefix
+from icalwarrior.model.items import TodoModel
+from icalwarrior.model.lists import TodoDatabase
+from icalwarrior.filtering.constraints import ConstraintEvaluator
+from icalwarrior.view.exporter import Exporter
+from icalwarrior.view.formatter import StringFormatter
+from icalwarrior.view.sorter import ToDoSorter
+
+class InvalidQueryParameterError(Exception):
+
+    def __init__(self, name : str, value : str) -> None:
+        self.name = name
+        self.value = value
+
+    def __str__(self) -> str:
+        return "Invalid value \"" + self.value + "\" for query parameter \"" + self.name + "\"."
+
+class InvalidAddressError(Exception):
+
+    def __init__(self, address : str) -> None:
+        self.address = address
+
+    def __str__(self) -> str:
+        return "Invalid address \"" + self.address + "\". Expected HOST:PORT, e.g., 127.0.0.1:8080."
+
+Response = Tuple[int, Any]
+
+Endpoint = Callable[[Dict[str, List[str]]], Response]
+
+def parse_address(address : str) -> Tuple[str, int]:
+
+    host, _, port = address.rpartition(":")
+    if not port.isdigit():
+        raise InvalidAddressError(address)
+
+    return (host or "127.0.0.1", int(port))
+
+class QueryAPI:
+    """Answers read-only queries about the todos, which are kept in memory
+    and refreshed incrementally before each query.
+
+    Each response is tagged with an ETag made of the generation of the
+    database, the current date, as the results of relative date
+    constraints change with it, and a digest of the endpoint and the query
+    parameters. The ETags of different server processes differ, as
+    generations are counted per database."""
+
+    ENDPOINTS = ["/todos", "/reports", "/reports/NAME", "/stats"]
+
+    def __init__(self, config : Configuration) -> None:
+        self.config = config
+        self.database = TodoDatabase(config)
+        self.aggregator = self.database.get_aggregator()
+        self.watcher = ListsWatcher(config.get_lists_dir())
+        self.formatter = StringFormatter(config)
+        self.instance = uuid.uuid4().hex[:8]
+
+    def get_etag(self, parts : List[str], params : Dict[str, List[str]]) -> str:
+
+        request = "/".join(parts) + "?" + urllib.parse.urlencode(sorted(params.items()), doseq=True)
+        digest = hashlib.sha1(request.encode('utf-8')).hexdigest()[:12]
+        return ("\"" + self.instance + "-" + str(self.database.get_generation()) + "-"
+                + datetime.date.today().isoformat() + "-" + digest + "\"")
+
+    @staticmethod
+    def __get_param(params : Dict[str, List[str]], name : str, default : Optional[str] = None) -> Optional[str]:
+
+        values = params.get(name, [])
+        if len(values) == 0:
+            return default
+        return values[-1]
+
+    def __get_int_param(self, params : Dict[str, List[str]], name : str) -> Optional[int]:
+
+        value = self.__get_param(params, name)
+        if value is None:
+            return None
+        if not value.isdigit():
+            raise InvalidQueryParameterError(name, value)
+        return int(value)
+
+    def __get_constraints(self, params : Dict[str, List[str]]) -> List[str]:
+        """Returns the filter expression given by the parameter q, using the
+        same syntax as on the command line, e.g., q=status:needs-action +home."""
+
+        query = self.__get_param(params, 'q', "")
+        assert query is not None
+        try:
+            return shlex.split(query)
+        except ValueError as err:
+            raise InvalidQueryParameterError('q', query) from err
+
+    def __get_fields(self, params : Dict[str, List[str]]) -> Optional[List[str]]:
+
+        fields = self.__get_param(params, 'fields')
+        if fields is None:
+            return None
+
+        supported = ConstraintEvaluator.supported_filter_properties() + TodoModel.DATE_IMMUTABLE_PROPERTIES
+        result = []
+        for field in fields.split(","):
+            field_name = expand_prefix(field, supported)
+            if field_name == "":
+                raise InvalidQueryParameterError('fields', field)
+            result.append(field_name)
+
+        return result
+
+    def __get_records(self, todos : List[TodoModel], fields : Optional[List[str]]) -> List[Dict[str, str]]:
+        return list(Exporter(self.formatter, fields, io.StringIO()).records(todos))
+
+    def query_todos(self, params : Dict[str, List[str]]) -> Response:
+
+        constraints = self.__get_constraints(params)
+        evaluator = None
+        if len(constraints) > 0:
+            evaluator = ConstraintEvaluator.from_string_list(self.config, constraints)
+
+        todos = self.database.get_todos(evaluator)
+        return (200, self.__get_records(todos, self.__get_fields(params)))
+
+    def query_report(self, name : str, params : Dict[str, List[str]]) -> Response:
+
+        report_name = expand_prefix(name, self.config.get_report_names())
+        if report_name == "":
+            return (404, {'error' : "Unknown or ambiguous report name \"" + name + "\"."})
+
+        report_spec = self.config.get_report(report_name)
+
+        constraints = self.__get_constraints(params)
+        if len(report_spec.constraints) > 0:
+            if len(constraints) > 0:
+                constraints = constraints + ['and'] + report_spec.constraints
+            else:
+                constraints = report_spec.constraints
+
+        evaluator = None
+        if len(constraints) > 0:
+            evaluator = ConstraintEvaluator.from_string_list(self.config, constraints)
+        matching_todos = self.database.get_todos(evaluator)
+
+        offset = self.__get_int_param(params, 'offset') or 0
+        limit = self.__get_int_param(params, 'limit')
+        if limit is None:
+            limit = report_spec.max_list_length
+
+        sorter = ToDoSorter(matching_todos, report_spec.sort or ToDoSorter.DEFAULT_SORT_KEYS, limit, report_spec.sort_missing, offset)
+        todos = sorter.get_sorted()
+        if limit is not None:
+            todos = todos[0:limit]
+
+        fields = self.__get_fields(params)
+        if fields is None and report_spec.columns is not None:
+            fields = ["id"] + report_spec.columns
+
+        return (200, {
+            'name' : report_name,
+            'total' : len(matching_todos),
+            'offset' : offset,
+            'todos' : self.__get_records(todos, fields)
+        })
+
+    def query_stats(self, params : Dict[str, List[str]]) -> Response:
+
+        group_by = [group for value in params.get('group_by', ['status']) for group in value.split(",") if group != ""]
+        counts = self.aggregator.aggregate(group_by)
+
+        result = []
+        for key, count in counts.items():
+            record : Dict[str, Any] = {'list' : key[0]}
+            record.update(zip(group_by, key[1:]))
+            record['count'] = count
+            result.append(record)
+
+        return (200, result)
+
+    @staticmethod
+    def __split_path(path : str) -> List[str]:
+        return [urllib.parse.unquote(part) for part in path.strip("/").split("/") if part != ""]
+
+    def __route(self, parts : List[str]) -> Optional[Endpoint]:
+        """Returns the function answering queries to the given path, or None if there is none."""
+
+        if len(parts) == 0:
+            return lambda params: (200, {'endpoints' : QueryAPI.ENDPOINTS, 'generation' : self.database.get_generation()})
+        if parts == ["todos"]:
+            return self.query_todos
+        if parts == ["reports"]:
+            return lambda params: (200, self.config.get_report_names())
+        if len(parts) == 2 and parts[0] == "reports" and expand_prefix(parts[1], self.config.get_report_names()) != "":
+            return lambda params: self.query_report(parts[1], params)
+        if parts == ["stats"]:
+            return self.query_stats
+
+        return None
+
+    def query(self, path : str, params : Dict[str, List[str]]) -> Response:
+
+        parts = QueryAPI.__split_path(path)
+        endpoint = self.__route(parts)
+
+        if endpoint is None:
+            if len(parts) == 2 and parts[0] == "reports":
+                return self.query_report(parts[1], params)
+            return (404, {'error' : "Unknown endpoint " + path + ". Known endpoints are " + ", ".join(QueryAPI.ENDPOINTS) + "."})
+
+        try:
+            return endpoint(params)
+        except Exception as err:
+            return (400, {'error' : str(err)})
+
+    def handle(self, path : str, params : Dict[str, List[str]], if_none_match : Optional[str]) -> Tuple[int, Any, Optional[str]]:
+        """Returns the status code, the response body and the ETag of a
+        query. If the given ETag is still up to date, the query is not run."""
+
+        try:
+            if self.watcher.has_changes():
+                self.database.refresh()
+        except Exception as err:
+            return (500, {'error' : str(err)}, None)
+
+        # Only queries to existing endpoints can be answered from the
+        # client's cache, so that unknown paths are reported as such.
+        parts = QueryAPI.__split_path(path)
+        etag = self.get_etag(parts, params)
+        if if_none_match is not None and self.__route(parts) is not None:
+            tags = [tag.strip() for tag in if_none_match.split(",")]
+            if etag in tags or "*" in tags:
+                return (304, None, etag)
+
+        status, body = self.query(path, params)
+        return (status, body, etag if status == 200 else None)
+
+class QueryRequestHandler(BaseHTTPRequestHandler):
+
+    server : 'QueryServer'
+
+    def do_GET(self) -> None:
+
+        url = urllib.parse.urlsplit(self.path)
+        status, body, etag = self.server.api.handle(url.path, urllib.parse.parse_qs(url.query), self.headers.get('If-None-Match'))
+
+        self.send_response(status)
+        if etag is not None:
+            self.send_header('ETag', etag)
+            self.send_header('Cache-Control', 'no-cache')
+
+        if status == 304:
+            self.end_headers()
+            return
+
+        data = json.dumps(body).encode('utf-8')
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+class QueryServer(HTTPServer):
+    """HTTP server answering the GET requests of the QueryAPI one after another."""
+
+    def __init__(self, config : Configuration, address : Tuple[str, int]) -> None:
+        self.api = QueryAPI(config)
+        super().__init__(address, QueryRequestHandler)
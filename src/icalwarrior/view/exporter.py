@@ -0,0 +1,106 @@
+# SPDX-FileCopyrightText: 2022 Martin Byrenheid <martin@byrenheid.net>
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+from typing import List, Dict, Iterable, Iterator, Optional, TextIO
+from abc import abstractmethod
+import csv
+import json
+
+from icalwarrior.model.items import TodoModel
+from icalwarrior.model.journal import Change
+from icalwarrior.view.formatter import StringFormatter
+
+class UnknownExportFormatError(Exception):
+
+    def __init__(self, export_format : str, supported : List[str]) -> None:
+        self.export_format = export_format
+        self.supported = supported
+
+    def __str__(self) -> str:
+        return "Unknown export format \"" + self.export_format + "\". Supported formats are " + ", ".join(self.supported)
+
+class Exporter:
+
+    def __init__(self, formatter : StringFormatter, fields : Optional[List[str]], output : TextIO) -> None:
+        self.formatter = formatter
+        self.fields = fields
+        self.output = output
+
+    def records(self, todos : Iterable[TodoModel]) -> Iterator[Dict[str, str]]:
+        """Yields one record per todo. Only the properties given as fields
+        are formatted, if any fields have been given."""
+
+        if self.fields is not None:
+            field_formatters = [(field, self.formatter.get_property_formatter(field)) for field in self.fields]
+            for todo in todos:
+                yield {field : format_value(todo) for field, format_value in field_formatters}
+
+        else:
+            for todo in todos:
+                yield {prop_name : self.formatter.format_property_value(prop_name, todo) for prop_name in todo.get_property_names()}
+
+    def write(self, todos : Iterable[TodoModel]) -> None:
+        self.write_records(self.records(todos))
+
+    @abstractmethod
+    def write_records(self, records : Iterable[Dict[str, str]]) -> None:
+        """Writes records obtained from records, e.g., by worker processes."""
+
+class JSONExporter(Exporter):
+
+    def write_records(self, records : Iterable[Dict[str, str]]) -> None:
+        # Write the array element by element, so that
+        # no record needs to be kept after it has been written.
+        self.output.write("[")
+        separator = ""
+        for record in records:
+            self.output.write(separator + json.dumps(record))
+            separator = ", "
+        self.output.write("]\n")
+
+class NDJSONExporter(Exporter):
+
+    def write_records(self, records : Iterable[Dict[str, str]]) -> None:
+        for record in records:
+            self.output.write(json.dumps(record) + "\n")
+
+    def write_changes(self, changes : Iterable[Change], generation : int) -> None:
+        """Writes one record per change, followed by a checkpoint record holding
+        the generation from which the next incremental export can continue."""
+
+        for change in changes:
+            record : Dict[str, object] = {'operation' : change.operation, 'uid' : change.uid, 'list' : change.list_name}
+            if change.todo is not None:
+                record['todo'] = next(self.records([change.todo]))
+            self.output.write(json.dumps(record) + "\n")
+
+        self.output.write(json.dumps({'operation' : 'checkpoint', 'generation' : generation}) + "\n")
+
+class CSVExporter(Exporter):
+
+    DEFAULT_FIELDS = ['id', 'list', 'uid'] + TodoModel.supported_properties() + TodoModel.DATE_IMMUTABLE_PROPERTIES
+
+    def __init__(self, formatter : StringFormatter, fields : Optional[List[str]], output : TextIO) -> None:
+        # In contrast to JSON, all records need to share the same
+        # columns, so fall back to a fixed set of fields.
+        super().__init__(formatter, fields if fields is not None else CSVExporter.DEFAULT_FIELDS, output)
+
+    def write_records(self, records : Iterable[Dict[str, str]]) -> None:
+        writer = csv.DictWriter(self.output, fieldnames=self.fields)
+        writer.writeheader()
+        for record in records:
+            writer.writerow(record)
+
+EXPORTERS = {
+    'json' : JSONExporter,
+    'ndjson' : NDJSONExporter,
+    'csv' : CSVExporter
+}
+
+def create_exporter(export_format : str, formatter : StringFormatter, fields : Optional[List[str]], output : TextIO) -> Exporter:
+
+    if export_format not in EXPORTERS:
+        raise UnknownExportFormatError(export_format, list(EXPORTERS.keys()))
+
+    return EXPORTERS[export_format](formatter, fields, output)
@@ -2,6 +2,7 @@
 #
 # SPDX-License-Identifier: GPL-3.0-or-later
 
+from typing import Callable, Dict, Tuple, Optional
 import icalendar
 import datetime
 import humanize
@@ -12,10 +13,36 @@ from icalwarrior.configuration import Configuration
 from icalwarrior.input.date import adapt_datetype
 from icalwarrior.filtering.constraints import ConstraintEvaluator
 
+PropertyFormatter = Callable[[TodoModel], str]
+
 class StringFormatter:
+    """Formats property values of todos as strings.
+
+    Dates are described relative to a reference time, which is taken when the
+    formatter is created, so a formatter should be created for each rendering.
+    Since humanizing dates is expensive compared to the other properties,
+    formatted dates are cached per reference time."""
 
-    def __init__(self, config : Configuration) -> None:
+    def __init__(self, config : Configuration, reference_time : Optional[datetime.datetime] = None) -> None:
         self.config = config
+        self.type_factory = icalendar.prop.TypesFactory()
+        self.property_formatters : Dict[str, PropertyFormatter] = {}
+        self.date_cache : Dict[Tuple[str, str, bool], str] = {}
+        self.reference_bucket : Optional[datetime.datetime] = None
+
+        if reference_time is None:
+            reference_time = datetime.datetime.now(tz.gettz())
+        self.set_reference_time(reference_time)
+
+    def set_reference_time(self, reference_time : datetime.datetime) -> None:
+        self.reference_time = reference_time
+
+        # Relative descriptions of dates do not change within a minute,
+        # so entries cached for the same minute remain valid.
+        bucket = reference_time.replace(second=0, microsecond=0)
+        if bucket != self.reference_bucket:
+            self.date_cache.clear()
+        self.reference_bucket = bucket
 
     def format_property_name(self, prop_name : str) -> str:
 
@@ -30,45 +57,63 @@ class StringFormatter:
 
         return result
 
+    def format_date(self, prop_value : datetime.datetime | datetime.date) -> str:
 
-    def format_property_value(self, prop_name : str, todo : TodoModel) -> str:
+        # Aware datetimes of the same instant in different time zones are
+        # equal, but are rendered with different wall-clock times.
+        is_datetime = isinstance(prop_value, datetime.datetime)
+        key = (prop_value.isoformat(), str(getattr(prop_value, 'tzinfo', None)), is_datetime)
+        if key in self.date_cache:
+            return self.date_cache[key]
 
-        result = ""
+        now = adapt_datetype(self.reference_time, prop_value)
 
-        if todo.has_property(prop_name):
+        if isinstance(now, datetime.datetime):
+            assert isinstance(prop_value, datetime.datetime)
+            result = prop_value.strftime(self.config.get_datetime_format())
+            result += " (" + humanize.naturaltime(prop_value, when=now) + ")"
+        else:
+            result = prop_value.strftime(self.config.get_date_format())
+            result += " (" + humanize.naturalday(prop_value) + ")"
 
-            type_fact = icalendar.prop.TypesFactory()
+        self.date_cache[key] = result
+        return result
 
-            if type_fact.for_property(prop_name) is icalendar.prop.vDDDTypes:
-                prop_value = todo.get_date_or_datetime(prop_name)
-                now = adapt_datetype(datetime.datetime.now(tz.gettz()), prop_value)
+    def get_property_formatter(self, prop_name : str) -> PropertyFormatter:
+        """Returns a function formatting the value of the given property,
+        which is determined once per property and can then be applied to
+        any number of todos."""
 
-                result = prop_value.strftime(self.config.get_datetime_format())
-                if isinstance(now, datetime.datetime):
-                    assert isinstance(prop_value, datetime.datetime)
-                    result = prop_value.strftime(self.config.get_datetime_format())
-                    result += " (" + humanize.naturaltime(prop_value, when=now) + ")"
-                else:
-                    result = prop_value.strftime(self.config.get_date_format())
-                    result += " (" + humanize.naturalday(prop_value) + ")"
+        if prop_name in self.property_formatters:
+            return self.property_formatters[prop_name]
 
-            elif type_fact.for_property(prop_name) is icalendar.prop.vText:
-                result = todo.get_string(prop_name)
+        result : PropertyFormatter = lambda todo: ""
 
-            elif type_fact.for_property(prop_name) is icalendar.prop.vInt:
-                result = str(todo.get_int(prop_name))
+        if prop_name in TodoModel.CONTEXT_PROPERTIES:
 
-            elif type_fact.for_property(prop_name) is icalendar.prop.vCategory:
-                # TODO: from_ical vom vCategory throws an assertion error.
-                #       We therefore convert it manually.
-                result = ",".join([str(c) for c in todo.get_categories()])
+            if prop_name in ConstraintEvaluator.TEXT_FILTER_PROPERTIES or prop_name in ConstraintEvaluator.INT_FILTER_PROPERTIES:
+                result = lambda todo: str(todo.get_context(prop_name))
+
+        else:
+
+            prop_type = self.type_factory.for_property(prop_name)
+
+            if prop_type is icalendar.prop.vDDDTypes:
+                result = lambda todo: self.format_date(todo.get_date_or_datetime(prop_name)) if todo.has_property(prop_name) else ""
 
-        if prop_name in todo.CONTEXT_PROPERTIES:
+            elif prop_type is icalendar.prop.vText:
+                result = lambda todo: todo.get_string(prop_name) if todo.has_property(prop_name) else ""
 
-            if prop_name in ConstraintEvaluator.TEXT_FILTER_PROPERTIES:
-                result = str(todo.get_context(prop_name))
+            elif prop_type is icalendar.prop.vInt:
+                result = lambda todo: str(todo.get_int(prop_name)) if todo.has_property(prop_name) else ""
 
-            elif prop_name in ConstraintEvaluator.INT_FILTER_PROPERTIES:
-                result = str(todo.get_context(prop_name))
+            elif prop_type is icalendar.prop.vCategory:
+                # TODO: from_ical vom vCategory throws an assertion error.
+                #       We therefore convert it manually.
+                result = lambda todo: ",".join([str(c) for c in todo.get_categories()]) if todo.has_property(prop_name) else ""
 
+        self.property_formatters[prop_name] = result
         return result
+
+    def format_property_value(self, prop_name : str, todo : TodoModel) -> str:
+        return self.get_property_formatter(prop_name)(todo)
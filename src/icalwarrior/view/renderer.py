@@ -0,0 +1,135 @@
+# SPDX-FileCopyrightText: 2022 Martin Byrenheid <martin@byrenheid.net>
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+from typing import List, Optional, Dict, TextIO
+from enum import Enum
+
+from colorama import Back, Style
+from wcwidth import wcwidth
+
+class WrapMode(Enum):
+    WRAP = 0
+    TRUNCATE_END = 1
+
+ROW_OPT_TEXT_COLOR = 'row.color.fore'
+
+ELLIPSIS = '…'
+
+def text_width(text : str) -> int:
+    # Non-printable characters have a negative width
+    # according to wcwidth, but do not occupy any space.
+    return sum(max(wcwidth(c), 0) for c in text)
+
+def truncate(text : str, width : int) -> str:
+
+    if text_width(text) <= width:
+        return text
+
+    result = ""
+    result_width = 0
+    for c in text:
+        char_width = max(wcwidth(c), 0)
+        if result_width + char_width > width - text_width(ELLIPSIS):
+            break
+        result += c
+        result_width += char_width
+
+    return result + ELLIPSIS
+
+def wrap(text : str, width : int) -> List[str]:
+
+    result : List[str] = []
+    line = ""
+    line_width = 0
+    for c in text:
+        char_width = max(wcwidth(c), 0)
+        if line_width + char_width > width and line != "":
+            result.append(line)
+            line = ""
+            line_width = 0
+        line += c
+        line_width += char_width
+
+    result.append(line)
+    return result
+
+def pad(text : str, width : int) -> str:
+    return text + " " * (width - text_width(text))
+
+class TableRenderer:
+    """Renders rows in the style of the report grid, i.e., with a bold header,
+    a line below the header and alternating background colors for the rows.
+
+    Column widths are determined in one pass over the cells, afterwards
+    each row is written to the output as soon as it has been formatted.
+    Options for each row, such as its text color, are given in a list
+    parallel to the rows."""
+
+    def __init__(self,
+                 rows : List[List[str]],
+                 columns : List[str],
+                 max_column_width : int,
+                 wrap_mode : WrapMode,
+                 row_options : Optional[List[Dict[str, str]]],
+                 output : TextIO) -> None:
+        self.rows = rows
+        self.columns = columns
+        self.max_column_width = max_column_width
+        self.wrap_mode = wrap_mode
+        self.row_options = row_options
+        self.output = output
+
+    def __split_cell(self, text : str, width : int) -> List[str]:
+
+        result : List[str] = []
+        for line in text.split("\n"):
+            if self.wrap_mode == WrapMode.TRUNCATE_END:
+                result.append(truncate(line, width))
+            else:
+                result += wrap(line, width)
+
+        return result
+
+    def __column_widths(self) -> List[int]:
+
+        widths = [text_width(col) for col in self.columns]
+        for row in self.rows:
+            for i, cell in enumerate(row):
+                for line in cell.split("\n"):
+                    widths[i] = max(widths[i], text_width(line))
+
+        if self.max_column_width > 0:
+            widths = [min(width, self.max_column_width) for width in widths]
+
+        return widths
+
+    def __write_lines(self, cells : List[List[str]], widths : List[int], background : str, text_color : str) -> None:
+
+        for line_index in range(max(len(lines) for lines in cells)):
+            line = ""
+            for lines, width in zip(cells, widths):
+                text = lines[line_index] if line_index < len(lines) else ""
+                line += background + " " + text_color + pad(text, width) + " "
+            self.output.write(line + Style.RESET_ALL + "\n")
+
+    def render(self) -> None:
+
+        widths = self.__column_widths()
+
+        header = [self.__split_cell(col, width) for col, width in zip(self.columns, widths)]
+        self.__write_lines(header, widths, Style.RESET_ALL, Style.BRIGHT)
+        self.output.write("─" * sum(width + 2 for width in widths) + "\n")
+
+        for row_index, row in enumerate(self.rows):
+
+            background = Back.BLACK if row_index % 2 == 0 else Style.RESET_ALL
+
+            text_color = ""
+            if self.row_options is not None:
+                text_color = self.row_options[row_index].get(ROW_OPT_TEXT_COLOR, "")
+
+            cells = [self.__split_cell(cell, width) for cell, width in zip(row, widths)]
+            self.__write_lines(cells, widths, background, text_color)
+
+        self.output.flush()
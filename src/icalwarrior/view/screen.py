@@ -0,0 +1,53 @@
+# SPDX-FileCopyrightText: 2022 Martin Byrenheid <martin@byrenheid.net>
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+from typing import List, Optional, TextIO
+import io
+
+class OutputBuffer(io.StringIO):
+    """Collects output that is meant for a terminal, claiming to be a
+    terminal if the actual output is one, so that it is colored the same way."""
+
+    def __init__(self, tty : bool) -> None:
+        super().__init__()
+        self.tty = tty
+
+    def isatty(self) -> bool:
+        return self.tty
+
+class ScreenUpdater:
+    """Shows a sequence of frames, e.g., of a report, on a terminal. After
+    the first frame, only the lines that differ from the previous frame
+    are redrawn, so that the screen does not flicker. If the output is not
+    a terminal, each frame is written in full."""
+
+    def __init__(self, output : TextIO) -> None:
+        self.output = output
+        self.tty = output.isatty()
+        self.lines : Optional[List[str]] = None
+
+    def update(self, frame : str) -> None:
+
+        lines = frame.rstrip("\n").split("\n")
+
+        if not self.tty:
+            if self.lines is not None:
+                self.output.write("\n")
+            self.output.write("\n".join(lines) + "\n")
+
+        elif self.lines is None:
+            # Clear the screen and move the cursor to the top left corner
+            self.output.write("\x1b[2J\x1b[H" + "\n".join(lines) + "\n")
+
+        else:
+            for index, line in enumerate(lines):
+                if index >= len(self.lines) or self.lines[index] != line:
+                    # Move the cursor to the line and clear it after writing
+                    self.output.write("\x1b[" + str(index + 1) + ";1H" + line + "\x1b[K")
+
+            # Clear the lines left over from a longer previous frame
+            self.output.write("\x1b[" + str(len(lines) + 1) + ";1H\x1b[J")
+
+        self.lines = lines
+        self.output.flush()
@@ -2,11 +2,16 @@
 #
 # SPDX-License-Identifier: GPL-3.0-or-later
 
-from typing import List
+from typing import List, Optional, Any, Tuple
 
-import datetime
+import base64
+import binascii
+import functools
+import heapq
+import json
 import icalendar
 from icalwarrior.model.items import TodoModel
+from icalwarrior.input.date import expand_prefix
 
 class UnsupportedSortKeyError(Exception):
 
@@ -16,36 +21,224 @@ class UnsupportedSortKeyError(Exception):
     def __str__(self) -> str:
         return "Property \"" + self.key_name + "\" cannot be used for sorting of todos"
 
+class InvalidMissingValuePlacementError(Exception):
+
+    def __init__(self, placement : str) -> None:
+        self.placement = placement
+
+    def __str__(self) -> str:
+        return "Invalid placement \"" + self.placement + "\" for missing values. Supported placements are " + ", ".join(ToDoSorter.MISSING_PLACEMENTS)
+
+class InvalidCursorError(Exception):
+
+    def __init__(self, cursor : str) -> None:
+        self.cursor = cursor
+
+    def __str__(self) -> str:
+        return "Invalid cursor \"" + self.cursor + "\"."
+
+@functools.total_ordering
+class Descending:
+    """Wraps a sort key value to invert its order."""
+
+    def __init__(self, value : Any) -> None:
+        self.value = value
+
+    def __lt__(self, other : 'Descending') -> bool:
+        return bool(other.value < self.value)
+
+    def __eq__(self, other : object) -> bool:
+        return isinstance(other, Descending) and bool(self.value == other.value)
+
 class ToDoSorter:
 
-    def __init__(self, todos : List[TodoModel], sort_key : str) -> None:
+    ASCENDING = "+"
+    DESCENDING = "-"
+
+    MISSING_PLACEMENTS = ["first", "last"]
+
+    DEFAULT_SORT_KEYS = "due+"
+
+    SUPPORTED_KEYS = TodoModel.DATE_PROPERTIES \
+        + TodoModel.DATE_IMMUTABLE_PROPERTIES \
+        + ['summary', 'description'] \
+        + TodoModel.ENUM_PROPERTIES \
+        + TodoModel.INT_PROPERTIES \
+        + TodoModel.TEXT_IMMUTABLE_PROPERTIES \
+        + TodoModel.CONTEXT_PROPERTIES
+
+    def __init__(self,
+                 todos : List[TodoModel],
+                 sort_keys : str,
+                 limit : Optional[int] = None,
+                 missing : str = "last",
+                 offset : int = 0,
+                 after : Optional[str] = None) -> None:
+        """Sorts todos by a comma-separated list of properties, each of which
+        may be followed by + for ascending (default) or - for descending order,
+        e.g. "priority-,due+,summary". Todos lacking a property are placed
+        first or last, as given by missing.
+
+        The sorted todos can be restricted to a window of at most limit todos,
+        starting either at the given offset or right after the todo
+        identified by a cursor previously obtained from get_cursor."""
+
+        if missing not in ToDoSorter.MISSING_PLACEMENTS:
+            raise InvalidMissingValuePlacementError(missing)
+
         self.todos = todos
-        self.sort_key = sort_key
-
-    def date_to_timestamp(self, todo : TodoModel, prop_name : str) -> float:
-        result = 0.0
-        if todo.has_property(prop_name):
-            date_val = todo.get_date_or_datetime(prop_name)
-            if isinstance(date_val, datetime.date):
-                result = datetime.datetime(date_val.year, date_val.month, date_val.day).timestamp()
-            if isinstance(date_val, datetime.datetime):
-                result = date_val.timestamp()
+        self.sort_keys = sort_keys
+        self.limit = limit
+        self.offset = offset
+        self.after = after
+
+        # Number of todos from the start of the window to the end of the sorted
+        # todos, i.e., the number of todos that would be shown without limit.
+        self.remaining = 0
+        self.missing_rank = 0 if missing == "first" else 2
+        self.keys = self.__parse_sort_keys(sort_keys)
+        self.types = icalendar.prop.TypesFactory()
+
+        # Context properties like the ID may change without the todo being
+        # modified, so keys including them must not be kept with the todo.
+        self.cache_key : Optional[str] = None
+        if all(prop_name not in TodoModel.CONTEXT_PROPERTIES for prop_name, _ in self.keys):
+            self.cache_key = "sort:" + sort_keys + ":" + missing
+
+    @staticmethod
+    def __parse_sort_keys(sort_keys : str) -> List[Tuple[str, str]]:
+
+        result : List[Tuple[str, str]] = []
+        for key in sort_keys.split(","):
+            key = key.strip()
+            direction = ToDoSorter.ASCENDING
+            if key.endswith(ToDoSorter.ASCENDING) or key.endswith(ToDoSorter.DESCENDING):
+                direction = key[-1]
+                key = key[:-1]
+
+            prop_name = expand_prefix(key, ToDoSorter.SUPPORTED_KEYS)
+            if prop_name == "":
+                raise UnsupportedSortKeyError(key)
+
+            result.append((prop_name, direction))
+
         return result
 
-    def get_sorted(self) -> List[TodoModel]:
+    def __get_value(self, todo : TodoModel, prop_name : str) -> Any:
+
+        if prop_name in TodoModel.CONTEXT_PROPERTIES:
+            return todo.get_context(prop_name)
 
-        result = None
         # Determine type of sort element
-        key_type = icalendar.prop.TypesFactory().for_property(self.sort_key)
+        key_type = self.types.for_property(prop_name)
 
         if key_type is icalendar.prop.vDDDTypes:
-            result = sorted(self.todos, key=lambda todo: self.date_to_timestamp(todo, self.sort_key))
-        elif key_type is icalendar.prop.vText:
-            result = sorted(self.todos, key=lambda todo: todo.get_string(self.sort_key))
-        elif key_type is icalendar.prop.vInt:
-            result = sorted(self.todos, key=lambda todo: todo.get_int(self.sort_key))
-        else:
-            raise UnsupportedSortKeyError(self.sort_key)
+            return todo.get_timestamp(prop_name)
+        if key_type is icalendar.prop.vText:
+            return todo.get_string(prop_name).lower()
+        if key_type is icalendar.prop.vInt:
+            return todo.get_int(prop_name)
+
+        raise UnsupportedSortKeyError(prop_name)
+
+    def get_key(self, todo : TodoModel) -> Tuple[Any, ...]:
+        """Returns the composite sort key of a todo, which is computed once
+        and then kept with the todo until one of its properties changes."""
+
+        if self.cache_key is not None and self.cache_key in todo.cache:
+            cached_key : Tuple[Any, ...] = todo.cache[self.cache_key]
+            return cached_key
+
+        elements : List[Any] = []
+        for prop_name, direction in self.keys:
+
+            if prop_name not in TodoModel.CONTEXT_PROPERTIES and not todo.has_property(prop_name):
+                elements.append((self.missing_rank, None))
+                continue
+
+            value = self.__get_value(todo, prop_name)
+            if direction == ToDoSorter.DESCENDING:
+                value = -value if isinstance(value, (int, float)) else Descending(value)
+            elements.append((1, value))
 
+        result = tuple(elements)
+        if self.cache_key is not None:
+            todo.cache[self.cache_key] = result
         return result
 
+    @staticmethod
+    def encode_key(key : Tuple[Any, ...]) -> List[Any]:
+        """Returns a JSON-serializable representation of a sort key."""
+
+        elements = []
+        for rank, value in key:
+            if isinstance(value, Descending):
+                value = {'descending' : value.value}
+            elements.append([rank, value])
+
+        return elements
+
+    @staticmethod
+    def decode_key(elements : List[Any]) -> Tuple[Any, ...]:
+        """Inverse of encode_key."""
+
+        key = []
+        for rank, value in elements:
+            if isinstance(value, dict):
+                value = Descending(value['descending'])
+            key.append((rank, value))
+
+        return tuple(key)
+
+    @staticmethod
+    def make_cursor(elements : List[Any], uid : str) -> str:
+        """Returns the cursor of the todo with the given UID and encoded sort key."""
+
+        data = json.dumps([elements, uid])
+        return base64.urlsafe_b64encode(data.encode('utf-8')).decode('ascii')
+
+    def get_cursor(self, todo : TodoModel) -> str:
+        """Returns an opaque string identifying the position of a todo
+        in the sorted todos, which remains valid across invocations."""
+
+        return ToDoSorter.make_cursor(ToDoSorter.encode_key(self.get_key(todo)), todo.get_string('uid'))
+
+    def __decode_cursor(self, cursor : str) -> Tuple[Tuple[Any, ...], str]:
+
+        try:
+            elements, uid = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+            key = ToDoSorter.decode_key(elements)
+        except (ValueError, TypeError, KeyError, binascii.Error) as err:
+            raise InvalidCursorError(cursor) from err
+
+        if len(key) != len(self.keys):
+            raise InvalidCursorError(cursor)
+
+        return (key, str(uid))
+
+    def get_sorted(self) -> List[TodoModel]:
+        """Returns the todos sorted by the sort keys, restricted
+        to the window given by limit, offset and cursor."""
+
+        # Decode the key of each todo only once and use the UID and list
+        # as tie breakers, which makes the order independent of the order
+        # in which the todos are read. The same todo may be stored in
+        # several files, e.g., by a sync tool, so the position of each todo
+        # breaks remaining ties instead of comparing todos with each other.
+        decorated = [(self.get_key(todo), todo.get_string('uid'), str(todo.context.get('list', "")), index, todo)
+                     for index, todo in enumerate(self.todos)]
+
+        # Resuming after a cursor only requires to skip the todos
+        # that precede it, without sorting any of them.
+        if self.after is not None:
+            position = self.__decode_cursor(self.after)
+            decorated = [entry for entry in decorated if (entry[0], entry[1]) > position]
+
+        self.remaining = max(len(decorated) - self.offset, 0)
+
+        if self.limit is not None and self.offset + self.limit < len(decorated):
+            selected = heapq.nsmallest(self.offset + self.limit, decorated)
+        else:
+            selected = sorted(decorated)
+
+        return [entry[-1] for entry in selected[self.offset:]]
@@ -2,77 +2,16 @@
 #
 # SPDX-License-Identifier: GPL-3.0-or-later
 
-from typing import List, Union, Callable, Optional, Dict
-import tableformatter
-from colorama import Back, Style
+from typing import List, Optional, Dict
+import datetime
+import sys
 
 from icalwarrior.view.formatter import StringFormatter
+from icalwarrior.view.renderer import TableRenderer, WrapMode
 from icalwarrior.view.tagger import Tagger
 from icalwarrior.model.items import TodoModel
 from icalwarrior.configuration import Configuration
 
-class ReportGrid(tableformatter.Grid):
-
-    def __init__(self) -> None:
-        super().__init__()
-        self.show_header = True
-        self.border_top = False
-
-        self.border_top_left = '╔'
-        self.border_top_span = '═'
-        self.border_top_right = '╗'
-        self.border_top_col_divider = '╤'
-        self.border_top_header_col_divider = '╦'
-
-        self.border_header_divider = True
-        self.border_left_header_divider = ''
-        self.border_right_header_divider = ''
-        self.border_header_divider_span = '─'
-        self.border_header_col_divider = '─'
-        self.border_header_header_col_divider = '╬'
-
-        self.border_left = True
-        self.border_left_row_divider = ''
-
-        self.border_right = True
-        self.border_right_row_divider = ''
-
-        self.col_divider = True
-        self.row_divider = False
-        self.row_divider_span = '─'
-
-        self.row_divider_col_divider = '┼'
-        self.row_divider_header_col_divider = '╫'
-
-        self.border_bottom = False
-        self.border_bottom_left = '╚'
-        self.border_bottom_right = '╝'
-        self.border_bottom_span = '═'
-        self.border_bottom_col_divider = '╧'
-        self.border_bottom_header_col_divider = '╩'
-
-        self.bg_reset = Style.RESET_ALL
-        self.bg_primary = Style.RESET_ALL
-        self.bg_alt = Back.BLACK
-
-    def border_left_span(self, row_index: Union[int, None]) -> str:
-        color = self.bg_primary
-        if isinstance(row_index, int) and row_index % 2 == 0:
-                color = self.bg_alt
-        return color
-
-    def border_right_span(self, row_index: Union[int, None]) -> str:
-        return self.bg_reset
-
-    def col_divider_span(self, row_index: Union[int, None]) -> str:
-        color = self.bg_primary
-        if isinstance(row_index, int) and row_index % 2 == 0:
-            color = self.bg_alt
-        return color
-
-    def header_col_divider_span(self, row_index: Union[int, None]) -> str:
-        return '║'
-
 class InvalidReportError(Exception):
 
     def __init__(self, report_name : str, error_msg : str) -> None:
@@ -82,39 +21,75 @@ class InvalidReportError(Exception):
     def __str__(self) -> str:
         return ("Invalid report \"" + self.report_name + "\": " + self.error_msg)
 
+class UnknownTableRendererError(Exception):
+
+    def __init__(self, renderer : str) -> None:
+        self.renderer = renderer
+
+    def __str__(self) -> str:
+        return "Unknown table renderer \"" + self.renderer + "\". Supported renderers are " + ", ".join(TabularPrinter.RENDERERS)
+
 class TabularPrinter:
 
+    RENDERERS = ["native", "tableformatter"]
+
     def __init__(self,
                  rows : List[List[str]],
                  columns : List[str],
                  max_column_width : int,
-                 wrap_mode : tableformatter.WrapMode,
-                 row_tagger : Optional[Callable[[List[str]], Dict[str,int]]]) -> None:
+                 wrap_mode : WrapMode,
+                 row_options : Optional[List[Dict[str,str]]],
+                 renderer : str = "native") -> None:
         self.columns = columns
         self.max_column_width = max_column_width
         self.wrap_mode = wrap_mode
         self.rows = rows
-        self.tagger = row_tagger
+        self.row_options = row_options
+
+        if renderer not in TabularPrinter.RENDERERS:
+            raise UnknownTableRendererError(renderer)
+        self.renderer = renderer
 
     def print(self) -> None:
         # Add single newline at the beginning
         # to make output more readable
         print()
 
+        if self.renderer == "tableformatter":
+            self.__print_with_tableformatter()
+        else:
+            TableRenderer(self.rows, self.columns, self.max_column_width, self.wrap_mode, self.row_options, sys.stdout).render()
+            print()
+
+    def __print_with_tableformatter(self) -> None:
+        # tableformatter is an optional dependency,
+        # so only import it when it is actually used.
+        import tableformatter
+        from icalwarrior.view.grid import ReportGrid
+
+        wrap_mode = tableformatter.WrapMode.WRAP
+        if self.wrap_mode == WrapMode.TRUNCATE_END:
+            wrap_mode = tableformatter.WrapMode.TRUNCATE_END
+
         formatted_cols = self.columns
         if self.max_column_width > 0:
             formatted_cols = [
                 tableformatter.Column(
                     col,
                     width=self.max_column_width,
-                    wrap_mode=self.wrap_mode)
+                    wrap_mode=wrap_mode)
                 for col in self.columns]
 
+        # tableformatter takes the options of a row from
+        # an additional element at the end of the row.
+        rows : List[List[object]] = [list(row) for row in self.rows]
+        if self.row_options is not None:
+            rows = [row + [options] for row, options in zip(rows, self.row_options)]
+
         print(tableformatter.generate_table(
-            self.rows,
+            rows,
             formatted_cols,
-            grid_style=ReportGrid(),
-            row_tagger=self.tagger))
+            grid_style=ReportGrid()))
 
 class TabularToDoListView:
 
@@ -134,38 +109,44 @@ class TabularToDoListView:
 
     def show(self) -> None:
 
-        report_config = self.config.get_config(['reports', self.report_name])
+        report_spec = self.config.get_report(self.report_name)
 
-        if "columns" not in report_config:
+        if report_spec.columns is None:
             raise InvalidReportError(self.report_name, "No columns specified for report.")
 
-        columns = ["id"] + report_config['columns'].split(",")
+        columns = ["id"] + report_spec.columns
 
-        # Check if a maximum number of entries has been configured
-        row_limit = len(self.todos)
-        max_column_width = 0
-        try:
-            if 'max_list_length' in report_config:
-                row_limit = min(report_config['max_list_length'], row_limit)
+        # The todos have already been limited to the rows
+        # to be shown, e.g., according to 'max_list_length'.
+        max_column_width = report_spec.max_column_width
 
-            if 'max_column_width' in report_config:
-                max_column_width = int(report_config['max_column_width'])
+        # Choose the formatting function of each column once,
+        # so that formatting a row only requires applying them.
+        column_formatters = [self.property_formatter.get_property_formatter(column) for column in columns]
 
-        except KeyError:
-            pass
+        # Formatted rows are kept in the cache of each todo, which is cleared
+        # when the todo changes, so that showing a report repeatedly only
+        # formats the rows of changed todos. As rows contain dates relative
+        # to now, they are formatted anew every minute. Rows formatted
+        # according to a previous configuration, e.g., before the
+        # configuration of a shell session has been reloaded, are not reused.
+        cache_key = "row:" + self.report_name + ":" + self.config.get_digest()
+        minute = datetime.datetime.now().strftime("%Y-%m-%dT%H:%M")
 
         rows = []
-
-        for i in range(row_limit):
-            row = []
-            for column in columns:
-                row.append(self.property_formatter.format_property_value(column, self.todos[i]))
-
-            rows.append(row)
+        row_options = []
+        for todo in self.todos:
+            row_stamp = (minute, todo.get_context('id'))
+            cached = todo.cache.get(cache_key, None)
+            if cached is None or cached[0] != row_stamp:
+                cached = (row_stamp, [format_value(todo) for format_value in column_formatters], self.row_tagger.tag(todo))
+                todo.cache[cache_key] = cached
+            rows.append(cached[1])
+            row_options.append(cached[2])
 
         columns = [self.property_formatter.format_property_name(col) for col in columns]
 
-        printer = TabularPrinter(rows, columns, max_column_width, tableformatter.WrapMode.TRUNCATE_END, self.row_tagger.tag)
+        printer = TabularPrinter(rows, columns, max_column_width, WrapMode.TRUNCATE_END, row_options, self.config.get_table_renderer())
         printer.print()
 
 class TabularToDoView:
@@ -192,6 +173,6 @@ class TabularToDoView:
                         self.formatter.format_property_value(prop, self.todo)
                     ])
 
-        printer = TabularPrinter(rows, cols, 0, tableformatter.WrapMode.TRUNCATE_END, None)
+        printer = TabularPrinter(rows, cols, 0, WrapMode.TRUNCATE_END, None, self.config.get_table_renderer())
         printer.print()
 
@@ -2,52 +2,55 @@
 #
 # SPDX-License-Identifier: GPL-3.0-or-later
 
-from typing import List, Dict
+from typing import Dict
 from abc import abstractmethod
 
 from colorama import Fore
 import datetime
 import dateutil.tz as tz
-import tableformatter
 
-from icalwarrior.input.date import adapt_datetype
 from icalwarrior.model.items import TodoModel
+from icalwarrior.view.renderer import ROW_OPT_TEXT_COLOR
 
 class Tagger:
 
     @abstractmethod
-    def tag(self, row : List[str]) -> Dict[str, int]:
+    def tag(self, todo : TodoModel) -> Dict[str, str]:
         pass
 
 class DueDateBasedTagger(Tagger):
 
+    DEFAULT_PAST_THRESHOLD_DAYS = 7
+    DEFAULT_FUTURE_THRESHOLD_DAYS = 1
+
     def __init__(self,
-                 todos : List[TodoModel],
                  past_threshold : datetime.timedelta,
                  future_threshold : datetime.timedelta) -> None:
 
-        self.todos: Dict[str, TodoModel] = {}
-        for todo in todos:
-            self.todos[str(todo.get_context("id"))] = todo
-
         self.past_threshold = past_threshold
         self.future_threshold = future_threshold
         self.date = datetime.datetime.now(tz.gettz())
 
-    def tag(self, row : List[str]) -> Dict[str, int]:
-        opts : Dict[str, int] = {}
+        # Due dates may be given with or without time zone or as dates,
+        # so prepare a comparable current date for each of these cases.
+        self.naive_date = self.date.replace(tzinfo=None)
+        self.day = self.date.date()
 
-        todo = self.todos[row[0]]
+    def tag(self, todo : TodoModel) -> Dict[str, str]:
+        opts : Dict[str, str] = {}
 
         if todo.has_property("due"):
             due_date = todo.get_date_or_datetime("due")
-            now = adapt_datetype(self.date, due_date)
+
+            now : datetime.datetime | datetime.date = self.day
+            if isinstance(due_date, datetime.datetime):
+                now = self.date if due_date.tzinfo is not None and due_date.tzinfo.utcoffset(due_date) is not None else self.naive_date
 
             if due_date > now and due_date - now > self.future_threshold:
-                opts[tableformatter.TableFormatter.ROW_OPT_TEXT_COLOR] = Fore.GREEN
+                opts[ROW_OPT_TEXT_COLOR] = Fore.GREEN
             elif now > due_date and now - due_date > self.past_threshold:
-                opts[tableformatter.TableFormatter.ROW_OPT_TEXT_COLOR] = Fore.RED
+                opts[ROW_OPT_TEXT_COLOR] = Fore.RED
             else:
-                opts[tableformatter.TableFormatter.ROW_OPT_TEXT_COLOR] = Fore.YELLOW
+                opts[ROW_OPT_TEXT_COLOR] = Fore.YELLOW
 
         return opts
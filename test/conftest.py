@@ -0,0 +1,10 @@
+# SPDX-FileCopyrightText: 2022 Martin Byrenheid <martin@byrenheid.net>
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import pytest
+
+@pytest.fixture(autouse=True)
+def cache_home(tmp_path, monkeypatch):
+    # Keep the compiled configurations of the tests out of the user's cache
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
@@ -0,0 +1,101 @@
+# SPDX-FileCopyrightText: 2022 Martin Byrenheid <martin@byrenheid.net>
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+"""Measures how the time needed to query many todos scales with the number
+of worker processes given by --jobs, compared to reading all todo lists
+in a single process.
+
+Usage: python test/parallel_benchmark.py [--todos N] [--lists N] [--runs N] [--jobs N...] [COMMAND...]"""
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from typing import List
+
+DEFAULT_COMMANDS = ["export --fields id,summary status:needs-action priority.gt:5", "report"]
+
+TODO_TEMPLATE = """BEGIN:VCALENDAR
+VERSION:2.0
+PRODID:-//benchmark//EN
+BEGIN:VTODO
+UID:{uid}
+DTSTAMP:20220101T000000Z
+CREATED:20220101T000000Z
+SUMMARY:Todo {index}
+DESCRIPTION:Description of todo {index}
+STATUS:{status}
+PRIORITY:{priority}
+DUE;VALUE=DATE:202201{day:02d}
+CATEGORIES:benchmark
+END:VTODO
+END:VCALENDAR
+"""
+
+def create_todos(lists_dir: str, num_todos: int, num_lists: int) -> None:
+
+    for list_index in range(num_lists):
+        os.makedirs(os.path.join(lists_dir, "list" + str(list_index)))
+
+    for index in range(num_todos):
+        uid = str(uuid.uuid4())
+        path = os.path.join(lists_dir, "list" + str(index % num_lists), uid + ".ics")
+        with open(path, "w") as todo_file:
+            todo_file.write(TODO_TEMPLATE.format(uid=uid, index=index,
+                                                 status="completed" if index % 3 == 0 else "needs-action",
+                                                 priority=index % 10, day=index % 28 + 1).replace("\n", "\r\n"))
+
+def measure(config_path: str, command: List[str]) -> float:
+    """Runs a command and returns its wall-clock time in milliseconds."""
+
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.path.join(os.path.dirname(__file__), "..", "src")
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "-c", "from icalwarrior.cli import main; main()", "-c", config_path] + command,
+                   env=env, stdout=subprocess.DEVNULL, check=True)
+    return (time.perf_counter() - start) * 1000.0
+
+def main(args: List[str]) -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--todos", type=int, default=20000, help="Number of todos to create")
+    parser.add_argument("--lists", type=int, default=8, help="Number of lists to distribute the todos among")
+    parser.add_argument("--runs", type=int, default=3, help="Number of runs, of which the fastest one is reported")
+    parser.add_argument("--jobs", type=int, nargs="+", default=None, help="Numbers of worker processes to compare (default: powers of two up to the number of cores)")
+    parser.add_argument("commands", nargs="*", default=DEFAULT_COMMANDS)
+    options = parser.parse_args(args)
+
+    jobs = options.jobs
+    if jobs is None:
+        jobs = [1]
+        while jobs[-1] * 2 <= (os.cpu_count() or 1):
+            jobs.append(jobs[-1] * 2)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        lists_dir = os.path.join(tmp_dir, "lists")
+        create_todos(lists_dir, options.todos, options.lists)
+        config_path = os.path.join(tmp_dir, "config.yaml")
+        with open(config_path, "w") as config_file:
+            config_file.write("lists_dir: " + lists_dir + "\nstate_dir: " + os.path.join(tmp_dir, "state") + "\n"
+                              + "reports:\n  default:\n    columns: id,summary,due\n    constraint: status:needs-action\n"
+                              + "    sort: due+,priority-\n    max_list_length: 30\n")
+
+        print("%d todos in %d lists, %d cores" % (options.todos, options.lists, os.cpu_count() or 1))
+        for command in options.commands:
+            print("todo " + command)
+            serial = 0.0
+            for num_jobs in jobs:
+                args = command.split()
+                args.insert(1, "--jobs=" + str(num_jobs))
+                total = min(measure(config_path, args) for _ in range(options.runs))
+                if num_jobs == 1:
+                    serial = total
+                print("    %3d jobs %9.1f ms  speedup %.2f" % (num_jobs, total, serial / total))
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,83 @@
+# SPDX-FileCopyrightText: 2022 Martin Byrenheid <martin@byrenheid.net>
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+"""Measures the time needed to import the modules of a command using
+"python -X importtime" and fails if it exceeds a budget.
+
+Usage: python test/startup_benchmark.py [--budget MS] [--runs N] [COMMAND...]"""
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+from typing import Dict, List, Tuple
+
+DEFAULT_BUDGET_MS = 50
+DEFAULT_COMMANDS = ["count", "calculate today+1d", "--help"]
+
+# Modules that only commands reading or showing todos should need
+DEFERRED_MODULES = ["icalendar", "humanize", "tableformatter", "wcwidth", "colorama"]
+
+def measure(config_path: str, command: str) -> Tuple[float, Dict[str, int]]:
+    """Runs a command and returns its total import time in milliseconds
+    as well as the cumulative import time of each top-level module."""
+
+    script = ("import sys; sys.argv = ['todo', '-c', " + repr(config_path) + "] + " + repr(command.split()) + "\n"
+              "from icalwarrior.cli import main\n"
+              "try:\n    main()\nexcept SystemExit:\n    pass\n")
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.path.join(os.path.dirname(__file__), "..", "src")
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", script],
+                            env=env, capture_output=True, text=True, check=False)
+
+    modules: Dict[str, int] = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        # Only count top-level imports, as nested ones are
+        # included in the cumulative time of their parents.
+        if not name.startswith("  "):
+            modules[name.strip()] = int(cumulative)
+
+    return (sum(modules.values()) / 1000.0, modules)
+
+def main(args: List[str]) -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--budget", type=float, default=DEFAULT_BUDGET_MS, help="Maximum import time in milliseconds")
+    parser.add_argument("--runs", type=int, default=5, help="Number of runs, of which the fastest one is reported")
+    parser.add_argument("commands", nargs="*", default=DEFAULT_COMMANDS)
+    options = parser.parse_args(args)
+
+    failed = False
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        lists_dir = os.path.join(tmp_dir, "lists")
+        os.makedirs(os.path.join(lists_dir, "inbox"))
+        config_path = os.path.join(tmp_dir, "config.yaml")
+        with open(config_path, "w") as config_file:
+            config_file.write("lists_dir: " + lists_dir + "\nstate_dir: " + os.path.join(tmp_dir, "state") + "\n")
+
+        for command in options.commands:
+            # Let the first run create the state files
+            measure(config_path, command)
+            runs = [measure(config_path, command) for _ in range(options.runs)]
+            total, modules = min(runs, key=lambda run: run[0])
+
+            deferred = [name for name in modules if name.split(".")[0] in DEFERRED_MODULES]
+            status = "ok"
+            if total > options.budget or len(deferred) > 0:
+                status = "FAILED"
+                failed = True
+
+            print("todo %-22s %6.1f ms (budget %.0f ms) %s" % (command, total, options.budget, status))
+            for name, cumulative in sorted(modules.items(), key=lambda item: -item[1])[:5]:
+                print("    %-30s %6.1f ms" % (name, cumulative / 1000.0))
+            if len(deferred) > 0:
+                print("    imports deferred modules: " + ", ".join(deferred))
+
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
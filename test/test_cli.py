@@ -2,11 +2,17 @@
 #
 # SPDX-License-Identifier: GPL-3.0-or-later
 
+import os
+import sys
+import subprocess
 import datetime
+import json
 from dateutil.relativedelta import relativedelta
 from click.testing import CliRunner
 from icalwarrior.cli import run_cli
 from icalwarrior.model.lists import TodoDatabase
+from icalwarrior.model.views import MaterializedReports
+from icalwarrior.model.counters import StatusCounters
 from icalwarrior.input.date import today_as_datetime
 from icalwarrior.configuration import Configuration
 from icalwarrior.filtering.constraints import ConstraintEvaluator
@@ -66,6 +72,56 @@ def test_adding():
 
     remove_dummy_calendars(tmp_dir, config_file_path)
 
+def test_add_reports_id_of_new_todo():
+
+    tmp_dir, config_file_path = setup_dummy_calendars(["test1", "test2"])
+    config = Configuration(config_file_path)
+
+    runner = CliRunner()
+    for summary in ["Task A", "Task B", "Task C"]:
+        result = runner.invoke(run_cli, ["-c", str(config_file_path), "add", "test2", summary])
+        assert result.exit_code == 0
+    result = runner.invoke(run_cli, ["-c", str(config_file_path), "add", "test1", "Task D"])
+    assert result.exit_code == 0
+
+    cal_db = TodoDatabase(config)
+    todo = cal_db.get_todos(ConstraintEvaluator.from_string_list(config, ["summary:Task D"]))[0]
+    assert todo.get_context('id') == 1
+    assert "with ID 1." in result.output
+
+    remove_dummy_calendars(tmp_dir, config_file_path)
+
+def test_add_from_file():
+
+    tmp_dir, config_file_path = setup_dummy_calendars(["test1", "test2"])
+    config = Configuration(config_file_path)
+
+    batch = "\n".join([
+        'test1 "First task" +cat1',
+        '# comment lines and empty lines are skipped',
+        '',
+        'test2 "Second task" due:today',
+        'te "Ambiguous list"'])
+
+    runner = CliRunner()
+    result = runner.invoke(run_cli, ["-c", str(config_file_path), "add", "--from", "-"], input=batch)
+    assert result.exit_code > 0
+
+    cal_db = TodoDatabase(config)
+    assert len(cal_db.get_todos()) == 0
+
+    batch = batch.replace('te "Ambiguous list"', 'test2 "Third task"')
+    result = runner.invoke(run_cli, ["-c", str(config_file_path), "add", "--from", "-"], input=batch)
+    assert result.exit_code == 0
+
+    cal_db = TodoDatabase(config)
+    todos = cal_db.get_todos()
+    assert len(todos) == 3
+    for todo in todos:
+        assert ("\"" + todo.get_string('summary') + "\" with ID " + str(todo.get_context('id')) + ".") in result.output
+
+    remove_dummy_calendars(tmp_dir, config_file_path)
+
 def test_add_empty_summary():
 
     tmp_dir, config_file_path = setup_dummy_calendars(["test"])
@@ -366,3 +422,397 @@ def test_list_cleanup():
     cal_db = TodoDatabase(config)
     todos = cal_db.get_todos()
     assert len(todos) == 1
+
+def test_export_formats():
+
+    tmp_dir, config_file_path = setup_dummy_calendars(["test"])
+
+    runner = CliRunner()
+    result = runner.invoke(run_cli, ["-c", str(config_file_path), "add", "test", "Testtask", "+testcat"])
+    result = runner.invoke(run_cli, ["-c", str(config_file_path), "add", "test", "Testtask 2"])
+    assert result.exit_code == 0
+
+    result = runner.invoke(run_cli, ["-c", str(config_file_path), "export"])
+    assert result.exit_code == 0
+    records = json.loads(result.output)
+    assert len(records) == 2
+    assert "SUMMARY" in records[0]
+
+    result = runner.invoke(run_cli, ["-c", str(config_file_path), "export", "--format", "ndjson", "--fields", "id,summ", "+testcat"])
+    assert result.exit_code == 0
+    lines = result.output.splitlines()
+    assert len(lines) == 1
+    record = json.loads(lines[0])
+    assert list(record.keys()) == ["id", "summary"]
+    assert record["summary"] == "Testtask"
+
+    result = runner.invoke(run_cli, ["-c", str(config_file_path), "export", "--format", "csv", "--fields", "id,summary"])
+    assert result.exit_code == 0
+    lines = result.output.splitlines()
+    assert lines[0] == "id,summary"
+    assert len(lines) == 3
+
+    result = runner.invoke(run_cli, ["-c", str(config_file_path), "export", "--fields", "unknown"])
+    assert result.exit_code > 0
+
+    remove_dummy_calendars(tmp_dir, config_file_path)
+
+def test_export_changes_since_generation():
+
+    tmp_dir, config_file_path = setup_dummy_calendars(["test"])
+
+    runner = CliRunner()
+    result = runner.invoke(run_cli, ["-c", str(config_file_path), "add", "test", "Testtask"])
+    assert result.exit_code == 0
+
+    result = runner.invoke(run_cli, ["-c", str(config_file_path), "export", "--since", "0", "--fields", "summary"])
+    assert result.exit_code == 0
+    records = [json.loads(line) for line in result.output.splitlines()]
+    assert records[0]["operation"] == "create"
+    assert records[0]["todo"] == {"summary": "Testtask"}
+    assert records[-1] == {"operation": "checkpoint", "generation": 1}
+
+    result = runner.invoke(run_cli, ["-c", str(config_file_path), "del", "1"], input="y")
+    assert result.exit_code == 0
+
+    result = runner.invoke(run_cli, ["-c", str(config_file_path), "export", "--since", "1"])
+    assert result.exit_code == 0
+    records = [json.loads(line) for line in result.output.splitlines()]
+    assert len(records) == 2
+    assert records[0]["operation"] == "delete"
+    assert records[0]["list"] == "test"
+    assert records[1] == {"operation": "checkpoint", "generation": 2}
+
+    result = runner.invoke(run_cli, ["-c", str(config_file_path), "export", "--since", "2"])
+    assert result.exit_code == 0
+    assert len(result.output.splitlines()) == 1
+
+    # A checkpoint from the future is rejected instead of exporting all todos
+    result = runner.invoke(run_cli, ["-c", str(config_file_path), "export", "--since", "3"])
+    assert result.exit_code > 0
+    assert "Generation 3 is not recorded in the journal. The latest generation is 2." in result.output
+
+    result = runner.invoke(run_cli, ["-c", str(config_file_path), "export", "--since", "today", "--format", "csv"])
+    assert result.exit_code > 0
+
+    # Changes since a date include the deletion and the todo created today
+    result = runner.invoke(run_cli, ["-c", str(config_file_path), "export", "--since", "today"])
+    assert result.exit_code == 0
+    records = [json.loads(line) for line in result.output.splitlines()]
+    assert [record["operation"] for record in records] == ["delete", "checkpoint"]
+
+    result = runner.invoke(run_cli, ["-c", str(config_file_path), "export", "--since", "tomorrow"])
+    assert result.exit_code == 0
+    assert len(result.output.splitlines()) == 1
+
+    remove_dummy_calendars(tmp_dir, config_file_path)
+
+def test_report_paging():
+
+    tmp_dir, config_file_path = setup_dummy_calendars(["test"])
+    with open(config_file_path, "a") as config_file:
+        config_file.write("reports:\n  default:\n    columns: summary,due\n    max_list_length: 2\n")
+
+    runner = CliRunner()
+    batch = "\n".join(["test Task" + str(i) + " due:today+" + str(i) + "d" for i in range(1, 6)])
+    result = runner.invoke(run_cli, ["-c", str(config_file_path), "add", "--from", "-"], input=batch)
+    assert result.exit_code == 0
+
+    result = runner.invoke(run_cli, ["-c", str(config_file_path), "report"])
+    assert result.exit_code == 0
+    assert "Task1" in result.output and "Task2" in result.output and "Task3" not in result.output
+    assert "Showing 2 out of 5 todos." in result.output
+
+    cursor = result.output.split("--after ")[1].split(" ")[0]
+    result = runner.invoke(run_cli, ["-c", str(config_file_path), "report", "--after", cursor])
+    assert result.exit_code == 0
+    assert "Task3" in result.output and "Task4" in result.output and "Task2" not in result.output
+
+    result = runner.invoke(run_cli, ["-c", str(config_file_path), "report", "--offset", "4", "--limit", "3"])
+    assert result.exit_code == 0
+    assert "Task5" in result.output and "Task4" not in result.output
+    assert "--after" not in result.output
+
+    result = runner.invoke(run_cli, ["-c", str(config_file_path), "report", "--page"], env={"PAGER": "cat"})
+    assert result.exit_code == 0
+    assert "Showing 5 out of 5 todos." in result.output
+
+    remove_dummy_calendars(tmp_dir, config_file_path)
+
+def test_parallel_queries():
+
+    tmp_dir, config_file_path = setup_dummy_calendars(["home", "work"])
+    with open(config_file_path, "a") as config_file:
+        config_file.write("reports:\n  default:\n    columns: list,summary,due\n    sort: due+,summary\n    constraint: status:needs-action\n    max_list_length: 3\n")
+
+    runner = CliRunner()
+    batch = "\n".join([("home" if i % 2 == 0 else "work") + " Task" + str(i) + " due:today+" + str(i % 4) + "d" for i in range(1, 10)])
+    result = runner.invoke(run_cli, ["-c", str(config_file_path), "add", "--from", "-"], input=batch)
+    assert result.exit_code == 0
+    result = runner.invoke(run_cli, ["-c", str(config_file_path), "done", "2"])
+    assert result.exit_code == 0
+
+    # Running queries in worker processes yields the same results
+    for args in [["export", "--fields", "id,list,summary", "status:needs-action"],
+                 ["export", "--format", "csv"],
+                 ["report"],
+                 ["report", "--offset", "2", "--limit", "4", "default", "list:work"]]:
+        serial = runner.invoke(run_cli, ["-c", str(config_file_path)] + args)
+        assert serial.exit_code == 0
+        parallel = runner.invoke(run_cli, ["-c", str(config_file_path)] + args + ["--jobs", "2"])
+        assert parallel.exit_code == 0
+        assert parallel.output == serial.output
+
+    result = runner.invoke(run_cli, ["-c", str(config_file_path), "export", "--jobs", "2", "id:1"])
+    assert result.exit_code > 0
+
+    remove_dummy_calendars(tmp_dir, config_file_path)
+
+def test_stats():
+
+    tmp_dir, config_file_path = setup_dummy_calendars(["test1", "test2"])
+
+    runner = CliRunner()
+    result = runner.invoke(run_cli, ["-c", str(config_file_path), "add", "test1", "Testtask", "+home"])
+    result = runner.invoke(run_cli, ["-c", str(config_file_path), "add", "test1", "Testtask 2", "+work"])
+    assert result.exit_code == 0
+    result = runner.invoke(run_cli, ["-c", str(config_file_path), "done", "1"])
+    assert result.exit_code == 0
+
+    result = runner.invoke(run_cli, ["-c", str(config_file_path), "stats", "--group-by", "status", "--group-by", "category"])
+    assert result.exit_code == 0
+    assert "completed" in result.output
+    assert "needs-action" in result.output
+    assert "home" in result.output and "work" in result.output
+
+    result = runner.invoke(run_cli, ["-c", str(config_file_path), "stats", "--group-by", "unknown"])
+    assert result.exit_code > 0
+
+    remove_dummy_calendars(tmp_dir, config_file_path)
+
+def test_count(monkeypatch):
+
+    tmp_dir, config_file_path = setup_dummy_calendars(["test1", "test2"])
+
+    runner = CliRunner()
+    result = runner.invoke(run_cli, ["-c", str(config_file_path), "count"])
+    assert result.exit_code == 0
+    assert result.output.strip() == "0 total, 0 open, 0 overdue, 0 today"
+
+    result = runner.invoke(run_cli, ["-c", str(config_file_path), "add", "test1", "Overdue", "due:today-1d"])
+    result = runner.invoke(run_cli, ["-c", str(config_file_path), "add", "test1", "Today", "due:today"])
+    result = runner.invoke(run_cli, ["-c", str(config_file_path), "add", "test2", "Later", "due:tomorrow"])
+    assert result.exit_code == 0
+
+    result = runner.invoke(run_cli, ["-c", str(config_file_path), "count", "overdue"])
+    assert result.exit_code == 0
+    assert result.output.strip() == "1"
+
+    cal_db = TodoDatabase(Configuration(config_file_path))
+    overdue = [todo for todo in cal_db.get_todos() if todo.get_string('summary') == "Overdue"][0]
+    result = runner.invoke(run_cli, ["-c", str(config_file_path), "done", str(overdue.get_context('id'))])
+    assert result.exit_code == 0
+
+    result = runner.invoke(run_cli, ["-c", str(config_file_path), "count"])
+    assert result.output.strip() == "3 total, 2 open, 0 overdue, 1 today"
+
+    result = runner.invoke(run_cli, ["-c", str(config_file_path), "count", "--list", "test2", "open"])
+    assert result.output.strip() == "1"
+
+    result = runner.invoke(run_cli, ["-c", str(config_file_path), "count", "--list", "typo"])
+    assert result.exit_code != 0
+    assert "Todo list typo not found." in result.output
+
+    # Adding several todos at once writes the counters only once
+    written = []
+    write_json = StatusCounters._StatusCounters__write_json
+    monkeypatch.setattr(StatusCounters, "_StatusCounters__write_json",
+                        staticmethod(lambda path, data: written.append(os.path.basename(path)) or write_json(path, data)))
+    result = runner.invoke(run_cli, ["-c", str(config_file_path), "add", "--from", "-"], input="test2 First\ntest2 Second\ntest2 Third\n")
+    assert result.exit_code == 0
+    assert written == ["test2.json", "summary.json"]
+    monkeypatch.undo()
+
+    result = runner.invoke(run_cli, ["-c", str(config_file_path), "count", "--list", "test2", "open"])
+    assert result.output.strip() == "4"
+
+    # Files added by another application are noticed through the
+    # modification time of the list directory.
+    with open(os.path.join(tmp_dir.name, "test2", "external.ics"), "w") as ics_file:
+        ics_file.write("BEGIN:VCALENDAR\r\nVERSION:2.0\r\nPRODID:test\r\nBEGIN:VTODO\r\nUID:external\r\nSUMMARY:External\r\nEND:VTODO\r\nEND:VCALENDAR\r\n")
+
+    result = runner.invoke(run_cli, ["-c", str(config_file_path), "count", "total"])
+    assert result.output.strip() == "7"
+
+    remove_dummy_calendars(tmp_dir, config_file_path)
+
+def test_materialized_report(monkeypatch):
+
+    tmp_dir, config_file_path = setup_dummy_calendars(["a", "b"])
+    with open(config_file_path, "a") as config_file:
+        config_file.write("reports:\n  default:\n    columns: list,summary,due\n    constraint: status.not_equals:completed\n    max_list_length: 3\n    materialize: true\n")
+
+    runner = CliRunner()
+    batch = "\n".join([list_name + " Task" + list_name + str(i) + " due:today+" + str(i) + "d" for i in range(1, 4) for list_name in ["a", "b"]])
+    result = runner.invoke(run_cli, ["-c", str(config_file_path), "add", "--from", "-"], input=batch)
+    assert result.exit_code == 0
+
+    config = Configuration(config_file_path)
+
+    def check_report():
+        # The stored report needs to be up to date and show
+        # the same todos and IDs as computing the report anew.
+        assert MaterializedReports(config).get_head("default") is not None
+        stored = runner.invoke(run_cli, ["-c", str(config_file_path), "report"])
+        computed = runner.invoke(run_cli, ["-c", str(config_file_path), "report", "default", "status.not_equals:cancelled"])
+        assert stored.exit_code == 0
+        assert stored.output == computed.output
+        return stored.output
+
+    result = runner.invoke(run_cli, ["-c", str(config_file_path), "report"])
+    assert result.exit_code == 0
+    assert "Showing 3 out of 6 todos." in check_report()
+
+    result = runner.invoke(run_cli, ["-c", str(config_file_path), "add", "a", "Urgent", "due:today"])
+    assert "Urgent" in check_report()
+
+    cal_db = TodoDatabase(config)
+    first = [todo for todo in cal_db.get_todos() if todo.get_string('summary') == "Urgent"][0]
+    result = runner.invoke(run_cli, ["-c", str(config_file_path), "done", str(first.get_context('id'))])
+    assert result.exit_code == 0
+    assert "Urgent" not in check_report()
+
+    second = [todo for todo in cal_db.get_todos() if todo.get_string('summary') == "Taska1"][0]
+    result = runner.invoke(run_cli, ["-c", str(config_file_path), "delete", str(second.get_context('id'))], input="y\n")
+    assert result.exit_code == 0
+    assert "Showing 3 out of 5 todos." in check_report()
+
+    # Showing todos beyond the stored ones does not rewrite the report
+    head_path = os.path.join(tmp_dir.name + ".state", "views", "default.json")
+    head_mtime = os.stat(head_path).st_mtime_ns
+    result = runner.invoke(run_cli, ["-c", str(config_file_path), "report", "--offset", "3"])
+    assert result.exit_code == 0
+    assert "Showing 2 out of 5 todos." in result.output
+    assert os.stat(head_path).st_mtime_ns == head_mtime
+
+    # Adding several todos at once rewrites the report only once
+    written = []
+    write_json = MaterializedReports._MaterializedReports__write_json
+    monkeypatch.setattr(MaterializedReports, "_MaterializedReports__write_json",
+                        staticmethod(lambda path, data: written.append(os.path.basename(path)) or write_json(path, data)))
+    result = runner.invoke(run_cli, ["-c", str(config_file_path), "add", "--from", "-"], input="a Later due:today+9d\nb Sooner due:today\na Never\n")
+    assert result.exit_code == 0
+    assert written == ["default.members.json", "default.json"] * 2
+    monkeypatch.undo()
+    assert "Sooner" in check_report()
+
+    # Changing a todo outside of the report only rewrites the first todos,
+    # and further changes use the report loaded by the list.
+    cal_db = TodoDatabase(config)
+    todo_list = cal_db.get_list("a")
+    urgent = [todo for todo in todo_list.get_todos() if todo.get_string('summary') == "Urgent"][0]
+    written.clear()
+    read = []
+    read_json = MaterializedReports._MaterializedReports__read_json
+    monkeypatch.setattr(MaterializedReports, "_MaterializedReports__write_json",
+                        staticmethod(lambda path, data: written.append(os.path.basename(path)) or write_json(path, data)))
+    monkeypatch.setattr(MaterializedReports, "_MaterializedReports__read_json",
+                        staticmethod(lambda path: read.append(os.path.basename(path)) or read_json(path)))
+    urgent.set_properties({'summary' : 'Urgent, but done'})
+    todo_list.add(urgent.get_ical_todo())
+    assert written == ["default.json"]
+    assert read.count("default.members.json") == 1
+
+    later = [todo for todo in todo_list.get_todos() if todo.get_string('summary') == "Later"][0]
+    later.set_properties({'due' : datetime.date.today()})
+    todo_list.add(later.get_ical_todo())
+    assert written == ["default.json", "default.members.json", "default.json"]
+    assert read.count("default.members.json") == 1
+    monkeypatch.undo()
+    assert "Later" in check_report()
+
+    remove_dummy_calendars(tmp_dir, config_file_path)
+
+def test_count_does_not_import_icalendar():
+
+    tmp_dir, config_file_path = setup_dummy_calendars(["test"])
+
+    runner = CliRunner()
+    result = runner.invoke(run_cli, ["-c", str(config_file_path), "count"])
+    result = runner.invoke(run_cli, ["-c", str(config_file_path), "add", "test", "Testtask"])
+    assert result.exit_code == 0
+
+    # The counters are up to date, so that no todo lists need to be read
+    script = ("import sys\n"
+              "from icalwarrior.cli import run_cli\n"
+              "try:\n    run_cli(['-c', " + repr(str(config_file_path)) + ", 'count', 'open'])\nexcept SystemExit:\n    pass\n"
+              "print('icalendar' in sys.modules)\n")
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.path.join(os.path.dirname(__file__), "..", "src")
+    output = subprocess.run([sys.executable, "-c", script], env=env, capture_output=True, text=True, check=True).stdout
+    assert output.split() == ["1", "False"]
+
+    remove_dummy_calendars(tmp_dir, config_file_path)
+
+def test_shell():
+
+    tmp_dir, config_file_path = setup_dummy_calendars(["test"])
+
+    runner = CliRunner()
+    result = runner.invoke(run_cli, ["-c", str(config_file_path), "add", "test", "Existing"])
+    assert result.exit_code == 0
+
+    commands = "\n".join([
+        "add test \"New task\"",
+        "modify 2 +home",
+        "show 2",
+        "done 1",
+        "unknowncommand",
+        "exit"])
+    result = runner.invoke(run_cli, ["-c", str(config_file_path), "shell"], input=commands + "\n")
+    assert result.exit_code == 0
+    assert "with ID 2" in result.output
+    assert "home" in result.output
+    assert "Set status of todo 1 to COMPLETED." in result.output
+    assert "Invalid command" in result.output
+
+    remove_dummy_calendars(tmp_dir, config_file_path)
+
+def test_batch():
+
+    tmp_dir, config_file_path = setup_dummy_calendars(["test"])
+
+    runner = CliRunner()
+    result = runner.invoke(run_cli, ["-c", str(config_file_path), "add", "test", "Existing"])
+    assert result.exit_code == 0
+
+    commands = "\n".join([
+        "# IDs refer to the todos before running the batch",
+        "add test \"New task\"",
+        "modify 1 +home",
+        "",
+        "unknowncommand",
+        "delete 1"])
+    result = runner.invoke(run_cli, ["-c", str(config_file_path), "batch"], input=commands + "\n")
+    assert result.exit_code == 0
+
+    results = [json.loads(line) for line in result.output.splitlines()]
+    assert [entry['status'] for entry in results] == ["ok", "ok", "error", "ok"]
+    assert results[0]['command'] == ["add", "test", "New task"]
+    assert "with ID 2" in results[0]['output']
+    assert "Invalid command" in results[2]['error']
+
+    config = Configuration(config_file_path)
+    todos = TodoDatabase(config).get_todos()
+    assert [todo.get_string('summary') for todo in todos] == ["New task"]
+
+    commands = json.dumps([["modify", "1", "+work"], "unknowncommand", "delete 1"])
+    result = runner.invoke(run_cli, ["-c", str(config_file_path), "batch", "--stop-on-error"], input=commands)
+    assert result.exit_code == 1
+    assert len(result.output.splitlines()) == 2
+
+    todos = TodoDatabase(config).get_todos()
+    assert len(todos) == 1
+    assert "work" in todos[0].get_categories()
+
+    remove_dummy_calendars(tmp_dir, config_file_path)
@@ -2,7 +2,7 @@ import os
 import os.path
 from tempfile import NamedTemporaryFile, gettempdir
 import pytest
-from icalwarrior.configuration import Configuration, InvalidConfigurationFileError
+from icalwarrior.configuration import Configuration, InvalidConfigurationFileError, InvalidConfigurationValueError, UnknownConfigurationOptionError
 
 def test_invalid_config_file_unterminated_string():
 
@@ -24,3 +24,64 @@ def test_invalid_config_file_format():
 
     with pytest.raises(InvalidConfigurationFileError):
         config = Configuration(config_file_path)
+
+def test_compiled_config_is_cached(tmp_path, monkeypatch):
+
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+    config_file_path = tmp_path / "config.yaml"
+    config_file_path.write_text("lists_dir: /tmp\nreports:\n  default:\n    columns: summary, due\n    constraint: status:needs-action and +home\n")
+
+    config = Configuration(str(config_file_path))
+    report = config.get_report("default")
+    assert report.columns == ["summary", "due"]
+    assert report.constraints == ["status:needs-action", "and", "+home"]
+    assert report.max_list_length is None
+    assert len(os.listdir(Configuration.get_cache_dir())) == 1
+
+    # An unchanged configuration file is not parsed again
+    monkeypatch.setattr("yaml.load", None)
+    config = Configuration(str(config_file_path))
+    assert config.get_lists_dir() == "/tmp"
+    assert config.get_report("default").columns == ["summary", "due"]
+
+    # Caches of configuration files that no longer exist are removed
+    # once another configuration is cached
+    monkeypatch.undo()
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+    other_path = tmp_path / "other.yaml"
+    other_path.write_text("lists_dir: /tmp\n")
+    Configuration(str(other_path))
+    assert len(os.listdir(Configuration.get_cache_dir())) == 2
+    os.remove(other_path)
+    config_file_path.write_text("lists_dir: /var/tmp\n")
+    assert Configuration(str(config_file_path)).get_lists_dir() == "/var/tmp"
+    assert len(os.listdir(Configuration.get_cache_dir())) == 1
+
+def test_invalid_config_values(tmp_path, monkeypatch):
+
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+    config_file_path = tmp_path / "config.yaml"
+
+    config_file_path.write_text("lists_dir: 42\n")
+    with pytest.raises(InvalidConfigurationValueError):
+        Configuration(str(config_file_path))
+
+    config_file_path.write_text("read_concurrency: 0\n")
+    with pytest.raises(InvalidConfigurationValueError):
+        Configuration(str(config_file_path))
+
+    config_file_path.write_text("load_cache: always\n")
+    with pytest.raises(InvalidConfigurationValueError):
+        Configuration(str(config_file_path))
+
+    config_file_path.write_text("storage: memory\n")
+    with pytest.raises(InvalidConfigurationValueError):
+        Configuration(str(config_file_path))
+
+    config_file_path.write_text("reports:\n  default:\n    max_list_length: many\n")
+    with pytest.raises(InvalidConfigurationValueError):
+        Configuration(str(config_file_path))
+
+    config_file_path.write_text("reports:\n  default:\n    colums: summary\n")
+    with pytest.raises(UnknownConfigurationOptionError):
+        Configuration(str(config_file_path))
@@ -0,0 +1,99 @@
+# SPDX-FileCopyrightText: 2022 Martin Byrenheid <martin@byrenheid.net>
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import os
+import threading
+import time
+import pytest
+
+from icalwarrior.cli import main
+from icalwarrior.daemon import TodoDaemon, forward_command, get_socket_path, send_request
+from icalwarrior.model.lists import TodoDatabase
+from icalwarrior.model.items import TodoModel
+from icalwarrior.configuration import Configuration
+from util import setup_dummy_calendars, remove_dummy_calendars
+
+def start_daemon(config_file_path):
+
+    config = Configuration(config_file_path)
+    socket_path = get_socket_path(config)
+    todo_daemon = TodoDaemon(config_file_path)
+    thread = threading.Thread(target=todo_daemon.serve, args=(socket_path, False))
+    thread.start()
+
+    for _ in range(100):
+        if send_request(socket_path, {'control' : 'ping'}) is not None:
+            break
+        time.sleep(0.05)
+
+    return (thread, socket_path)
+
+def test_forward_command(capsys):
+
+    tmp_dir, config_file_path = setup_dummy_calendars(["test"])
+
+    # Without a daemon, commands are run by the client
+    assert forward_command(config_file_path, ["report"]) is None
+
+    thread, socket_path = start_daemon(config_file_path)
+    try:
+        assert forward_command(config_file_path, ["add", "test", "Via daemon"]) == 0
+        assert "with ID 1" in capsys.readouterr().out
+
+        # Changes made by other applications are noticed
+        config = Configuration(config_file_path)
+        cal_db = TodoDatabase(config)
+        todo = TodoModel(config, cal_db.create_todo())
+        todo.set_properties({'summary': 'Written directly'})
+        cal_db.get_list("test").add(todo.get_ical_todo())
+
+        assert forward_command(config_file_path, ["export", "--fields", "summary"]) == 0
+        output = capsys.readouterr().out
+        assert "Via daemon" in output
+        assert "Written directly" in output
+
+        assert forward_command(config_file_path, ["modify", "99", "priority:1"]) == 2
+        assert "Invalid identifier" in capsys.readouterr().err
+
+        # The configuration is read anew after it changed
+        with open(config_file_path, 'a') as config_file:
+            config_file.write("reports:\n  mine:\n    columns: id,summary\n    constraint: summary.contains:Via\n")
+        assert forward_command(config_file_path, ["report", "mine"]) == 0
+        output = capsys.readouterr().out
+        assert "Via daemon" in output
+        assert "Written directly" not in output
+
+        assert "2 todos" in send_request(socket_path, {'control' : 'status'})['stdout']
+    finally:
+        send_request(socket_path, {'control' : 'stop'})
+        thread.join()
+
+    assert not os.path.exists(socket_path)
+    assert forward_command(config_file_path, ["report"]) is None
+
+    remove_dummy_calendars(tmp_dir, config_file_path)
+
+def test_paged_report_runs_locally(monkeypatch):
+
+    tmp_dir, config_file_path = setup_dummy_calendars(["test"])
+    with open(config_file_path, 'a') as config_file:
+        config_file.write("reports:\n  default:\n    columns: id,summary\n")
+
+    # The pager needs the terminal of the client, so that
+    # paged reports are not forwarded to a daemon.
+    forwarded = []
+    monkeypatch.setattr("icalwarrior.daemon.forward_command", lambda path, args: forwarded.append(args) or 0)
+    paged = []
+    monkeypatch.setattr("click.echo_via_pager", lambda text: paged.append(text))
+
+    for args in (["report", "--page"], ["report"]):
+        monkeypatch.setattr("sys.argv", ["todo", "-c", config_file_path] + args)
+        with pytest.raises(SystemExit) as err:
+            main()
+        assert err.value.code == 0
+
+    assert forwarded == [["report"]]
+    assert len(paged) == 1
+
+    remove_dummy_calendars(tmp_dir, config_file_path)
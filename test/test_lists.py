@@ -2,11 +2,19 @@
 #
 # SPDX-License-Identifier: GPL-3.0-or-later
 
+import os
+import datetime
+import threading
 import pytest
 
-from icalwarrior.model.lists import TodoDatabase, TodoDatabaseAccessError
+from icalwarrior.model.lists import TodoDatabase, TodoList, TodoDatabaseAccessError, WriteConflictError
+from icalwarrior.model.locking import ListLock, ListLockedError
+from icalwarrior.model.storage import MemoryStorage, VdirStorage, BACKENDS, create_storage
 from icalwarrior.model.items import TodoModel
+from icalwarrior.model.journal import ChangeJournal, UnknownGenerationError
+from icalwarrior.model.statistics import TodoAggregator, UnknownGroupError
 from icalwarrior.configuration import Configuration
+import icalwarrior.constants as constants
 from icalwarrior.filtering.constraints import InvalidFilterExpressionError
 from icalwarrior.filtering.constraints import ConstraintEvaluator
 from util import setup_dummy_calendars, remove_dummy_calendars
@@ -127,3 +135,521 @@ def test_nonexistent_lists_dir():
     with pytest.raises(TodoDatabaseAccessError):
         cal_db = TodoDatabase(config)
 
+
+def test_aggregation():
+
+    tmp_dir, config_file_path = setup_dummy_calendars(["test1", "test2", "empty"])
+
+    config = Configuration(config_file_path)
+    cal_db = TodoDatabase(config)
+
+    today = datetime.date.today()
+    specs = [
+        ("test1", {'status': 'needs-action', 'priority': 1, 'categories': ['a', 'b'], 'due': today - datetime.timedelta(days=1)}),
+        ("test1", {'status': 'completed', 'due': today}),
+        ("test1", {'status': 'needs-action', 'due': today + datetime.timedelta(days=30)}),
+        ("test2", {'status': 'needs-action', 'categories': ['a']})]
+
+    for list_name, properties in specs:
+        todo = TodoModel(config, cal_db.create_todo())
+        properties['summary'] = 'Test'
+        todo.set_properties(properties)
+        cal_db.add_todos(list_name, [todo])
+
+    aggregator = TodoAggregator(cal_db)
+
+    assert aggregator.aggregate([]) == {("empty",): 0, ("test1",): 3, ("test2",): 1}
+
+    counts = aggregator.aggregate(['status'])
+    assert counts == {("test1", "needs-action"): 2, ("test1", "completed"): 1, ("test2", "needs-action"): 1}
+    assert aggregator.aggregate(['status']) is counts
+
+    counts = aggregator.aggregate(['category', 'priority'])
+    assert counts[("test1", "a", "1")] == 1
+    assert counts[("test1", "b", "1")] == 1
+    assert counts[("test1", "none", "none")] == 2
+    assert counts[("test2", "a", "none")] == 1
+
+    counts = aggregator.aggregate(['due'])
+    assert counts[("test1", "overdue")] == 1
+    assert counts[("test1", "today")] == 1
+    assert counts[("test1", "later")] == 1
+    assert counts[("test2", "none")] == 1
+
+    # Changes to the database invalidate cached results
+    todo = TodoModel(config, cal_db.create_todo())
+    todo.set_properties({'summary': 'Test'})
+    cal_db.add_todos("test2", [todo])
+    assert aggregator.aggregate(['status'])[("test2", "needs-action")] == 2
+
+    with pytest.raises(UnknownGroupError):
+        aggregator.aggregate(['unknown'])
+
+    remove_dummy_calendars(tmp_dir, config_file_path)
+
+def test_aggregator_of_database(monkeypatch):
+
+    tmp_dir, config_file_path = setup_dummy_calendars(["test1", "test2"])
+
+    config = Configuration(config_file_path)
+    cal_db = TodoDatabase(config)
+
+    todo = TodoModel(config, cal_db.create_todo())
+    todo.set_properties({'summary': 'Test'})
+    cal_db.add_todos("test1", [todo])
+
+    scanned = []
+    iter_todos = TodoList.iter_todos
+    def count_scans(todo_list, *args):
+        scanned.append(todo_list.name)
+        return iter_todos(todo_list, *args)
+    monkeypatch.setattr(TodoList, "iter_todos", count_scans)
+
+    assert cal_db.get_aggregator() is cal_db.get_aggregator()
+
+    status_counts = cal_db.get_aggregator().aggregate(['status'])
+    assert scanned == ["test1", "test2"]
+
+    # Counts of the same generation are reused for any groups
+    cal_db.get_aggregator().aggregate(['priority'])
+    assert cal_db.get_aggregator().aggregate(['status']) is status_counts
+    assert cal_db.get_aggregator().aggregate(['priority'])[("test1", "none")] == 1
+    assert len(scanned) == 4
+
+    todo = TodoModel(config, cal_db.create_todo())
+    todo.set_properties({'summary': 'Test'})
+    cal_db.add_todos("test2", [todo])
+    assert cal_db.get_aggregator().aggregate(['status'])[("test2", "needs-action")] == 1
+    assert len(scanned) == 6
+
+    remove_dummy_calendars(tmp_dir, config_file_path)
+
+def test_refresh_with_stable_ids():
+
+    tmp_dir, config_file_path = setup_dummy_calendars(["test"])
+
+    config = Configuration(config_file_path)
+    cal_db = TodoDatabase(config)
+    todos = []
+    for summary in ["first", "second", "third"]:
+        todo = TodoModel(config, cal_db.create_todo())
+        todo.set_properties({'summary': summary})
+        todos.append(todo)
+    cal_db.add_todos("test", todos)
+
+    cal_db = TodoDatabase(config, stable_ids=True)
+    ids = {todo.get_string('summary') : todo.get_context('id') for todo in cal_db.get_todos()}
+    assert not cal_db.refresh()
+
+    # Changes made through another database are picked up by refreshing
+    other_db = TodoDatabase(config)
+    first = [todo for todo in other_db.get_todos() if todo.get_string('summary') == "first"][0]
+    other_db.get_list("test").delete(first.get_ical_todo())
+    second = [todo for todo in other_db.get_todos() if todo.get_string('summary') == "second"][0]
+    second.set_properties({'summary': "changed"})
+    other_db.get_list("test").add(second.get_ical_todo())
+    new_todo = TodoModel(config, other_db.create_todo())
+    new_todo.set_properties({'summary': "fourth"})
+    other_db.add_todos("test", [new_todo])
+    os.mkdir(os.path.join(tmp_dir.name, "other"))
+
+    assert cal_db.refresh()
+    assert cal_db.get_list_names() == ["other", "test"]
+    refreshed = {todo.get_string('summary') : todo.get_context('id') for todo in cal_db.get_todos()}
+
+    # IDs of remaining todos do not change and new todos get unused IDs
+    assert refreshed["changed"] == ids["second"]
+    assert refreshed["third"] == ids["third"]
+    assert "first" not in refreshed
+    assert refreshed["fourth"] == 4
+
+    remove_dummy_calendars(tmp_dir, config_file_path)
+
+def test_snapshots():
+
+    tmp_dir, config_file_path = setup_dummy_calendars(["home", "work"])
+
+    config = Configuration(config_file_path)
+    cal_db = TodoDatabase(config)
+    todos = []
+    for summary in ["first", "second"]:
+        todo = TodoModel(config, cal_db.create_todo())
+        todo.set_properties({'summary': summary})
+        todos.append(todo)
+    cal_db.add_todos("home", todos)
+
+    first = cal_db.snapshot()
+    assert cal_db.snapshot() is first
+    assert [todo.get_string('summary') for todo in first.get_todos()] == [todo.get_string('summary') for todo in cal_db.get_todos()]
+
+    # Changes made within a write block are published at its end
+    with cal_db.write():
+        changed = cal_db.get_todos()[0]
+        changed.set_properties({'summary': "changed"})
+        cal_db.get_list("home").add(changed.get_ical_todo())
+        assert cal_db.snapshot() is first
+
+    second = cal_db.snapshot()
+    assert second.get_generation() > first.get_generation()
+    assert "changed" not in [todo.get_string('summary') for todo in first.get_todos()]
+    assert "changed" in [todo.get_string('summary') for todo in second.get_todos()]
+
+    # Copies of unchanged lists and todos are shared between snapshots
+    assert second.get_list_todos("work") is first.get_list_todos("work")
+    unchanged = [todo for todo in second.get_todos() if todo.get_string('uid') != changed.get_string('uid')][0]
+    assert unchanged in first.get_todos()
+
+    remove_dummy_calendars(tmp_dir, config_file_path)
+
+def test_snapshots_with_concurrent_writer():
+
+    tmp_dir, config_file_path = setup_dummy_calendars(["test"])
+
+    config = Configuration(config_file_path)
+    cal_db = TodoDatabase(config)
+    cal_db.snapshot()
+
+    errors = []
+    done = threading.Event()
+
+    def read():
+        try:
+            previous = 0
+            while not done.is_set():
+                snapshot = cal_db.snapshot()
+                todos = snapshot.get_todos()
+                # Each snapshot is consistent and snapshots never go back in time
+                assert len(todos) >= previous
+                assert sorted(todo.get_context('id') for todo in todos) == list(range(1, len(todos) + 1))
+                previous = len(todos)
+        except Exception as err:
+            errors.append(err)
+
+    readers = [threading.Thread(target=read) for _ in range(4)]
+    for reader in readers:
+        reader.start()
+
+    def write(index):
+        for number in range(10):
+            todo = TodoModel(config, cal_db.create_todo())
+            todo.set_properties({'summary': "todo " + str(index) + "." + str(number)})
+            cal_db.add_todos("test", [todo])
+
+    writers = [threading.Thread(target=write, args=(index, )) for index in range(2)]
+    for writer in writers:
+        writer.start()
+    for writer in writers:
+        writer.join()
+
+    done.set()
+    for reader in readers:
+        reader.join()
+
+    assert errors == []
+    assert len(cal_db.snapshot().get_todos()) == 20
+    assert len(TodoDatabase(config).get_todos()) == 20
+
+    remove_dummy_calendars(tmp_dir, config_file_path)
+
+def test_write_conflicts():
+
+    tmp_dir, config_file_path = setup_dummy_calendars(["test"])
+
+    config = Configuration(config_file_path)
+    cal_db = TodoDatabase(config)
+    todos = []
+    for summary in ["first", "second"]:
+        todo = TodoModel(config, cal_db.create_todo())
+        todo.set_properties({'summary': summary})
+        todos.append(todo)
+    cal_db.add_todos("test", todos)
+
+    cal_db = TodoDatabase(config)
+    first, second = sorted(cal_db.get_todos(), key=lambda todo: todo.get_string('summary'))
+
+    # Touching a file without changing its content is no conflict
+    first_path = os.path.join(tmp_dir.name, "test", first.get_string('uid') + ".ics")
+    os.utime(first_path, ns=(0, 0))
+    first.set_properties({'summary': "first changed"})
+    cal_db.get_list("test").add(first.get_ical_todo())
+
+    # Todos changed through another database are not overwritten
+    other_db = TodoDatabase(config)
+    other_second = [todo for todo in other_db.get_todos() if todo.get_string('summary') == "second"][0]
+    other_second.set_properties({'summary': "second changed elsewhere"})
+    other_db.get_list("test").add(other_second.get_ical_todo())
+
+    first.set_properties({'summary': "first changed again"})
+    second.set_properties({'summary': "second changed"})
+    cal_db.begin()
+    cal_db.get_list("test").add(first.get_ical_todo())
+    cal_db.get_list("test").add(second.get_ical_todo())
+    with pytest.raises(WriteConflictError) as err:
+        cal_db.commit()
+    assert err.value.uids == [second.get_string('uid')]
+
+    summaries = sorted(todo.get_string('summary') for todo in TodoDatabase(config).get_todos())
+    assert summaries == ["first changed again", "second changed elsewhere"]
+
+    # Refreshing reads the todos changed elsewhere, which can be changed then
+    cal_db.refresh()
+    second = [todo for todo in cal_db.get_todos() if todo.get_string('uid') == second.get_string('uid')][0]
+    cal_db.get_list("test").delete(second.get_ical_todo())
+    assert len(TodoDatabase(config).get_todos()) == 1
+
+    remove_dummy_calendars(tmp_dir, config_file_path)
+
+def test_write_conflicts_in_several_lists():
+
+    tmp_dir, config_file_path = setup_dummy_calendars(["a", "b"])
+
+    config = Configuration(config_file_path)
+    cal_db = TodoDatabase(config)
+    for list_name in ["a", "b"]:
+        todo = TodoModel(config, cal_db.create_todo())
+        todo.set_properties({'summary': list_name})
+        cal_db.add_todos(list_name, [todo])
+
+    cal_db = TodoDatabase(config)
+    todo_a = cal_db.get_list("a").get_todos()[0]
+    todo_b = cal_db.get_list("b").get_todos()[0]
+
+    other_db = TodoDatabase(config)
+    other_a = other_db.get_list("a").get_todos()[0]
+    other_a.set_properties({'summary': "a changed elsewhere"})
+    other_db.get_list("a").add(other_a.get_ical_todo())
+
+    # A conflict in one list does not keep the changes of other lists from being stored
+    cal_db.begin()
+    todo_a.set_properties({'summary': "a changed"})
+    cal_db.get_list("a").add(todo_a.get_ical_todo())
+    todo_b.set_properties({'summary': "b changed"})
+    cal_db.get_list("b").add(todo_b.get_ical_todo())
+    with pytest.raises(WriteConflictError) as err:
+        cal_db.commit()
+    assert err.value.conflicts == {"a" : [todo_a.get_string('uid')]}
+
+    summaries = sorted(todo.get_string('summary') for todo in TodoDatabase(config).get_todos())
+    assert summaries == ["a changed elsewhere", "b changed"]
+
+    remove_dummy_calendars(tmp_dir, config_file_path)
+
+def test_list_lock():
+
+    tmp_dir, config_file_path = setup_dummy_calendars(["test"])
+
+    config = Configuration(config_file_path)
+    cal_db = TodoDatabase(config)
+    todo = TodoModel(config, cal_db.create_todo())
+    todo.set_properties({'summary': "test"})
+
+    # Writing waits for other processes holding the lock
+    holder_started = threading.Event()
+    release_holder = threading.Event()
+    def hold_lock():
+        with ListLock(config, "test"):
+            holder_started.set()
+            release_holder.wait()
+
+    holder = threading.Thread(target=hold_lock)
+    holder.start()
+    holder_started.wait()
+
+    with pytest.raises(ListLockedError):
+        with ListLock(config, "test", timeout=0.1):
+            pass
+
+    # Reading does not require the lock
+    assert len(TodoDatabase(config).get_todos()) == 0
+
+    release_holder.set()
+    holder.join()
+
+    with cal_db.get_list("test").locked():
+        cal_db.add_todos("test", [todo])
+    assert len(TodoDatabase(config).get_todos()) == 1
+
+    remove_dummy_calendars(tmp_dir, config_file_path)
+
+def test_concurrent_reading():
+
+    tmp_dir, config_file_path = setup_dummy_calendars(["home", "work"])
+
+    config = Configuration(config_file_path)
+    cal_db = TodoDatabase(config)
+    for list_name in ["home", "work"]:
+        todos = []
+        for index in range(10):
+            todo = TodoModel(config, cal_db.create_todo())
+            todo.set_properties({'summary': list_name + str(index)})
+            todos.append(todo)
+        cal_db.add_todos(list_name, todos)
+
+    def get_summaries(cal_db):
+        return [(todo.get_context('id'), todo.get_context('list'), todo.get_string('summary')) for todo in cal_db.get_todos()]
+
+    expected = get_summaries(TodoDatabase(config))
+
+    with open(config_file_path, 'a') as config_file:
+        config_file.write("read_concurrency: 4\n")
+    config = Configuration(config_file_path)
+    assert config.get_read_concurrency() == 4
+
+    cal_db = TodoDatabase(config, stable_ids=True)
+    assert get_summaries(cal_db) == expected
+
+    other_db = TodoDatabase(config)
+    for todo in other_db.get_list("work").get_todos()[0:3]:
+        todo.set_properties({'summary': "changed"})
+        other_db.get_list("work").add(todo.get_ical_todo())
+
+    assert cal_db.refresh()
+    assert get_summaries(cal_db) == get_summaries(TodoDatabase(config, stable_ids=True))
+
+    remove_dummy_calendars(tmp_dir, config_file_path)
+
+def test_load_cache(monkeypatch):
+
+    tmp_dir, config_file_path = setup_dummy_calendars(["home", "work"])
+    with open(config_file_path, 'a') as config_file:
+        config_file.write("load_cache: trust\n")
+
+    config = Configuration(config_file_path)
+    cal_db = TodoDatabase(config)
+    for list_name in ["home", "work"]:
+        todo = TodoModel(config, cal_db.create_todo())
+        todo.set_properties({'summary': list_name})
+        cal_db.add_todos(list_name, [todo])
+
+    def get_summaries(cal_db):
+        return [(todo.get_context('id'), todo.get_context('list'), todo.get_string('summary')) for todo in cal_db.get_todos()]
+
+    expected = get_summaries(cal_db)
+    assert get_summaries(TodoDatabase(config)) == expected
+
+    # Unchanged lists are neither listed nor read again
+    def fail(*args):
+        raise AssertionError("Unexpected access of the todo lists")
+
+    with monkeypatch.context() as patch:
+        patch.setattr("os.scandir", fail)
+        patch.setattr("os.listdir", fail)
+        patch.setattr("icalwarrior.model.loader.read_file", fail)
+        cal_db = TodoDatabase(config)
+        assert get_summaries(cal_db) == expected
+
+    # Changed files are read again
+    work_todo = cal_db.get_list("work").get_todos()[0]
+    work_todo.set_properties({'summary': "changed"})
+    cal_db.get_list("work").add(work_todo.get_ical_todo())
+    expected = get_summaries(cal_db)
+    assert get_summaries(TodoDatabase(config)) == expected
+
+    # Files modified in place are only noticed if the cache is verified
+    home_path = os.path.join(tmp_dir.name, "home", cal_db.get_list("home").get_todos()[0].get_string('uid') + ".ics")
+    with open(home_path, 'rb') as home_file:
+        content = home_file.read()
+    with open(home_path, 'wb') as home_file:
+        home_file.write(content.replace(b"SUMMARY:home", b"SUMMARY:in place"))
+
+    assert "in place" not in [summary for _, _, summary in get_summaries(TodoDatabase(config))]
+    with open(config_file_path, 'a') as config_file:
+        config_file.write("load_cache: verify\n")
+    config = Configuration(config_file_path)
+    assert "in place" in [summary for _, _, summary in get_summaries(TodoDatabase(config))]
+
+    remove_dummy_calendars(tmp_dir, config_file_path)
+
+def test_memory_storage():
+
+    tmp_dir, config_file_path = setup_dummy_calendars([])
+
+    config = Configuration(config_file_path)
+    storage = MemoryStorage(config)
+    cal_db = TodoDatabase(config, storage=storage)
+    cal_db.add_list("test")
+    todos = []
+    for summary in ["first", "second"]:
+        todo = TodoModel(config, cal_db.create_todo())
+        todo.set_properties({'summary': summary})
+        todos.append(todo)
+    cal_db.add_todos("test", todos)
+    cal_db.refresh()
+
+    # Nothing is written to the lists or the state directory
+    assert os.listdir(tmp_dir.name) == []
+    assert not os.path.exists(tmp_dir.name + ".state")
+    assert len(TodoDatabase(config).get_todos()) == 0
+
+    other_db = TodoDatabase(config, storage=storage)
+    assert sorted(todo.get_string('summary') for todo in other_db.get_todos()) == ["first", "second"]
+    first, second = sorted(other_db.get_todos(), key=lambda todo: todo.get_string('summary'))
+    second.set_properties({'summary': "second changed elsewhere"})
+    other_db.get_list("test").add(second.get_ical_todo())
+    other_db.get_list("test").delete(first.get_ical_todo())
+
+    # Changes are detected through the versions of the items
+    second = [todo for todo in cal_db.get_todos() if todo.get_string('uid') == second.get_string('uid')][0]
+    second.set_properties({'summary': "second changed"})
+    with pytest.raises(WriteConflictError):
+        cal_db.get_list("test").add(second.get_ical_todo())
+
+    assert cal_db.refresh()
+    assert [todo.get_string('summary') for todo in cal_db.get_todos()] == ["second changed elsewhere"]
+
+    cal_db.delete_list("test")
+    assert storage.list_names() == []
+
+    remove_dummy_calendars(tmp_dir, config_file_path)
+
+def test_storage_backends():
+
+    tmp_dir, config_file_path = setup_dummy_calendars([])
+    config = Configuration(config_file_path)
+
+    # Only the backends listed in the constants can be selected
+    assert sorted(BACKENDS.keys()) == sorted(constants.STORAGE_BACKENDS)
+    assert MemoryStorage.NAME not in BACKENDS
+    assert isinstance(create_storage(config), VdirStorage)
+
+    remove_dummy_calendars(tmp_dir, config_file_path)
+
+def test_journal_generations(monkeypatch):
+
+    tmp_dir, config_file_path = setup_dummy_calendars(["test"])
+    config = Configuration(config_file_path)
+
+    # Writers appending at the same time get distinct generations
+    def record_changes(list_name):
+        journal = ChangeJournal(config)
+        for index in range(50):
+            journal.record(ChangeJournal.WRITE, list_name, str(index))
+
+    writers = [threading.Thread(target=record_changes, args=("list" + str(index),)) for index in range(4)]
+    for writer in writers:
+        writer.start()
+    for writer in writers:
+        writer.join()
+
+    # Entries spanning several blocks are read backwards completely
+    monkeypatch.setattr(ChangeJournal, "BLOCK_SIZE", 100)
+    journal = ChangeJournal(config)
+    assert journal.get_generation() == 200
+    assert [entry['generation'] for entry in journal.get_entries_since_generation(0)] == list(range(1, 201))
+    assert [entry['generation'] for entry in journal.get_entries_since_generation(190)] == list(range(191, 201))
+    assert journal.get_time_of_generation(100) == journal.get_entries()[99]['time']
+    assert journal.get_time_of_generation(0) == 0.0
+
+    with pytest.raises(UnknownGenerationError):
+        journal.get_time_of_generation(201)
+
+    # Generations missing from the journal are not treated as the beginning
+    with open(journal.path, 'r') as journal_file:
+        lines = journal_file.readlines()
+    with open(journal.path, 'w') as journal_file:
+        journal_file.writelines(lines[100:])
+    assert journal.get_time_of_generation(101) == journal.get_entries()[0]['time']
+    with pytest.raises(UnknownGenerationError):
+        journal.get_time_of_generation(50)
+
+    remove_dummy_calendars(tmp_dir, config_file_path)
@@ -0,0 +1,129 @@
+# SPDX-FileCopyrightText: 2022 Martin Byrenheid <martin@byrenheid.net>
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import json
+import threading
+import urllib.error
+import urllib.request
+import pytest
+
+from icalwarrior.server import QueryAPI, QueryServer, parse_address, InvalidAddressError
+from icalwarrior.model.lists import TodoDatabase, TodoList
+from icalwarrior.model.items import TodoModel
+from icalwarrior.configuration import Configuration
+from util import setup_dummy_calendars, remove_dummy_calendars
+
+def add_todo(config, list_name, properties):
+
+    cal_db = TodoDatabase(config)
+    todo = TodoModel(config, cal_db.create_todo())
+    todo.set_properties(properties)
+    cal_db.get_list(list_name).add(todo.get_ical_todo())
+
+def get(url, etag=None):
+
+    request = urllib.request.Request(url)
+    if etag is not None:
+        request.add_header('If-None-Match', etag)
+
+    try:
+        with urllib.request.urlopen(request) as response:
+            return (response.status, json.loads(response.read()), response.headers.get('ETag'))
+    except urllib.error.HTTPError as err:
+        body = err.read()
+        return (err.code, json.loads(body) if len(body) > 0 else None, err.headers.get('ETag'))
+
+def test_parse_address():
+
+    assert parse_address("127.0.0.1:8080") == ("127.0.0.1", 8080)
+    assert parse_address(":8080") == ("127.0.0.1", 8080)
+    with pytest.raises(InvalidAddressError):
+        parse_address("localhost")
+
+def test_query_server():
+
+    tmp_dir, config_file_path = setup_dummy_calendars(["home", "work"])
+    with open(config_file_path, 'a') as config_file:
+        config_file.write("reports:\n  open:\n    columns: summary,list\n    constraint: status.not_equals:completed\n    sort: summary\n")
+
+    config = Configuration(config_file_path)
+    add_todo(config, "home", {'summary': 'Clean', 'status': 'needs-action'})
+    add_todo(config, "work", {'summary': 'Write', 'status': 'completed'})
+
+    server = QueryServer(config, ("127.0.0.1", 0))
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    base_url = "http://127.0.0.1:" + str(server.server_address[1])
+
+    try:
+        status, todos, etag = get(base_url + "/todos?fields=summary,list&q=list:work")
+        assert status == 200
+        assert todos == [{'summary': 'Write', 'list': 'work'}]
+
+        status, report, _ = get(base_url + "/reports/op")
+        assert status == 200
+        assert report['name'] == "open"
+        assert report['total'] == 1
+        assert report['todos'][0]['summary'] == "Clean"
+        assert set(report['todos'][0].keys()) == {'id', 'summary', 'list'}
+
+        status, stats, _ = get(base_url + "/stats?group_by=status")
+        assert status == 200
+        assert {'list': 'work', 'status': 'completed', 'count': 1} in stats
+
+        # Unchanged todos are not sent again
+        status, body, new_etag = get(base_url + "/todos?q=list:work&fields=summary,list", etag)
+        assert status == 304
+        assert body is None
+        assert new_etag == etag
+
+        # ETags only apply to the same endpoint and query
+        assert get(base_url + "/todos", etag)[0] == 200
+        assert get(base_url + "/todos?fields=summary,list&q=list:home", etag)[0] == 200
+        assert get(base_url + "/stats", etag)[0] == 200
+        assert get(base_url + "/unknown", etag)[0] == 404
+        assert get(base_url + "/unknown", "*")[0] == 404
+        assert get(base_url + "/reports/unknown", "*")[0] == 404
+
+        status, _, etag = get(base_url + "/todos")
+        add_todo(config, "home", {'summary': 'Cook', 'status': 'needs-action'})
+        status, todos, new_etag = get(base_url + "/todos", etag)
+        assert status == 200
+        assert len(todos) == 3
+        assert new_etag != etag
+
+        status, stats, _ = get(base_url + "/stats?group_by=status")
+        assert {'list': 'home', 'status': 'needs-action', 'count': 2} in stats
+
+        assert get(base_url + "/reports/unknown")[0] == 404
+        assert get(base_url + "/unknown")[0] == 404
+        assert get(base_url + "/todos?fields=unknown")[0] == 400
+        assert get(base_url + "/stats?group_by=unknown")[0] == 400
+    finally:
+        server.shutdown()
+        server.server_close()
+        thread.join()
+
+    remove_dummy_calendars(tmp_dir, config_file_path)
+
+def test_query_stats_reuses_counts(monkeypatch):
+
+    tmp_dir, config_file_path = setup_dummy_calendars(["home"])
+    config = Configuration(config_file_path)
+    add_todo(config, "home", {'summary': 'Clean', 'status': 'needs-action'})
+
+    api = QueryAPI(config)
+
+    scanned = []
+    iter_todos = TodoList.iter_todos
+    def count_scans(todo_list, *args):
+        scanned.append(todo_list.name)
+        return iter_todos(todo_list, *args)
+    monkeypatch.setattr(TodoList, "iter_todos", count_scans)
+
+    first = api.query_stats({'group_by' : ['status']})
+    assert api.query_stats({'group_by' : ['status']}) == first
+    assert scanned == ["home"]
+
+    remove_dummy_calendars(tmp_dir, config_file_path)
@@ -3,11 +3,20 @@
 # SPDX-License-Identifier: GPL-3.0-or-later
 
 from typing import List
+import datetime
+import io
+import pytest
+import dateutil.tz as tz
+from colorama import Fore
 
 from icalwarrior.model.items import TodoModel
 from icalwarrior.model.lists import TodoDatabase
-from icalwarrior.view.tabular import TabularToDoView
+from icalwarrior.view.tabular import TabularToDoView, TabularToDoListView, TabularPrinter
+from icalwarrior.view.screen import OutputBuffer, ScreenUpdater
+from icalwarrior.view.renderer import TableRenderer, WrapMode, ROW_OPT_TEXT_COLOR, truncate, text_width
 from icalwarrior.view.formatter import StringFormatter
+from icalwarrior.view.tagger import DueDateBasedTagger
+from icalwarrior.view.sorter import ToDoSorter, UnsupportedSortKeyError, InvalidMissingValuePlacementError, InvalidCursorError
 from icalwarrior.configuration import Configuration
 
 from util import setup_dummy_calendars
@@ -70,3 +79,270 @@ def test_tabular_todo_view(capsys):
 
     out = capsys.readouterr()
     assert "Test ToDo" in out.out
+
+def test_report_view_caches_rows(capsys):
+
+    tmp_dir, config_file_path = setup_dummy_calendars(["test"])
+    with open(config_file_path, 'a') as config_file:
+        config_file.write("reports:\n  default:\n    columns: summary\n")
+    config = Configuration(config_file_path)
+    cal_db = TodoDatabase(config)
+
+    todo = TodoModel(config, cal_db.create_todo())
+    todo.set_properties({'summary': 'Cached'})
+    todo.set_context('id', 1)
+
+    tagger = DueDateBasedTagger(datetime.timedelta(days=1), datetime.timedelta(days=1))
+    view = TabularToDoListView(config, "default", [todo], StringFormatter(config), tagger)
+    view.show()
+    assert "Cached" in capsys.readouterr().out
+
+    # Unchanged todos are shown from the cache, changed ones are formatted anew
+    cache_key = "row:default:" + config.get_digest()
+    stamp, row, options = todo.cache[cache_key]
+    todo.cache[cache_key] = (stamp, ["1", "From cache"], options)
+    view.show()
+    assert "From cache" in capsys.readouterr().out
+
+    # Rows are formatted anew once the configuration changed
+    with open(config_file_path, 'a') as config_file:
+        config_file.write("    max_column_width: 20\n")
+    reloaded = Configuration(config_file_path)
+    assert reloaded.get_digest() != config.get_digest()
+    TabularToDoListView(reloaded, "default", [todo], StringFormatter(reloaded), tagger).show()
+    assert "Cached" in capsys.readouterr().out
+
+    todo.set_properties({'summary': 'Changed'})
+    view.show()
+    assert "Changed" in capsys.readouterr().out
+
+def test_sorter_limit():
+
+    tmp_dir, config_file_path = setup_dummy_calendars(["test"])
+    config = Configuration(config_file_path)
+    cal_db = TodoDatabase(config)
+
+    todos = []
+    for day in [5, 3, 9, 1, 7, 3]:
+        todo = TodoModel(config, cal_db.create_todo())
+        todo.set_properties({
+            'summary': 'Day ' + str(day),
+            'due': datetime.datetime(2022, 1, day)})
+        todos.append(todo)
+
+    full = ToDoSorter(todos, "due").get_sorted()
+    assert [t.get_string('summary') for t in full] == ['Day 1', 'Day 3', 'Day 3', 'Day 5', 'Day 7', 'Day 9']
+    # Equal keys are ordered by UID
+    assert full[1].get_string('uid') < full[2].get_string('uid')
+
+    top = ToDoSorter(todos, "due", 3).get_sorted()
+    assert top == full[0:3]
+
+    assert ToDoSorter(todos, "due", 10).get_sorted() == full
+
+    # The same todo stored in two lists, e.g., by a sync tool
+    copies = []
+    for list_name in ["work", "home"]:
+        copy = TodoModel(config, todos[0].get_ical_todo())
+        copy.set_context('list', list_name)
+        copies.append(copy)
+    assert ToDoSorter(copies + todos, "due").get_sorted()[3:6] == [todos[0], copies[1], copies[0]]
+    assert ToDoSorter(copies + copies, "due", 3).get_sorted() == [copies[1], copies[1], copies[0]]
+
+def test_sorter_multiple_keys():
+
+    tmp_dir, config_file_path = setup_dummy_calendars(["test"])
+    config = Configuration(config_file_path)
+    cal_db = TodoDatabase(config)
+
+    todos = []
+    for summary, priority, day in [("b", 1, 5), ("a", 1, None), ("c", 5, 2), ("d", 1, 3)]:
+        todo = TodoModel(config, cal_db.create_todo())
+        properties = {'summary': summary, 'priority': priority}
+        if day is not None:
+            properties['due'] = datetime.datetime(2022, 1, day)
+        todo.set_properties(properties)
+        todos.append(todo)
+
+    def summaries(sorted_todos):
+        return [t.get_string('summary') for t in sorted_todos]
+
+    assert summaries(ToDoSorter(todos, "due").get_sorted()) == ['c', 'd', 'b', 'a']
+    assert summaries(ToDoSorter(todos, "due", missing="first").get_sorted()) == ['a', 'c', 'd', 'b']
+    assert summaries(ToDoSorter(todos, "priority-,due+,summary").get_sorted()) == ['c', 'd', 'b', 'a']
+    assert summaries(ToDoSorter(todos, "prio+,summ-").get_sorted()) == ['d', 'b', 'a', 'c']
+    assert summaries(ToDoSorter(todos, "prio+,summ-", 2).get_sorted()) == ['d', 'b']
+
+    # Changing a property invalidates the sort key kept with the todo
+    todos[0].set_properties({'priority': 9})
+    assert summaries(ToDoSorter(todos, "prio+,summ-").get_sorted()) == ['d', 'a', 'c', 'b']
+
+    with pytest.raises(UnsupportedSortKeyError):
+        ToDoSorter(todos, "categories")
+
+    with pytest.raises(InvalidMissingValuePlacementError):
+        ToDoSorter(todos, "due", missing="middle")
+
+def test_truncate_wide_characters():
+
+    assert truncate("short", 10) == "short"
+    assert truncate("truncated text", 6) == "trunc…"
+    assert text_width("日本語") == 6
+    assert truncate("日本語テキスト", 6) == "日本…"
+    assert text_width(truncate("日本語テキスト", 6)) <= 6
+
+def test_table_renderer():
+
+    rows = [["1", "A rather long summary"], ["2", "Short"]]
+    options = [{ROW_OPT_TEXT_COLOR: "<red>"}, {ROW_OPT_TEXT_COLOR: "<green>"}]
+
+    output = io.StringIO()
+    renderer = TableRenderer(rows, ["Id", "Summary"], 10, WrapMode.TRUNCATE_END, options, output)
+    renderer.render()
+
+    lines = output.getvalue().splitlines()
+    assert len(lines) == 4
+    assert "A rather …" in lines[2]
+    assert "<red>" in lines[2]
+    assert "<green>" in lines[3]
+
+    output = io.StringIO()
+    renderer = TableRenderer([["1", "two words"]], ["Id", "Text"], 5, WrapMode.WRAP, None, output)
+    renderer.render()
+    lines = output.getvalue().splitlines()
+    assert len(lines) == 4
+    assert "two w" in lines[2]
+    assert "ords" in lines[3]
+
+def test_screen_updater():
+
+    output = OutputBuffer(True)
+    screen = ScreenUpdater(output)
+
+    screen.update("Header\nfirst\nsecond\nthird\n")
+    assert output.getvalue().startswith("\x1b[2J\x1b[H")
+
+    # Only the changed line is redrawn and the left-over line is cleared
+    output.seek(0)
+    output.truncate()
+    screen.update("Header\nfirst\nchanged\n")
+    assert output.getvalue() == "\x1b[3;1Hchanged\x1b[K\x1b[4;1H\x1b[J"
+
+    # Frames are written in full if the output is not a terminal
+    output = OutputBuffer(False)
+    screen = ScreenUpdater(output)
+    screen.update("a\nb\n")
+    screen.update("a\nc\n")
+    assert output.getvalue() == "a\nb\n\na\nc\n"
+
+def test_tableformatter_fallback(capsys):
+
+    pytest.importorskip("tableformatter")
+
+    printer = TabularPrinter([["1", "Test ToDo"]], ["Id", "Summary"], 0, WrapMode.WRAP, [{ROW_OPT_TEXT_COLOR: Fore.RED}], "tableformatter")
+    printer.print()
+
+    out = capsys.readouterr()
+    assert "Test ToDo" in out.out
+
+def test_sorter_window_and_cursor():
+
+    tmp_dir, config_file_path = setup_dummy_calendars(["test"])
+    config = Configuration(config_file_path)
+    cal_db = TodoDatabase(config)
+
+    todos = []
+    for day in range(1, 11):
+        todo = TodoModel(config, cal_db.create_todo())
+        todo.set_properties({
+            'summary': 'Day ' + str(day),
+            'due': datetime.datetime(2022, 1, day)})
+        todos.append(todo)
+
+    full = ToDoSorter(todos, "due-").get_sorted()
+
+    sorter = ToDoSorter(todos, "due-", 3, offset=3)
+    assert sorter.get_sorted() == full[3:6]
+    assert sorter.remaining == 7
+
+    # Continuing after the cursor of the last todo yields the next page
+    cursor = sorter.get_cursor(full[5])
+    sorter = ToDoSorter(todos, "due-", 3, after=cursor)
+    assert sorter.get_sorted() == full[6:9]
+    assert sorter.remaining == 4
+
+    with pytest.raises(InvalidCursorError):
+        ToDoSorter(todos, "due-", 3, after="invalid").get_sorted()
+
+def test_formatter_caches_dates():
+
+    tmp_dir, config_file_path = setup_dummy_calendars(["test"])
+    config = Configuration(config_file_path)
+    cal_db = TodoDatabase(config)
+
+    todo = TodoModel(config, cal_db.create_todo())
+    todo.set_properties({
+        'summary': 'Test ToDo',
+        'due': datetime.datetime(2022, 1, 1, 12, 0)})
+    todo.set_context('id', 3)
+
+    reference_time = datetime.datetime(2022, 1, 1, 10, 0, 0)
+    formatter = StringFormatter(config, reference_time)
+
+    format_due = formatter.get_property_formatter('due')
+    assert formatter.get_property_formatter('due') is format_due
+    assert format_due(todo) == "2022-01-01T12:00 (2 hours from now)"
+    assert len(formatter.date_cache) == 1
+
+    assert formatter.format_property_value('summary', todo) == "Test ToDo"
+    assert formatter.format_property_value('id', todo) == "3"
+    assert formatter.format_property_value('priority', todo) == ""
+
+    # Cached values remain valid within the same minute
+    formatter.set_reference_time(reference_time + datetime.timedelta(seconds=20))
+    assert len(formatter.date_cache) == 1
+
+    formatter.set_reference_time(reference_time + datetime.timedelta(hours=3))
+    assert len(formatter.date_cache) == 0
+    assert format_due(todo) == "2022-01-01T12:00 (an hour ago)"
+
+def test_formatter_caches_dates_per_time_zone():
+
+    tmp_dir, config_file_path = setup_dummy_calendars(["test"])
+    config = Configuration(config_file_path)
+
+    reference_time = datetime.datetime(2024, 1, 1, 8, 0, tzinfo=tz.UTC)
+    formatter = StringFormatter(config, reference_time)
+
+    utc_due = datetime.datetime(2024, 1, 1, 10, 0, tzinfo=tz.UTC)
+    berlin_due = datetime.datetime(2024, 1, 1, 11, 0, tzinfo=tz.gettz("Europe/Berlin"))
+    assert utc_due == berlin_due
+
+    assert formatter.format_date(utc_due).startswith("2024-01-01T10:00 (")
+    assert formatter.format_date(berlin_due).startswith("2024-01-01T11:00 (")
+    assert len(formatter.date_cache) == 2
+
+def test_due_date_based_tagger():
+
+    tmp_dir, config_file_path = setup_dummy_calendars(["test"])
+    config = Configuration(config_file_path)
+    cal_db = TodoDatabase(config)
+
+    tagger = DueDateBasedTagger(datetime.timedelta(days=2), datetime.timedelta(days=3))
+
+    def tag_for_due(due):
+        todo = TodoModel(config, cal_db.create_todo())
+        properties = {'summary': 'Test'}
+        if due is not None:
+            properties['due'] = due
+        todo.set_properties(properties)
+        return tagger.tag(todo).get(ROW_OPT_TEXT_COLOR)
+
+    today = datetime.date.today()
+    assert tag_for_due(None) is None
+    assert tag_for_due(today + datetime.timedelta(days=5)) == Fore.GREEN
+    assert tag_for_due(today + datetime.timedelta(days=2)) == Fore.YELLOW
+    assert tag_for_due(today - datetime.timedelta(days=1)) == Fore.YELLOW
+    assert tag_for_due(today - datetime.timedelta(days=3)) == Fore.RED
+    assert tag_for_due(datetime.datetime.now() - datetime.timedelta(days=3)) == Fore.RED
+    assert tag_for_due(datetime.datetime.now(tz.gettz()) + datetime.timedelta(days=4)) == Fore.GREEN
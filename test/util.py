@@ -4,6 +4,7 @@
 
 import os
 import os.path
+from shutil import rmtree
 from tempfile import NamedTemporaryFile, TemporaryDirectory, gettempdir
 
 def setup_dummy_calendars(calendars):
@@ -19,6 +20,7 @@ def setup_dummy_calendars(calendars):
     config_file_path = os.path.join(gettempdir(), config_file.name)
 
     config_file.write(("lists_dir: " + tmp_dir.name + "\n").encode("utf-8"))
+    config_file.write(("state_dir: " + tmp_dir.name + ".state" + "\n").encode("utf-8"))
     config_file.write(("show_columns: uid,summary,created,categories,description\n").encode("utf-8"))
     config_file.close()
 
@@ -30,3 +32,4 @@ def remove_dummy_calendars(tmp_dir, config_file_path):
 
     # Delete temporary directory
     tmp_dir.cleanup()
+    rmtree(tmp_dir.name + ".state", ignore_errors=True)